@@ -0,0 +1,80 @@
+"""
+app/admin.py
+Администрирование: список админов и снимок статистики для /stats
+
+Снимок пересчитывает фоновая задача JobQueue, команда отдает его из памяти,
+поэтому запрос статистики никогда не ходит в БД из обработчика.
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+from telegram.ext import ContextTypes
+
+from app.database import get_stats
+
+logger = logging.getLogger(__name__)
+
+# Telegram user_id администраторов через запятую
+ADMIN_USER_IDS = frozenset(
+    int(user_id) for user_id in os.getenv('ADMIN_USER_IDS', '').replace(' ', '').split(',') if user_id
+)
+
+# Период пересчета снимка статистики (сек)
+STATS_REFRESH_INTERVAL = float(os.getenv('STATS_REFRESH_INTERVAL', 60))
+
+_stats_snapshot = {
+    'stats': None,
+    'refreshed_at': None,
+    'refresh_ms': 0.0,
+    'refreshes': 0,
+    'failures': 0
+}
+
+def is_admin(user_id: int) -> bool:
+    """Является ли пользователь администратором"""
+    return user_id in ADMIN_USER_IDS
+
+def refresh_stats_snapshot() -> dict:
+    """Пересчитать снимок статистики (блокирующий вызов, выполняется вне event loop)"""
+    started = time.perf_counter()
+    stats = get_stats()
+    elapsed = (time.perf_counter() - started) * 1000
+    
+    # get_stats при ошибке возвращает {}: оставить предыдущий снимок
+    if not stats:
+        _stats_snapshot['failures'] += 1
+        logger.warning("⚠️  Не удалось обновить снимок статистики")
+        return _stats_snapshot
+    
+    _stats_snapshot.update({
+        'stats': stats,
+        'refreshed_at': time.time(),
+        'refresh_ms': elapsed,
+        'refreshes': _stats_snapshot['refreshes'] + 1
+    })
+    logger.debug(f"📊 Снимок статистики обновлен за {elapsed:.1f} мс")
+    return _stats_snapshot
+
+def get_stats_snapshot() -> dict:
+    """Текущий снимок статистики с возрастом в секундах (stats=None, пока не посчитан)"""
+    snapshot = dict(_stats_snapshot)
+    refreshed_at = snapshot['refreshed_at']
+    snapshot['age_seconds'] = time.time() - refreshed_at if refreshed_at else None
+    return snapshot
+
+def get_stats_snapshot_metrics() -> dict:
+    """Метрики снимка статистики: стоимость пересчета и устаревание"""
+    snapshot = get_stats_snapshot()
+    return {
+        'age_seconds': snapshot['age_seconds'] if snapshot['age_seconds'] is not None else -1,
+        'refresh_ms': snapshot['refresh_ms'],
+        'refreshes': snapshot['refreshes'],
+        'failures': snapshot['failures']
+    }
+
+async def stats_refresh_job(context: ContextTypes.DEFAULT_TYPE):
+    """Фоновый пересчет снимка статистики (в отдельном потоке)"""
+    await asyncio.get_running_loop().run_in_executor(None, refresh_stats_snapshot)
@@ -0,0 +1,197 @@
+"""
+app/batch.py
+Пакетный прогон вопросов через FAQ без Telegram (оценка базы на выгрузках)
+
+Вход и выход читаются и пишутся потоково: в памяти одновременно держится
+только окно из нескольких порций на воркер, поэтому размер файла не важен.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import logging
+import functools
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from app.faq_engine import find_answer, reload_faq_index
+
+logger = logging.getLogger(__name__)
+
+# Поля, в которых может лежать текст вопроса (JSONL или заголовок CSV)
+QUESTION_FIELDS = ('question', 'text', 'user_message', 'query', 'title', 'body')
+
+# Поля результата в порядке вывода (CSV)
+RESULT_FIELDS = ('line', 'id', 'query', 'found', 'category', 'question', 'similarity_score')
+
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', 512))
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', os.cpu_count() or 1))
+
+def _open_text(path, mode: str):
+    """Файл или stdin/stdout для пути '-'"""
+    if str(path) == '-':
+        return sys.stdin if 'r' in mode else sys.stdout
+    return open(path, mode, encoding='utf-8', newline='')
+
+def iter_questions(path):
+    """
+    Генератор вопросов из JSONL или CSV: (номер строки, id, текст)
+    
+    JSONL — строка JSON или объект с одним из полей QUESTION_FIELDS (и, опционально, id).
+    CSV — файл с заголовком (например, выгрузка interactions).
+    Пустые и битые строки пропускаются.
+    """
+    stream = _open_text(path, 'r')
+    is_csv = str(path).lower().endswith('.csv')
+    
+    try:
+        if is_csv:
+            for line_no, row in enumerate(csv.DictReader(stream), start=2):
+                text = next((row[f] for f in QUESTION_FIELDS if row.get(f)), None)
+                if text:
+                    yield line_no, row.get('id'), text
+            return
+        
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.debug(f"Строка {line_no}: не JSON, пропущена")
+                continue
+            
+            if isinstance(record, str):
+                yield line_no, None, record
+            elif isinstance(record, dict):
+                text = next((record[f] for f in QUESTION_FIELDS if record.get(f)), None)
+                if text:
+                    yield line_no, record.get('id'), str(text)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def _init_worker(load_faq: bool = True):
+    """Инициализация процесса пула: логирование и (если нужен) FAQ, скомпилированный один раз"""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.WARNING
+    )
+    if load_faq:
+        reload_faq_index(force=True)
+
+def answer_chunk(chunk: list, threshold: float = 0.5) -> list:
+    """Ответить на порцию вопросов (выполняется в процессе пула)"""
+    results = []
+    for line_no, record_id, text in chunk:
+        result = find_answer(text, threshold=threshold)
+        results.append({
+            'line': line_no,
+            'id': record_id,
+            'query': text,
+            'found': result['found'],
+            'category': result['category'],
+            'question': result['question'],
+            'similarity_score': round(result['similarity_score'], 4)
+        })
+    return results
+
+def _chunks(iterable, size: int):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def iter_chunk_results(func, chunks, workers: int, load_faq: bool = True):
+    """
+    Результаты func (список на порцию) для потока порций, в исходном порядке
+    
+    Порции раздаются пулу процессов; в работе не больше 2 порций на воркер,
+    поэтому входной генератор читается по мере готовности результатов.
+    При workers=1 все выполняется в текущем процессе. Общая основа офлайн-задач
+    (--batch, кластеризация вопросов без ответа).
+    """
+    if workers <= 1:
+        if load_faq:
+            reload_faq_index(force=True)
+        for chunk in chunks:
+            yield from func(chunk)
+        return
+    
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(load_faq,)
+    ) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(func, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def iter_answers(questions, workers: int = None, chunk_size: int = None, threshold: float = 0.5):
+    """Ответы на поток вопросов в исходном порядке (порциями в пуле процессов)"""
+    workers = max(1, workers or BATCH_WORKERS)
+    chunk_size = max(1, chunk_size or BATCH_CHUNK_SIZE)
+    answer = functools.partial(answer_chunk, threshold=threshold)
+    yield from iter_chunk_results(answer, _chunks(questions, chunk_size), workers)
+
+def run_batch(input_path, output_path='-', workers: int = None, chunk_size: int = None,
+              threshold: float = 0.5) -> dict:
+    """
+    Прогнать файл вопросов через FAQ и записать результаты
+    
+    Формат вывода — по расширению: .csv или JSONL (по умолчанию, в т.ч. stdout).
+    
+    Returns:
+        dict со сводкой: total, found, elapsed, throughput
+    """
+    output = _open_text(output_path, 'w')
+    as_csv = str(output_path).lower().endswith('.csv')
+    writer = csv.DictWriter(output, fieldnames=RESULT_FIELDS) if as_csv else None
+    if writer:
+        writer.writeheader()
+    
+    total = found = 0
+    started = time.perf_counter()
+    
+    try:
+        for result in iter_answers(iter_questions(input_path), workers, chunk_size, threshold):
+            if writer:
+                writer.writerow(result)
+            else:
+                output.write(json.dumps(result, ensure_ascii=False) + '\n')
+            
+            total += 1
+            found += result['found']
+            if total % 100000 == 0:
+                logger.info(f"⏳ Обработано: {total} ({total / (time.perf_counter() - started):.0f} вопр/с)")
+    finally:
+        if output is sys.stdout:
+            output.flush()
+        else:
+            output.close()
+    
+    elapsed = time.perf_counter() - started
+    summary = {
+        'total': total,
+        'found': found,
+        'found_rate': round(found / total, 4) if total else 0.0,
+        'elapsed': round(elapsed, 2),
+        'throughput': round(total / elapsed, 1) if elapsed > 0 else 0.0
+    }
+    logger.info(
+        f"✅ Пакетный прогон: {total} вопросов, найдено {found} ({summary['found_rate']:.1%}), "
+        f"{summary['throughput']:.0f} вопр/с"
+    )
+    return summary
@@ -0,0 +1,314 @@
+"""
+Бенчмарки горячих путей SberMobile Bot
+Поиск по FAQ (find_answer), логирование (log_interaction) и статистика (get_stats)
+
+Примеры:
+    python benchmark.py --faq-sizes 10,1000,10000 --output bench.json
+    python benchmark.py --queries interactions.csv --baseline bench.json
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+from pathlib import Path
+
+from app import faq_engine, database
+
+logger = logging.getLogger(__name__)
+
+# Поля, в которых может лежать текст вопроса в JSONL-потоке
+QUERY_FIELDS = ('text', 'question', 'user_message', 'query', 'title', 'body')
+
+def generate_faq(size: int, seed: int = 42) -> list:
+    """Сгенерировать синтетическую базу FAQ в формате DEFAULT_FAQ на size вопросов"""
+    rng = random.Random(seed)
+    
+    questions = [q for cat in faq_engine.DEFAULT_FAQ for q in cat['questions']]
+    words = sorted({w for q in questions for w in faq_engine.normalize_text(q['question']).rstrip('?').split()})
+    answers = [q['answer'] for q in questions]
+    base_categories = [cat['category'] for cat in faq_engine.DEFAULT_FAQ]
+    
+    categories = {}
+    for i in range(size):
+        category = f"{base_categories[i % len(base_categories)]} {i // (len(base_categories) * 50)}"
+        text = ' '.join(rng.choice(words) for _ in range(rng.randint(3, 8)))
+        categories.setdefault(category, []).append({
+            'question': f"{text.capitalize()} {i}?",
+            'answer': rng.choice(answers)
+        })
+    
+    return [{'category': name, 'questions': items} for name, items in categories.items()]
+
+def synthetic_queries(faq: list, count: int, seed: int = 7) -> list:
+    """Запросы, похожие на живые: искаженные вопросы FAQ и случайный шум"""
+    rng = random.Random(seed)
+    
+    questions = [q['question'] for cat in faq for q in cat['questions']]
+    words = [w for q in questions[:1000] for w in q.split()]
+    queries = []
+    
+    for _ in range(count):
+        if rng.random() < 0.2:
+            queries.append(' '.join(rng.choice(words) for _ in range(rng.randint(1, 5))))
+            continue
+        
+        tokens = rng.choice(questions).rstrip('?').split()
+        if len(tokens) > 2 and rng.random() < 0.5:
+            tokens.pop(rng.randrange(len(tokens)))
+        if rng.random() < 0.3:
+            tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(words))
+        queries.append(' '.join(tokens).lower())
+    
+    return queries
+
+def iter_query_file(path: Path):
+    """Прочитать поток вопросов из JSONL или CSV-выгрузки interactions"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.suffix.lower() == '.csv':
+            for row in csv.DictReader(f):
+                if row.get('user_message'):
+                    yield row['user_message']
+            return
+        
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                yield record
+                continue
+            for field in QUERY_FIELDS:
+                if record.get(field):
+                    yield record[field]
+                    break
+
+def summarize(name: str, params: dict, latencies: list, elapsed: float = None) -> dict:
+    """Пропускная способность и перцентили задержек (мс)"""
+    latencies = sorted(latencies)
+    elapsed = elapsed if elapsed is not None else sum(latencies)
+    
+    def percentile(p):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+    
+    result = {
+        'name': name,
+        'params': params,
+        'ops': len(latencies),
+        'throughput': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99)
+    }
+    logger.info(
+        f"⏱️  {name} {params}: {result['throughput']:.0f} оп/с, "
+        f"p50={result['p50_ms']:.3f} мс, p95={result['p95_ms']:.3f} мс, p99={result['p99_ms']:.3f} мс"
+    )
+    return result
+
+def bench_find_answer(workdir: Path, faq_size: int, queries: list, cached: bool) -> dict:
+    """Задержка find_answer на синтетической базе заданного размера"""
+    faq_path = workdir / f"faq_{faq_size}.json"
+    with open(faq_path, 'w', encoding='utf-8') as f:
+        json.dump(generate_faq(faq_size), f, ensure_ascii=False)
+    
+    faq_engine.FAQ_PATH = faq_path
+    started = time.perf_counter()
+    faq_engine.reload_faq_index(force=True)
+    build_ms = (time.perf_counter() - started) * 1000
+    
+    cache_entries = faq_engine.ANSWER_CACHE_MAX_ENTRIES
+    if not cached:
+        faq_engine.ANSWER_CACHE_MAX_ENTRIES = 0
+    
+    latencies = []
+    try:
+        for query in queries:
+            started = time.perf_counter()
+            faq_engine.find_answer(query)
+            latencies.append(time.perf_counter() - started)
+    finally:
+        faq_engine.ANSWER_CACHE_MAX_ENTRIES = cache_entries
+        faq_engine.clear_answer_cache()
+    
+    result = summarize('find_answer', {'faq_size': faq_size, 'cached': cached}, latencies)
+    result['index_build_ms'] = build_ms
+    return result
+
+def _use_database(path: Path):
+    """Переключить модуль БД на отдельный файл"""
+    database.close_database()
+    database.DB_PATH = path
+    database.init_database()
+
+def bench_log_interaction(workdir: Path, queries: list, count: int) -> list:
+    """Задержка постановки в очередь и пропускная способность записи до диска"""
+    _use_database(workdir / "log_bench.db")
+    rng = random.Random(11)
+    
+    latencies = []
+    started_all = time.perf_counter()
+    for i in range(count):
+        found = rng.random() < 0.7
+        started = time.perf_counter()
+        database.log_interaction(
+            user_id=rng.randint(1, 10000),
+            user_message=queries[i % len(queries)],
+            found=found,
+            category=f"cat {rng.randint(1, 20)}" if found else None,
+            similarity_score=rng.random()
+        )
+        latencies.append(time.perf_counter() - started)
+    database.flush_interactions(timeout=600)
+    elapsed = time.perf_counter() - started_all
+    
+    results = [summarize('log_interaction', {'rows': count}, latencies)]
+    results.append({
+        'name': 'log_interaction_durable',
+        'params': {'rows': count},
+        'ops': count,
+        'throughput': count / elapsed if elapsed > 0 else 0.0,
+        'queue': database.get_write_queue_stats()
+    })
+    database.close_database()
+    return results
+
+def bench_get_stats(workdir: Path, table_size: int, queries: list, repeats: int) -> dict:
+    """Задержка get_stats на таблице interactions заданного размера"""
+    _use_database(workdir / f"stats_{table_size}.db")
+    rng = random.Random(13)
+    
+    rows = []
+    for i in range(table_size):
+        found = rng.random() < 0.7
+        rows.append((
+            rng.randint(1, 10000),
+            queries[i % len(queries)],
+            found,
+            f"cat {rng.randint(1, 20)}" if found else None,
+            rng.random(),
+            '2025-01-01 00:00:00'
+        ))
+        if len(rows) >= 10000:
+            database._write_batch(rows)
+            rows = []
+    if rows:
+        database._write_batch(rows)
+    
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        database.get_stats()
+        latencies.append(time.perf_counter() - started)
+    
+    database.close_database()
+    return summarize('get_stats', {'rows': table_size}, latencies)
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """Сравнить с сохраненными результатами; вернуть список регрессий"""
+    def key(result):
+        return (result['name'], json.dumps(result['params'], sort_keys=True))
+    
+    previous = {key(r): r for r in baseline}
+    regressions = []
+    
+    for result in results:
+        old = previous.get(key(result))
+        if not old:
+            continue
+        
+        checks = [('throughput', old['throughput'], result['throughput'], False)]
+        if 'p95_ms' in result and 'p95_ms' in old:
+            checks.append(('p95_ms', old['p95_ms'], result['p95_ms'], True))
+        
+        for metric, before, after, lower_is_better in checks:
+            if not before:
+                continue
+            change = (after - before) / before
+            result.setdefault('vs_baseline', {})[metric] = change
+            worse = change > tolerance if lower_is_better else change < -tolerance
+            if worse:
+                regressions.append(f"{result['name']} {result['params']}: {metric} {before:.4g} → {after:.4g} ({change:+.0%})")
+    
+    return regressions
+
+def main():
+    """Запуск бенчмарков"""
+    parser = argparse.ArgumentParser(description='Бенчмарки SberMobile Bot')
+    parser.add_argument('--faq-sizes', default='10,100,1000,10000', help='Размеры синтетических баз FAQ через запятую')
+    parser.add_argument('--table-sizes', default='1000,100000', help='Размеры таблицы interactions для get_stats')
+    parser.add_argument('--queries', type=Path, help='Поток вопросов: JSONL или CSV-выгрузка interactions')
+    parser.add_argument('--query-count', type=int, default=500, help='Сколько запросов прогонять на каждый размер FAQ')
+    parser.add_argument('--log-rows', type=int, default=20000, help='Сколько взаимодействий логировать')
+    parser.add_argument('--stats-repeats', type=int, default=50, help='Сколько раз вызывать get_stats')
+    parser.add_argument('--output', type=Path, help='Куда записать результаты (JSON)')
+    parser.add_argument('--baseline', type=Path, help='Сохраненные результаты для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Допустимое ухудшение относительно baseline (0.2 = 20%%)')
+    args = parser.parse_args()
+    
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    logging.getLogger('app').setLevel(logging.WARNING)
+    
+    faq_sizes = [int(x) for x in args.faq_sizes.split(',') if x]
+    table_sizes = [int(x) for x in args.table_sizes.split(',') if x]
+    
+    replayed = None
+    if args.queries:
+        replayed = [q for _, q in zip(range(args.query_count), iter_query_file(args.queries))]
+        logger.info(f"📥 Загружено вопросов для реплея: {len(replayed)}")
+    
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bot-bench-') as tmp:
+        workdir = Path(tmp)
+        
+        for size in faq_sizes:
+            queries = replayed or synthetic_queries(generate_faq(size), args.query_count)
+            results.append(bench_find_answer(workdir, size, queries, cached=False))
+            results.append(bench_find_answer(workdir, size, queries, cached=True))
+        
+        queries = replayed or synthetic_queries(faq_engine.DEFAULT_FAQ, 1000)
+        results.extend(bench_log_interaction(workdir, queries, args.log_rows))
+        for size in table_sizes:
+            results.append(bench_get_stats(workdir, size, queries, args.stats_repeats))
+    
+    report = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'results': results
+    }
+    
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+        report['regressions'] = regressions
+    
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(output, encoding='utf-8')
+        logger.info(f"💾 Результаты сохранены: {args.output}")
+    else:
+        print(output)
+    
+    for line in regressions:
+        logger.error(f"❌ Регрессия: {line}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
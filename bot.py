@@ -5,6 +5,7 @@ app/bot.py
 """
 
 import os
+import asyncio
 import logging
 from telegram import Update, BotCommand
 from telegram.ext import (
@@ -20,34 +21,68 @@ from app.handlers import (
     help_command,
     contact_command,
     categories_command,
+    stats_command,
+    profile_command,
     handle_message
 )
-from app.database import init_database, close_database
+from app import metrics
+from app.database import (
+    INTERACTIONS_RETENTION_MONTHS,
+    init_database,
+    close_database,
+    get_write_queue_stats,
+    archive_partitions
+)
+from app.faq_engine import reload_faq_index, get_answer_cache_stats, get_base_stats
+from app.sessions import get_session_stats, get_category_search_stats
+from app.profiling import get_profiler_status
+from app.responses import prerender
+from app.outbound import OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_BURST, OutboundRateLimiter
+from app.admin import STATS_REFRESH_INTERVAL, stats_refresh_job, get_stats_snapshot_metrics
+from app.concurrency import (
+    BOT_CONCURRENT_UPDATES,
+    PerChatUpdateProcessor,
+    start_matcher_pool,
+    shutdown_matcher_pool
+)
 
 logger = logging.getLogger(__name__)
 
-def create_bot_polling():
-    """
-    Создать и запустить бота в режиме POLLING (бесплатный)
-    Бот сам спрашивает Telegram API о новых сообщениях каждую секунду
+# Адрес Bot API (для нагрузочных тестов — поддельный сервер, см. app/fake_telegram.py)
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL')
+
+def build_application(token: str, mode: str = 'polling', processes: int = 1) -> Application:
     """
+    Собрать Application с обработчиками
     
-    token = os.getenv('TELEGRAM_BOT_TOKEN')
-    if not token:
-        raise ValueError("TELEGRAM_BOT_TOKEN не установлен!")
-    
-    # Инициализировать базу данных
-    init_database()
-    logger.info("📊 База данных инициализирована")
+    Апдейты разных чатов обрабатываются конкурентно (BOT_CONCURRENT_UPDATES),
+    внутри одного чата порядок сохраняется.
     
-    # Создать приложение
-    app = Application.builder().token(token).build()
+    Args:
+        token: Токен бота
+        mode: polling или webhook (влияет на то, как отдаются метрики)
+        processes: Сколько процессов бота делят общий лимит исходящих сообщений
+    """
+    builder = Application.builder().token(token).post_init(on_startup).post_shutdown(on_shutdown)
+    # Исходящие запросы — через лимиты Telegram (общий и на чат) с повтором после 429
+    builder = builder.rate_limiter(OutboundRateLimiter(
+        global_rate=OUTBOUND_GLOBAL_RATE / processes,
+        global_burst=max(1.0, OUTBOUND_GLOBAL_BURST / processes)
+    ))
+    if TELEGRAM_API_BASE_URL:
+        builder = builder.base_url(TELEGRAM_API_BASE_URL)
+    if BOT_CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(PerChatUpdateProcessor(BOT_CONCURRENT_UPDATES))
+    app = builder.build()
+    app.bot_data['mode'] = mode
     
     # Регистрация обработчиков команд
     app.add_handler(CommandHandler("start", start_command))
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("contact", contact_command))
     app.add_handler(CommandHandler("categories", categories_command))
+    app.add_handler(CommandHandler("stats", stats_command))
+    app.add_handler(CommandHandler("profile", profile_command))
     
     # Обработчик для обычных сообщений (должен быть в конце!)
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
@@ -55,6 +90,29 @@ def create_bot_polling():
     # Обработка ошибок
     app.add_error_handler(error_handler)
     
+    return app
+
+def create_bot_polling():
+    """
+    Создать и запустить бота в режиме POLLING (бесплатный)
+    Бот сам спрашивает Telegram API о новых сообщениях каждую секунду
+    """
+    
+    token = os.getenv('TELEGRAM_BOT_TOKEN')
+    if not token:
+        raise ValueError("TELEGRAM_BOT_TOKEN не установлен!")
+    
+    # Инициализировать базу данных
+    init_database()
+    logger.info("📊 База данных инициализирована")
+    
+    # Скомпилировать FAQ и отрендерить список категорий один раз при старте
+    reload_faq_index(force=True)
+    prerender()
+    
+    # Создать приложение
+    app = build_application(token)
+    
     # Установить команды бота
     logger.info("⚙️  Регистрация команд бота...")
     
@@ -64,10 +122,10 @@ def create_bot_polling():
     
     app.run_polling(
         allowed_updates=Update.ALL_TYPES,
-        close_loop_on_stop=True
+        close_loop=True
     )
 
-def create_bot_webhook(port: int = 8000, webhook_url: str = None):
+def create_bot_webhook(port: int = 8000, webhook_url: str = None, workers: int = None):
     """
     Создать и запустить бота с WEBHOOK (платный)
     Telegram сам отправляет сообщения боту через HTTP
@@ -75,7 +133,9 @@ def create_bot_webhook(port: int = 8000, webhook_url: str = None):
     Args:
         port: Порт для веб-сервера
         webhook_url: URL для веб-хука (например, https://example.com/webhook)
+        workers: Число процессов на общем порту (по умолчанию WEBHOOK_WORKERS)
     """
+    from app.webhook_server import serve_webhook
     
     token = os.getenv('TELEGRAM_BOT_TOKEN')
     if not token:
@@ -84,44 +144,73 @@ def create_bot_webhook(port: int = 8000, webhook_url: str = None):
     if not webhook_url:
         raise ValueError("WEBHOOK_URL не установлен!")
     
-    # Инициализировать базу данных
-    init_database()
-    logger.info("📊 База данных инициализирована")
-    
-    # Создать приложение
-    app = Application.builder().token(token).build()
-    
-    # Регистрация обработчиков команд
-    app.add_handler(CommandHandler("start", start_command))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(CommandHandler("contact", contact_command))
-    app.add_handler(CommandHandler("categories", categories_command))
-    
-    # Обработчик для обычных сообщений (должен быть в конце!)
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-    
-    # Обработка ошибок
-    app.add_error_handler(error_handler)
-    
-    # Установить команды бота
-    logger.info("⚙️  Регистрация команд бота...")
-    
-    # Настроить веб-хуки
+    # Настроить веб-хук и запустить сервер (процессы сами компилируют FAQ)
     logger.info(f"🔗 Настройка веб-хука: {webhook_url}")
-    
-    # Запустить бота с веб-хуками
-    app.run_webhook(
-        listen="0.0.0.0",
-        port=port,
-        url_path=f"/webhook/{token}",
-        webhook_url=webhook_url
-    )
-    
-    return app
+    serve_webhook(token, port, webhook_url, workers=workers)
+
+async def on_startup(application: Application):
+    """Запуск приложения: поднять пул для поиска по FAQ и экспорт метрик"""
+    start_matcher_pool()
+    
+    metrics.register_collector('bot_write_queue', get_write_queue_stats)
+    metrics.register_collector('faq_answer_cache', get_answer_cache_stats)
+    metrics.register_collector('faq_category_search', get_category_search_stats)
+    metrics.register_collector('faq_bases', get_base_stats)
+    metrics.register_collector('bot_sessions', get_session_stats)
+    metrics.register_collector('bot_stats_snapshot', get_stats_snapshot_metrics)
+    metrics.register_collector('bot_profiler', get_profiler_status)
+    if application.bot.rate_limiter:
+        metrics.register_collector('bot_outbound', application.bot.rate_limiter.get_stats)
+    
+    # webhook — эндпоинт /metrics (у каждого процесса свой порт), polling — периодическая сводка в лог
+    worker_id = application.bot_data.get('worker_id', 0)
+    if application.bot_data.get('mode') == 'webhook' and metrics.METRICS_PORT:
+        application.bot_data['metrics_runner'] = await metrics.start_metrics_server(
+            metrics.METRICS_PORT + worker_id,
+            routes=application.bot_data.get('health_routes')
+        )
+    elif application.job_queue and metrics.METRICS_LOG_INTERVAL > 0:
+        application.job_queue.run_repeating(
+            log_metrics_job,
+            interval=metrics.METRICS_LOG_INTERVAL,
+            first=metrics.METRICS_LOG_INTERVAL,
+            name='metrics_log'
+        )
+    
+    # Снимок статистики для /stats пересчитывается в фоне
+    if application.job_queue and STATS_REFRESH_INTERVAL > 0:
+        application.job_queue.run_repeating(
+            stats_refresh_job,
+            interval=STATS_REFRESH_INTERVAL,
+            first=0,
+            name='stats_refresh'
+        )
+    
+    # Архивирование старых партиций взаимодействий раз в сутки (только в одном процессе)
+    if application.job_queue and INTERACTIONS_RETENTION_MONTHS > 0 and worker_id == 0:
+        application.job_queue.run_repeating(archive_job, interval=24 * 3600, first=60, name='interactions_archive')
+
+async def on_shutdown(application: Application):
+    """Остановка приложения: остановить пул, дописать очередь взаимодействий и закрыть БД"""
+    runner = application.bot_data.pop('metrics_runner', None)
+    if runner:
+        await runner.cleanup()
+    
+    shutdown_matcher_pool()
+    close_database()
+
+async def log_metrics_job(context: ContextTypes.DEFAULT_TYPE):
+    """Периодический дамп метрик в лог (режим polling)"""
+    metrics.log_summary()
+
+async def archive_job(context: ContextTypes.DEFAULT_TYPE):
+    """Перенос партиций старше срока хранения в архив (в отдельном потоке)"""
+    await asyncio.get_running_loop().run_in_executor(None, archive_partitions)
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка ошибок"""
     logger.error(f"❌ Ошибка: {context.error}", exc_info=context.error)
+    metrics.inc('bot_errors_total', error=type(context.error).__name__)
     
     if update and update.effective_chat:
         try:
@@ -0,0 +1,406 @@
+"""
+app/clustering.py
+Кластеризация вопросов без ответа (found = 0): что добавить в FAQ
+
+Офлайн-задача в три шага:
+1. вопросы без ответа потоково читаются из SQLite (и архива партиций) пачками;
+2. для каждой пачки в пуле процессов считаются MinHash-подписи символьных
+   n-грамм (те же, что в индексе FAQ) и ключи LSH-корзин;
+3. главный процесс раскладывает подписи по кластерам через LSH-корзины
+   с проверкой сходства, в конце близкие кластеры сливаются.
+
+Память ограничена числом кластеров (MISS_MAX_CLUSTERS), а не числом строк:
+при переполнении отбрасываются самые мелкие кластеры (их строки
+учитываются в сводке как pruned_rows).
+
+Запуск: python -m app.clustering --output misses.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import heapq
+import logging
+from functools import lru_cache
+
+from app.faq_engine import normalize_text, text_ngrams, find_answer, reload_faq_index
+from app.database import iter_unanswered
+from app.batch import iter_chunk_results
+
+logger = logging.getLogger(__name__)
+
+# MinHash: число хеш-функций и разбиение подписи на LSH-корзины (bands × rows = перестановок)
+MISS_MINHASH_PERMUTATIONS = int(os.getenv('MISS_MINHASH_PERMUTATIONS', 64))
+MISS_LSH_BANDS = int(os.getenv('MISS_LSH_BANDS', 16))
+MISS_MINHASH_SEED = int(os.getenv('MISS_MINHASH_SEED', 1))
+
+# Минимальное сходство (оценка Жаккара по n-граммам) вопроса с представителем кластера
+MISS_CLUSTER_SIMILARITY = float(os.getenv('MISS_CLUSTER_SIMILARITY', 0.5))
+
+# Сколько кластеров держать в памяти и сколько формулировок хранить в каждом
+MISS_MAX_CLUSTERS = int(os.getenv('MISS_MAX_CLUSTERS', 50000))
+MISS_CLUSTER_VARIANTS = int(os.getenv('MISS_CLUSTER_VARIANTS', 10))
+
+MISS_CHUNK_SIZE = int(os.getenv('MISS_CHUNK_SIZE', 10000))
+MISS_WORKERS = int(os.getenv('MISS_WORKERS', os.cpu_count() or 1))
+
+# Простое число больше 2^32 для универсального хеширования (a * x + b) mod p
+_PRIME = 4294967311
+
+# Сколько n-грамм хешируется за раз (матрица n-граммы × перестановки в памяти)
+_HASH_BATCH = 8192
+
+@lru_cache(maxsize=None)
+def _hash_params(num_perm: int, bands: int):
+    """Коэффициенты перестановок и свертки корзин (одинаковые во всех процессах)"""
+    import numpy as np
+    
+    if bands <= 0 or num_perm % bands:
+        raise ValueError(
+            f"MISS_MINHASH_PERMUTATIONS ({num_perm}) должно делиться на MISS_LSH_BANDS ({bands})"
+        )
+    
+    rng = np.random.RandomState(MISS_MINHASH_SEED)
+    a = rng.randint(1, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+    fold = rng.randint(1, 2 ** 62, size=num_perm // bands, dtype=np.uint64) | np.uint64(1)
+    return a, b, fold
+
+def minhash_signatures(texts: list, num_perm: int = None):
+    """
+    MinHash-подписи нормализованных текстов: массив uint32 (len(texts), num_perm)
+    
+    N-граммы хешируются через crc32, а не hash(): подписи должны совпадать
+    в разных процессах независимо от PYTHONHASHSEED.
+    """
+    import numpy as np
+    
+    num_perm = num_perm or MISS_MINHASH_PERMUTATIONS
+    a, b, _ = _hash_params(num_perm, MISS_LSH_BANDS)
+    grams = [text_ngrams(text) for text in texts]
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    
+    start = 0
+    while start < len(texts):
+        end, total = start, 0
+        while end < len(texts) and (end == start or total + len(grams[end]) <= _HASH_BATCH):
+            total += len(grams[end])
+            end += 1
+        
+        hashes = np.fromiter(
+            (zlib.crc32(gram.encode('utf-8')) for i in range(start, end) for gram in grams[i]),
+            dtype=np.uint64, count=total
+        )
+        offsets = np.cumsum([0] + [len(grams[i]) for i in range(start, end - 1)])
+        values = (hashes[:, None] * a + b) % np.uint64(_PRIME)
+        signatures[start:end] = np.minimum.reduceat(values, offsets, axis=0)
+        start = end
+    
+    return signatures.astype(np.uint32)
+
+def band_hashes(signatures) -> list:
+    """Ключи LSH-корзин: подпись режется на MISS_LSH_BANDS полос, каждая сворачивается в число"""
+    num_perm = signatures.shape[1]
+    _, _, fold = _hash_params(num_perm, MISS_LSH_BANDS)
+    bands = signatures.astype('uint64').reshape(len(signatures), MISS_LSH_BANDS, -1)
+    return (bands * fold).sum(axis=2).tolist()
+
+def sign_chunk(messages: list) -> list:
+    """
+    Подписать пачку вопросов (выполняется в процессе пула)
+    
+    Одинаковые после нормализации вопросы схлопываются до подписи.
+    
+    Returns:
+        список (нормализованный текст, пример исходного, число, ключи корзин, подпись в bytes)
+    """
+    counts = {}
+    for message in messages:
+        text = normalize_text(message)
+        if not text:
+            continue
+        entry = counts.get(text)
+        if entry is None:
+            counts[text] = [1, message]
+        else:
+            entry[0] += 1
+    
+    if not counts:
+        return []
+    
+    texts = list(counts)
+    signatures = minhash_signatures(texts)
+    keys = band_hashes(signatures)
+    return [
+        (text, counts[text][1], counts[text][0], keys[i], signatures[i].tobytes())
+        for i, text in enumerate(texts)
+    ]
+
+def _similarity(left, right) -> float:
+    """Оценка сходства Жаккара по двум MinHash-подписям"""
+    import numpy as np
+    return np.count_nonzero(left == right) / len(left)
+
+class MissCluster:
+    """
+    Кластер похожих вопросов: представитель, счетчик и частые формулировки
+    
+    Пока идет поток, представитель — первый вопрос кластера; перед слиянием
+    им становится самая частая формулировка (обычно «чистая», без опечаток).
+    """
+    
+    __slots__ = ('count', 'signature', 'bands', 'variants', 'keys', 'touched')
+    
+    def __init__(self, signature, bands):
+        self.count = 0
+        # Номер последнего добавления: при равном размере отбрасываются давно не пополнявшиеся
+        self.touched = 0
+        self.signature = signature
+        self.bands = bands
+        self.variants = {}
+        self.keys = []
+    
+    def add(self, text: str, sample: str, count: int, signature, bands: list, max_variants: int):
+        self.count += count
+        variant = self.variants.get(text)
+        if variant is not None:
+            variant[0] += count
+        elif len(self.variants) < max_variants:
+            self.variants[text] = [count, sample, signature, bands]
+    
+    def absorb(self, other: 'MissCluster', max_variants: int):
+        """Влить другой кластер (оставить самые частые формулировки)"""
+        self.count += other.count
+        for text, variant in other.variants.items():
+            if text in self.variants:
+                self.variants[text][0] += variant[0]
+            else:
+                self.variants[text] = variant
+        if len(self.variants) > max_variants:
+            top = sorted(self.variants.items(), key=lambda item: -item[1][0])[:max_variants]
+            self.variants = dict(top)
+    
+    def top_variants(self, limit: int = None) -> list:
+        """Формулировки по убыванию частоты: [(пример, число), ...]"""
+        ranked = sorted(self.variants.values(), key=lambda variant: -variant[0])
+        return [(variant[1], variant[0]) for variant in ranked[:limit]]
+    
+    def elect_representative(self):
+        """Сделать представителем самую частую формулировку"""
+        _, _, self.signature, self.bands = max(self.variants.values(), key=lambda variant: variant[0])
+
+class MissClusterer:
+    """
+    Потоковая кластеризация подписей через LSH-корзины
+    
+    Вопрос сравнивается только с представителями кластеров, с которыми
+    у него совпала хотя бы одна корзина, и попадает в самый похожий
+    (от MISS_CLUSTER_SIMILARITY) или открывает новый. Кластер регистрирует
+    в корзинах не больше 2 × MISS_LSH_BANDS ключей.
+    """
+    
+    def __init__(self, similarity: float = None, max_clusters: int = None, max_variants: int = None):
+        self.similarity = MISS_CLUSTER_SIMILARITY if similarity is None else similarity
+        self.max_clusters = max_clusters or MISS_MAX_CLUSTERS
+        self.max_variants = max_variants or MISS_CLUSTER_VARIANTS
+        self.max_keys = 2 * MISS_LSH_BANDS
+        
+        self.clusters = {}
+        self._buckets = [{} for _ in range(MISS_LSH_BANDS)]
+        self._next_id = 0
+        self.rows = 0
+        # Разные тексты в пределах пачек: повтор из другой пачки считается снова
+        self.chunk_distinct = 0
+        self.pruned_rows = 0
+        self.prunes = 0
+    
+    def add(self, text: str, sample: str, count: int, bands: list, signature: bytes):
+        """Добавить вопрос (с числом повторов) в подходящий кластер"""
+        import numpy as np
+        
+        signature = np.frombuffer(signature, dtype=np.uint32)
+        self.rows += count
+        self.chunk_distinct += 1
+        
+        best_id, best_score = None, self.similarity
+        seen = set()
+        for band, key in enumerate(bands):
+            cluster_id = self._buckets[band].get(key)
+            if cluster_id is None or cluster_id in seen:
+                continue
+            seen.add(cluster_id)
+            score = _similarity(signature, self.clusters[cluster_id].signature)
+            if score >= best_score:
+                best_id, best_score = cluster_id, score
+        
+        if best_id is None:
+            best_id = self._next_id
+            self._next_id += 1
+            self.clusters[best_id] = MissCluster(signature, bands)
+        
+        cluster = self.clusters[best_id]
+        cluster.add(text, sample, count, signature, bands, self.max_variants)
+        cluster.touched = self.chunk_distinct
+        
+        # Корзины формулировок расширяют охват кластера (сравнение — всегда с представителем)
+        for band, key in enumerate(bands):
+            if len(cluster.keys) >= self.max_keys:
+                break
+            bucket = self._buckets[band]
+            if key not in bucket:
+                bucket[key] = best_id
+                cluster.keys.append((band, key))
+        
+        if len(self.clusters) > self.max_clusters:
+            self._prune()
+    
+    def _prune(self):
+        """
+        Отбросить ровно пятую часть кластеров, освободив их корзины
+        
+        Отбрасываются самые мелкие, при равном размере — давно не пополнявшиеся.
+        Порог по размеру здесь не годится: вопросы без ответа в основном
+        единичные, и порог 1 выбросил бы почти все кластеры разом.
+        """
+        victims = heapq.nsmallest(
+            max(1, len(self.clusters) // 5), self.clusters.items(),
+            key=lambda item: (item[1].count, item[1].touched)
+        )
+        pruned_rows = 0
+        for cluster_id, cluster in victims:
+            del self.clusters[cluster_id]
+            pruned_rows += cluster.count
+            for band, key in cluster.keys:
+                del self._buckets[band][key]
+        self.pruned_rows += pruned_rows
+        self.prunes += 1
+        logger.debug(f"Отброшено {len(victims)} мелких кластеров ({pruned_rows} вопросов): осталось {len(self.clusters)}")
+    
+    def merge(self):
+        """
+        Слить близкие кластеры (шаг после потока)
+        
+        Одна тема может распасться на несколько кластеров, если их первые
+        вопросы были зашумлены. Теперь кластеры сравниваются по самым частым
+        формулировкам; крупные обходятся первыми и поглощают мелкие.
+        """
+        buckets = [{} for _ in range(MISS_LSH_BANDS)]
+        merged = {}
+        for cluster in self.clusters.values():
+            cluster.elect_representative()
+        
+        for cluster_id, cluster in sorted(self.clusters.items(), key=lambda item: -item[1].count):
+            keys = list(enumerate(cluster.bands)) + cluster.keys
+            target = None
+            for band, key in keys:
+                other = buckets[band].get(key)
+                if other is not None and _similarity(cluster.signature, merged[other].signature) >= self.similarity:
+                    target = other
+                    break
+            
+            if target is None:
+                merged[cluster_id] = cluster
+                for band, key in keys:
+                    buckets[band].setdefault(key, cluster_id)
+            else:
+                merged[target].absorb(cluster, self.max_variants)
+        
+        logger.info(f"🔗 Слияние кластеров: {len(self.clusters)} → {len(merged)}")
+        self.clusters = merged
+        self._buckets = buckets
+    
+    def top(self, limit: int = None) -> list:
+        """Кластеры по убыванию числа вопросов"""
+        return sorted(self.clusters.values(), key=lambda cluster: -cluster.count)[:limit]
+
+def iter_signed(chunks, workers: int = None):
+    """Подписи для потока пачек вопросов (пачки подписываются в пуле процессов, FAQ там не нужен)"""
+    yield from iter_chunk_results(sign_chunk, chunks, max(1, workers or MISS_WORKERS), load_faq=False)
+
+def describe_cluster(rank: int, cluster: MissCluster, total: int, nearest: int = 3, variants: int = 5) -> dict:
+    """Строка отчета: размер кластера, частые формулировки и ближайшие вопросы FAQ"""
+    samples = cluster.top_variants(variants)
+    result = find_answer(samples[0][0], top_k=nearest)
+    return {
+        'rank': rank,
+        'count': cluster.count,
+        'share': round(cluster.count / total, 4) if total else 0.0,
+        'variants': [{'message': sample, 'count': count} for sample, count in samples],
+        'nearest_faq': [
+            {
+                'category': suggestion['category'],
+                'question': suggestion['question'],
+                'similarity_score': round(suggestion['similarity_score'], 4)
+            }
+            for suggestion in result.get('suggestions', [])
+        ]
+    }
+
+def run_clustering(output_path='-', top: int = 50, workers: int = None, chunk_size: int = None,
+                   include_archive: bool = True) -> dict:
+    """
+    Кластеризовать вопросы без ответа и записать топ кластеров в JSONL
+    
+    Returns:
+        dict со сводкой: rows, chunk_distinct, clusters, pruned_rows, elapsed, throughput
+    """
+    # Неверное разбиение подписи на корзины — ошибка до чтения БД и запуска пула
+    _hash_params(MISS_MINHASH_PERMUTATIONS, MISS_LSH_BANDS)
+    
+    started = time.perf_counter()
+    clusterer = MissClusterer()
+    
+    chunks = iter_unanswered(chunk_size or MISS_CHUNK_SIZE, include_archive)
+    for text, sample, count, bands, signature in iter_signed(chunks, workers):
+        clusterer.add(text, sample, count, bands, signature)
+        if clusterer.chunk_distinct % 100000 == 0:
+            logger.info(f"⏳ Обработано: {clusterer.rows} вопросов, кластеров: {len(clusterer.clusters)}")
+    
+    clusterer.merge()
+    reload_faq_index(force=True)
+    
+    output = sys.stdout if str(output_path) == '-' else open(output_path, 'w', encoding='utf-8')
+    try:
+        for rank, cluster in enumerate(clusterer.top(top), start=1):
+            record = describe_cluster(rank, cluster, clusterer.rows)
+            output.write(json.dumps(record, ensure_ascii=False) + '\n')
+    finally:
+        if output is sys.stdout:
+            output.flush()
+        else:
+            output.close()
+    
+    elapsed = time.perf_counter() - started
+    summary = {
+        'rows': clusterer.rows,
+        'chunk_distinct': clusterer.chunk_distinct,
+        'clusters': len(clusterer.clusters),
+        'pruned_rows': clusterer.pruned_rows,
+        'elapsed': round(elapsed, 2),
+        'throughput': round(clusterer.rows / elapsed, 1) if elapsed > 0 else 0.0
+    }
+    logger.info(
+        f"✅ Кластеризация: {summary['rows']} вопросов без ответа, {summary['clusters']} кластеров "
+        f"(отброшено мелких: {summary['pruned_rows']} вопросов), {summary['throughput']:.0f} вопр/с"
+    )
+    return summary
+
+if __name__ == '__main__':
+    import argparse
+    
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    
+    parser = argparse.ArgumentParser(description='Кластеризация вопросов без ответа SberMobile Bot')
+    parser.add_argument('--output', default='-', help='Куда писать кластеры: .jsonl или - для stdout')
+    parser.add_argument('--top', type=int, default=50, help='Сколько крупнейших кластеров вывести')
+    parser.add_argument('--workers', type=int, help='Число процессов (по умолчанию — число CPU)')
+    parser.add_argument('--chunk-size', type=int, help='Вопросов в одной пачке')
+    parser.add_argument('--no-archive', action='store_true', help='Не читать архив партиций')
+    args = parser.parse_args()
+    
+    run_clustering(args.output, args.top, args.workers, args.chunk_size, not args.no_archive)
@@ -0,0 +1,161 @@
+"""
+app/concurrency.py
+Параллельная обработка: пул для поиска по FAQ и порядок апдейтов внутри чата
+"""
+
+import os
+import asyncio
+import logging
+import functools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from app.faq_engine import find_answer, reload_faq_index
+from app.profiling import bind_capture
+from app.responses import categories_text
+
+logger = logging.getLogger(__name__)
+
+# Где выполнять поиск по FAQ: inline (в event loop), thread или process
+FAQ_MATCH_EXECUTOR = os.getenv('FAQ_MATCH_EXECUTOR', 'thread')
+FAQ_MATCH_WORKERS = int(os.getenv('FAQ_MATCH_WORKERS', os.cpu_count() or 1))
+
+# Сколько апдейтов обрабатывается одновременно (1 — строго последовательно)
+BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', 16))
+
+_executor = None
+
+def _init_worker():
+    """Инициализация процесса пула: заранее скомпилировать FAQ"""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    reload_faq_index(force=True)
+
+def start_matcher_pool(mode: str = None, workers: int = None):
+    """
+    Запустить пул для поиска по FAQ
+    
+    В режиме process каждый процесс держит свою копию скомпилированного FAQ
+    (загружается в инициализаторе) и свой кэш ответов.
+    """
+    global _executor
+    
+    mode = mode or FAQ_MATCH_EXECUTOR
+    workers = max(1, workers or FAQ_MATCH_WORKERS)
+    
+    if _executor is not None:
+        return _executor
+    
+    if mode == 'thread':
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='faq-match')
+    elif mode == 'process':
+        # spawn: процессы не наследуют потоки писателя БД и соединения SQLite
+        _executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+    elif mode != 'inline':
+        raise ValueError(f"Неизвестный режим FAQ_MATCH_EXECUTOR: {mode}")
+    
+    logger.info(f"⚙️  Поиск по FAQ: {mode} (воркеров: {workers if _executor else 0})")
+    return _executor
+
+def shutdown_matcher_pool():
+    """Остановить пул поиска по FAQ"""
+    global _executor
+    
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+async def find_answer_async(user_query: str, **kwargs) -> dict:
+    """Найти ответ в FAQ, не блокируя event loop (если пул запущен)"""
+    if _executor is None:
+        return find_answer(user_query, **kwargs)
+    
+    call = functools.partial(find_answer, user_query, **kwargs)
+    if isinstance(_executor, ThreadPoolExecutor):
+        # Стек потока пула попадает в профиль апдейта (процессы пула не профилируются)
+        call = bind_capture(call)
+    
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, call)
+
+async def categories_text_async(base: str = None) -> str:
+    """
+    Список категорий базы для /categories вне event loop
+    
+    Холодная или вытесненная база загружается в пуле поиска (в режиме process —
+    в процессе пула, где по ней и ищут), а не в event loop. Без пула —
+    в стандартном пуле потоков.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, categories_text, base)
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Конкурентная обработка апдейтов с сохранением порядка внутри одного чата
+    
+    Разные чаты обрабатываются параллельно (до max_concurrent_updates),
+    апдейты одного чата — строго по очереди.
+    
+    PTB занимает слот семафора до вызова do_process_update. Поэтому апдейт
+    чата, у которого обработка уже идет, не ждет на слоте, а встает в очередь
+    чата и сразу слот освобождает. Очередь разбирает ее голова в своем слоте:
+    один занятой чат держит не больше одного слота и не задерживает другие.
+    """
+    
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._chat_queues = {}
+    
+    async def do_process_update(self, update, coroutine):
+        key = None
+        if isinstance(update, Update):
+            if update.effective_chat:
+                key = update.effective_chat.id
+            elif update.effective_user:
+                key = update.effective_user.id
+        
+        if key is None:
+            await coroutine
+            return
+        
+        queue = self._chat_queues.get(key)
+        if queue is not None:
+            queue.append(coroutine)
+            return
+        
+        # Очередь чата живет, пока есть апдейты этого чата в обработке
+        queue = self._chat_queues[key] = deque()
+        try:
+            while True:
+                try:
+                    await coroutine
+                except Exception as e:
+                    # Ошибка одного апдейта не должна останавливать очередь чата
+                    logger.error(f"❌ Ошибка обработки апдейта чата {key}: {e}", exc_info=True)
+                if not queue:
+                    break
+                coroutine = queue.popleft()
+        finally:
+            self._chat_queues.pop(key, None)
+            # Отмена головы: оставшиеся апдейты уже не будут обработаны
+            while queue:
+                queue.popleft().close()
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        for queue in self._chat_queues.values():
+            while queue:
+                queue.popleft().close()
+        self._chat_queues.clear()
@@ -4,39 +4,167 @@ app/database.py
 """
 
 import os
+import re
+import gzip
+import json
+import time
+import queue
 import sqlite3
 import logging
-from datetime import datetime
+import threading
+from datetime import datetime, timezone
 from pathlib import Path
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+
+from app.faq_engine import normalize_text
 
 logger = logging.getLogger(__name__)
 
-DB_PATH = Path(__file__).parent.parent / "data" / "bot.db"
+DB_PATH = Path(os.getenv('DB_PATH') or Path(__file__).parent.parent / "data" / "bot.db")
+
+# Отложенная запись взаимодействий: размер очереди, размер пачки и период сброса (сек)
+INTERACTION_QUEUE_MAX = int(os.getenv('INTERACTION_QUEUE_MAX', 10000))
+INTERACTION_BATCH_SIZE = int(os.getenv('INTERACTION_BATCH_SIZE', 200))
+INTERACTION_FLUSH_INTERVAL = float(os.getenv('INTERACTION_FLUSH_INTERVAL', 1.0))
+# Запас сверх очереди при перегрузке: записи забирает писатель, сверх запаса они отбрасываются
+INTERACTION_OVERFLOW_MAX = int(os.getenv('INTERACTION_OVERFLOW_MAX', INTERACTION_QUEUE_MAX))
+
+# Счетчики пользователей копятся в памяти: период сброса в users (сек) и предел числа пользователей
+USER_FLUSH_INTERVAL = float(os.getenv('USER_FLUSH_INTERVAL', 10.0))
+USER_ACCUMULATOR_MAX = int(os.getenv('USER_ACCUMULATOR_MAX', 50000))
+# Жесткий предел (если сброс не успевает или падает): самые старые дельты отбрасываются
+USER_ACCUMULATOR_HARD_MAX = max(USER_ACCUMULATOR_MAX, int(os.getenv('USER_ACCUMULATOR_HARD_MAX', 2 * USER_ACCUMULATOR_MAX)))
+
+# Взаимодействия хранятся помесячно (interactions_ГГГГ_ММ); партиции старше
+# INTERACTIONS_RETENTION_MONTHS уходят в gzip JSONL-архив (0 — хранить все)
+INTERACTIONS_RETENTION_MONTHS = int(os.getenv('INTERACTIONS_RETENTION_MONTHS', 12))
+INTERACTIONS_ARCHIVE_DIR = os.getenv('INTERACTIONS_ARCHIVE_DIR')
+
+PARTITION_RE = re.compile(r'^interactions_(\d{4}_\d{2}|undated)$')
+# Строки без даты (из старой таблицы): в архив по сроку хранения не уходят
+UNDATED_PARTITION = 'interactions_undated'
+INTERACTION_COLUMNS = ('id', 'user_id', 'user_message', 'found', 'category', 'similarity_score', 'created_at')
 
-def get_db_connection():
-    """Получить соединение с БД"""
+# Настройки соединений SQLite
+DB_READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', 4))
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', 16384))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 64 * 1024 * 1024))
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+
+def get_db_connection(readonly: bool = False):
+    """
+    Открыть новое настроенное соединение с БД
+    
+    Обычно вместо него используются долгоживущие соединения
+    writer_connection() и read_connection().
+    """
     os.makedirs(DB_PATH.parent, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=256
+    )
     conn.row_factory = sqlite3.Row
+    
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA cache_size = {-DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    if readonly:
+        conn.execute('PRAGMA query_only = ON')
     return conn
 
+_writer_conn = None
+_writer_conn_lock = threading.RLock()
+
+_reader_pool = queue.LifoQueue()
+_readers_opened = 0
+_readers_lock = threading.Lock()
+_pool_generation = 0
+
+@contextmanager
+def writer_connection():
+    """Единственное долгоживущее соединение на запись (доступ сериализуется блокировкой)"""
+    global _writer_conn
+    
+    with _writer_conn_lock:
+        if _writer_conn is None:
+            _writer_conn = get_db_connection()
+        yield _writer_conn
+
+def _begin_write(conn):
+    """
+    Начать транзакцию записи сразу с блокировкой БД (BEGIN IMMEDIATE)
+    
+    В БД могут писать несколько процессов (веб-хук с --workers). Отложенная
+    транзакция, начатая с чтения, при повышении блокировки получает
+    SQLITE_BUSY без ожидания, а BEGIN IMMEDIATE ждет busy_timeout.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+
+@contextmanager
+def read_connection():
+    """
+    Соединение на чтение из небольшого пула
+    
+    В режиме WAL читатели не блокируют писателя и не ждут его.
+    """
+    global _readers_opened
+    
+    generation = _pool_generation
+    conn = None
+    try:
+        conn = _reader_pool.get_nowait()
+    except queue.Empty:
+        with _readers_lock:
+            if _readers_opened < DB_READ_POOL_SIZE:
+                _readers_opened += 1
+                conn = get_db_connection(readonly=True)
+        if conn is None:
+            conn = _reader_pool.get()
+    
+    try:
+        yield conn
+    finally:
+        # Соединения из закрытого пула не возвращаются
+        if generation == _pool_generation:
+            _reader_pool.put(conn)
+        else:
+            conn.close()
+
+def _close_connections():
+    """Закрыть соединение писателя и все соединения пула читателей"""
+    global _writer_conn, _readers_opened, _pool_generation
+    
+    with _writer_conn_lock:
+        if _writer_conn is not None:
+            _writer_conn.close()
+            _writer_conn = None
+        _known_partitions.clear()
+    
+    with _readers_lock:
+        _pool_generation += 1
+        while True:
+            try:
+                _reader_pool.get_nowait().close()
+            except queue.Empty:
+                break
+        _readers_opened = 0
+
 def init_database():
     """Инициализировать базу данных"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with writer_connection() as conn:
+        _create_schema(conn)
     
-    # Таблица взаимодействий
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS interactions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        user_message TEXT NOT NULL,
-        found BOOLEAN NOT NULL,
-        category TEXT,
-        similarity_score REAL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
+    logger.info("✅ База данных инициализирована")
+
+def _create_schema(conn):
+    """Создать таблицы, если их еще нет"""
+    cursor = conn.cursor()
     
     # Таблица пользователей
     cursor.execute('''
@@ -48,125 +176,854 @@ def init_database():
     )
     ''')
     
+    # Агрегаты для get_stats, обновляются в той же транзакции, что и взаимодействия
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS stats_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS category_counts (
+        category TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS question_counts (
+        normalized_question TEXT PRIMARY KEY,
+        sample_message TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    
+    # Сквозная нумерация взаимодействий: id уникален во всех партициях и в архиве
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS interaction_ids (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_id INTEGER NOT NULL
+    )
+    ''')
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_category_counts_count ON category_counts(count)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_question_counts_count ON question_counts(count)')
+    
     conn.commit()
-    conn.close()
     
-    logger.info("✅ База данных инициализирована")
+    # Помесячные партиции взаимодействий (старая общая таблица переносится в них)
+    _migrate_legacy_interactions(conn)
+    _seed_interaction_ids(conn)
+    with conn:
+        _begin_write(conn)
+        _ensure_partition(conn, _partition_name(_utc_now()))
+    
+    # Для существующей БД без агрегатов пересчитать их из сырых данных (флаг перепроверяется в транзакции)
+    built = cursor.execute("SELECT value FROM stats_counters WHERE name = 'rollups_built'").fetchone()
+    if built is None:
+        _rebuild_rollups(conn)
 
-def log_interaction(user_id: int, user_message: str, found: bool, category: str = None, similarity_score: float = 0):
-    """Логировать взаимодействие пользователя"""
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def _partition_name(created_at: str) -> str:
+    """Имя месячной партиции для времени вида 'ГГГГ-ММ-ДД ЧЧ:ММ:СС' (без даты — UNDATED_PARTITION)"""
+    name = f"interactions_{created_at[:4]}_{created_at[5:7]}" if created_at else UNDATED_PARTITION
+    return name if PARTITION_RE.match(name) else UNDATED_PARTITION
+
+def _list_partitions(conn) -> list:
+    """Имена партиций interactions в хронологическом порядке"""
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'interactions_%'")
+    return sorted(row[0] for row in rows if PARTITION_RE.match(row[0]))
+
+def _refresh_interactions_view(conn):
+    """Представление interactions поверх всех живых партиций (для отчетов и ручных запросов)"""
+    legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'interactions'").fetchone()
+    if legacy is not None:
+        # Идет перенос старой таблицы, представление создается после него
+        return
+    
+    partitions = _list_partitions(conn)
+    conn.execute('DROP VIEW IF EXISTS interactions')
+    if partitions:
+        conn.execute('CREATE VIEW interactions AS ' + ' UNION ALL '.join(f'SELECT * FROM {name}' for name in partitions))
+
+_known_partitions = set()
+
+def _ensure_partition(conn, name: str):
+    """Создать партицию, если ее еще нет (внутри открытой транзакции писателя)"""
+    if name in _known_partitions:
+        return
+    
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+    if not exists:
+        conn.execute(f'''
+        CREATE TABLE {name} (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            user_message TEXT NOT NULL,
+            found BOOLEAN NOT NULL,
+            category TEXT,
+            similarity_score REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        # Индексы для отчетов по сырым данным
+        conn.execute(f'CREATE INDEX idx_{name}_created_at ON {name}(created_at)')
+        conn.execute(f'CREATE INDEX idx_{name}_category ON {name}(category)')
+        conn.execute(f'CREATE INDEX idx_{name}_found ON {name}(found)')
+        # id выдаются из interaction_ids, а не AUTOINCREMENT партиции
+        _refresh_interactions_view(conn)
+        logger.info(f"🗂️  Создана партиция взаимодействий: {name}")
+    elif conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'interactions'").fetchone() is None:
+        _refresh_interactions_view(conn)
+    
+    _known_partitions.add(name)
+
+def _migrate_legacy_interactions(conn):
+    """
+    Перенести строки из общей таблицы interactions (до партиционирования) по месяцам
+    
+    id строк сохраняются. Строки без даты или с непонятной датой переносятся
+    в UNDATED_PARTITION.
+    """
+    legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'interactions'").fetchone()
+    if legacy is None:
+        return
+    
+    started = time.perf_counter()
+    with conn:
+        months = [row[0] for row in conn.execute('''
+        SELECT DISTINCT substr(created_at, 1, 7) FROM interactions WHERE created_at IS NOT NULL
+        ''')]
+        months = [month for month in months if _partition_name(month) != UNDATED_PARTITION]
+        for month in months:
+            name = _partition_name(month)
+            _ensure_partition(conn, name)
+            conn.execute(f'''
+            INSERT INTO {name} (id, user_id, user_message, found, category, similarity_score, created_at)
+            SELECT id, user_id, user_message, found, category, similarity_score, created_at
+            FROM interactions WHERE substr(created_at, 1, 7) = ? ORDER BY id
+            ''', (month,))
+        
+        undated = f"created_at IS NULL OR substr(created_at, 1, 7) NOT IN ({', '.join('?' * len(months))})"
+        count = conn.execute(f'SELECT COUNT(*) FROM interactions WHERE {undated}', months).fetchone()[0]
+        if count:
+            _ensure_partition(conn, UNDATED_PARTITION)
+            conn.execute(f'''
+            INSERT INTO {UNDATED_PARTITION} (id, user_id, user_message, found, category, similarity_score, created_at)
+            SELECT id, user_id, user_message, found, category, similarity_score, created_at
+            FROM interactions WHERE {undated} ORDER BY id
+            ''', months)
+            logger.warning(f"⚠️  Взаимодействий без даты: {count}, перенесены в {UNDATED_PARTITION}")
+        conn.execute('DROP TABLE interactions')
+        _refresh_interactions_view(conn)
+    
+    logger.info(f"🗂️  Взаимодействия разнесены по партициям: {len(months)} мес. за {time.perf_counter() - started:.1f} с")
+
+def _seed_interaction_ids(conn):
+    """Начать сквозную нумерацию после наибольшего id в партициях и архиве (один раз)"""
+    with conn:
+        _begin_write(conn)
+        if conn.execute('SELECT 1 FROM interaction_ids').fetchone() is not None:
+            return
+        
+        last_id = 0
+        for name in _list_partitions(conn):
+            last_id = max(last_id, conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {name}').fetchone()[0])
+        for path in _list_archives():
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    last_id = max(last_id, json.loads(line)['id'] or 0)
+        conn.execute('INSERT INTO interaction_ids (id, last_id) VALUES (1, ?)', (last_id,))
+
+def _archive_dir() -> Path:
+    return Path(INTERACTIONS_ARCHIVE_DIR) if INTERACTIONS_ARCHIVE_DIR else DB_PATH.parent / "archive"
+
+def _list_archives(live: set = ()) -> list:
+    """
+    Файлы архива партиций в хронологическом порядке
+    
+    Архив партиции из live пропускается: ее выгрузка не завершилась удалением
+    из БД, и строки посчитались бы дважды.
+    """
+    directory = _archive_dir()
+    if not directory.exists():
+        return []
+    return sorted(
+        path for path in directory.glob('interactions_*.jsonl.gz')
+        if path.name[:-len('.jsonl.gz')] not in live
+    )
+
+def _iter_archive(path: Path, chunk_size: int = 10000):
+    """Потоково прочитать архив партиции пачками записей в формате очереди записи"""
+    chunk = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            row = json.loads(line)
+            chunk.append((
+                row['user_id'], row['user_message'], row['found'],
+                row['category'], row['similarity_score'], row['created_at']
+            ))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+def _export_partition(name: str, path: Path, chunk_size: int = 10000) -> int:
+    """Выгрузить партицию в gzip JSONL потоково (через соединение на чтение); вернуть число строк"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    
+    count = 0
+    try:
+        with read_connection() as conn, gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            cursor = conn.execute(f'SELECT {", ".join(INTERACTION_COLUMNS)} FROM {name} ORDER BY id')
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    record = dict(zip(INTERACTION_COLUMNS, row))
+                    record['found'] = bool(record['found'])
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                count += len(rows)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    tmp_path.replace(path)
+    return count
+
+def iter_unanswered(chunk_size: int = 10000, include_archive: bool = True):
+    """
+    Потоково выдать тексты вопросов без ответа (found = 0) пачками
+    
+    Сначала читаются архивы партиций, затем живые партиции (отдельным
+    соединением только на чтение); в памяти одновременно одна пачка.
+    """
+    conn = get_db_connection(readonly=True)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Добавить взаимодействие
-        cursor.execute('''
-        INSERT INTO interactions (user_id, user_message, found, category, similarity_score)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, user_message, found, category, similarity_score))
-        
-        # Обновить информацию о пользователе
-        cursor.execute('''
-        INSERT OR IGNORE INTO users (user_id) VALUES (?)
-        ''', (user_id,))
-        
-        cursor.execute('''
-        UPDATE users 
-        SET last_interaction = CURRENT_TIMESTAMP, total_queries = total_queries + 1
-        WHERE user_id = ?
-        ''', (user_id,))
-        
-        conn.commit()
+        partitions = _list_partitions(conn)
+        if include_archive:
+            for path in _list_archives(live=set(partitions)):
+                for records in _iter_archive(path, chunk_size):
+                    chunk = [message for _, message, found, *_ in records if not found and message]
+                    if chunk:
+                        yield chunk
+        
+        for name in partitions:
+            cursor = conn.execute(f'SELECT user_message FROM {name} WHERE found = 0')
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                chunk = [row[0] for row in rows if row[0]]
+                if chunk:
+                    yield chunk
+    finally:
         conn.close()
+
+def archive_partitions(retention_months: int = None, now: datetime = None) -> list:
+    """
+    Перенести партиции старше срока хранения в архив и удалить их из БД
+    
+    Партиция удаляется, только если в архив попали все ее строки; иначе
+    архив удаляется, чтобы строки не посчитались дважды. Партиция строк
+    без даты не архивируется. Агрегаты статистики не меняются: они
+    считаются за все время.
+    
+    Returns:
+        Список архивированных партиций
+    """
+    retention = INTERACTIONS_RETENTION_MONTHS if retention_months is None else retention_months
+    if retention <= 0:
+        return []
+    
+    now = now or datetime.now(timezone.utc)
+    # Первый месяц, который еще хранится в БД (текущий месяц хранится всегда)
+    month_index = now.year * 12 + now.month - 1 - (retention - 1)
+    cutoff = f"interactions_{month_index // 12:04d}_{month_index % 12 + 1:02d}"
+    
+    with writer_connection() as conn:
+        expired = [name for name in _list_partitions(conn) if name < cutoff and name != UNDATED_PARTITION]
+    
+    archived = []
+    for name in expired:
+        started = time.perf_counter()
+        path = _archive_dir() / f"{name}.jsonl.gz"
+        try:
+            exported = _export_partition(name, path)
+            dropped = False
+            try:
+                with writer_connection() as conn:
+                    with conn:
+                        _begin_write(conn)
+                        current = conn.execute(f'SELECT COUNT(*) FROM {name}').fetchone()[0]
+                        if current == exported:
+                            conn.execute(f'DROP TABLE {name}')
+                            _refresh_interactions_view(conn)
+                    dropped = current == exported
+                    if dropped:
+                        _known_partitions.discard(name)
+            finally:
+                if not dropped:
+                    # Архив рядом с живой партицией задвоил бы ее строки при пересчете агрегатов
+                    path.unlink(missing_ok=True)
+            
+            if not dropped:
+                logger.warning(f"⚠️  Партиция {name} изменилась во время выгрузки, повтор при следующем запуске")
+                continue
+        except Exception as e:
+            logger.error(f"❌ Ошибка при архивировании {name}: {e}")
+            continue
+        
+        archived.append(name)
+        logger.info(f"📦 Партиция {name} архивирована: {exported} строк → {path} ({time.perf_counter() - started:.1f} с)")
+    
+    return archived
+
+def _apply_rollups(conn, records: list):
+    """Обновить агрегаты по пачке взаимодействий (внутри открытой транзакции)"""
+    found = 0
+    categories = {}
+    questions = {}
+    for _, user_message, is_found, category, _, _ in records:
+        if is_found:
+            found += 1
+        if category is not None:
+            categories[category] = categories.get(category, 0) + 1
+        
+        key = normalize_text(user_message)
+        sample, count = questions.get(key, (user_message, 0))
+        questions[key] = (sample, count + 1)
+    
+    conn.executemany('''
+    INSERT INTO stats_counters (name, value) VALUES (?, ?)
+    ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+    ''', [('total_queries', len(records)), ('found_answers', found)])
+    
+    conn.executemany('''
+    INSERT INTO category_counts (category, count) VALUES (?, ?)
+    ON CONFLICT(category) DO UPDATE SET count = count + excluded.count
+    ''', categories.items())
+    
+    conn.executemany('''
+    INSERT INTO question_counts (normalized_question, sample_message, count) VALUES (?, ?, ?)
+    ON CONFLICT(normalized_question) DO UPDATE SET count = count + excluded.count
+    ''', [(key, sample, count) for key, (sample, count) in questions.items()])
+
+def _rebuild_rollups(conn, chunk_size: int = 10000, force: bool = False):
+    """
+    Пересчитать агрегаты из архива и живых партиций (одной транзакцией)
+    
+    Вызывается и из _create_schema в каждом воркере: без force флаг rollups_built
+    перепроверяется уже под блокировкой записи, и пересчет выполняет только
+    первый успевший процесс.
+    """
+    started = time.perf_counter()
+    
+    with conn:
+        _begin_write(conn)
+        if not force and conn.execute("SELECT 1 FROM stats_counters WHERE name = 'rollups_built'").fetchone():
+            return
+        
+        conn.execute('DELETE FROM stats_counters')
+        conn.execute('DELETE FROM category_counts')
+        conn.execute('DELETE FROM question_counts')
+        
+        total = 0
+        for path in _list_archives(live=set(_list_partitions(conn))):
+            for chunk in _iter_archive(path, chunk_size):
+                _apply_rollups(conn, chunk)
+                total += len(chunk)
+        
+        # Нормализация делается в Python: lower() в SQLite не работает с кириллицей
+        for name in _list_partitions(conn):
+            cursor = conn.execute(f'''
+            SELECT user_id, user_message, found, category, similarity_score, created_at FROM {name}
+            ''')
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                _apply_rollups(conn, [tuple(row) for row in rows])
+                total += len(rows)
+        
+        unique_users = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        conn.executemany('''
+        INSERT INTO stats_counters (name, value) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET value = excluded.value
+        ''', [('unique_users', unique_users), ('rollups_built', 1)])
+    
+    logger.info(f"📊 Агрегаты статистики пересчитаны: {total} взаимодействий за {time.perf_counter() - started:.1f} с")
+
+def rebuild_rollups():
+    """Пересчитать агрегаты статистики из сырых данных interactions"""
+    flush_interactions()
+    with writer_connection() as conn:
+        _create_schema(conn)
+        _rebuild_rollups(conn, force=True)
+
+_write_queue = queue.Queue(maxsize=INTERACTION_QUEUE_MAX)
+_writer_thread = None
+_writer_lock = threading.Lock()
+_STOP = object()
+_FLUSH_USERS = object()
+
+_write_stats = {
+    'enqueued': 0,
+    'written': 0,
+    'batches': 0,
+    'failed': 0,
+    'overflow_writes': 0,
+    'dropped': 0,
+    'max_depth': 0,
+    'last_batch_size': 0,
+    'last_flush_ms': 0.0,
+    'user_flushes': 0,
+    'users_flushed': 0,
+    'user_flush_failed': 0,
+    'user_deltas_dropped': 0
+}
+
+# Счетчики меняют и писатель, и вызывающие потоки (log_interaction, накопитель)
+_write_stats_lock = threading.Lock()
+
+# Записи, не поместившиеся в очередь: их забирает писатель после очередной пачки
+_overflow = deque()
+_overflow_lock = threading.Lock()
+
+# Накопитель: user_id → [запросов, первое обращение, последнее обращение] в порядке появления
+_user_deltas = OrderedDict()
+_user_deltas_flushing = {}
+_user_deltas_lock = threading.Lock()
+_user_flush_lock = threading.Lock()
+# Коммит сброса и чтение get_user_stats: дельты видны либо в накопителе, либо в users
+_user_commit_lock = threading.Lock()
+_user_flush_requested = threading.Event()
+_user_flushed_at = time.monotonic()
+
+def _update_write_stats(**increments):
+    """Прибавить к счетчикам записи"""
+    with _write_stats_lock:
+        for name, value in increments.items():
+            _write_stats[name] += value
+
+def _write_batch(records: list):
+    """Записать пачку взаимодействий одной транзакцией (по месячным партициям)"""
+    started = time.perf_counter()
+    
+    try:
+        with writer_connection() as conn:
+            with conn:
+                _begin_write(conn)
+                
+                # Сквозные id выдаются в порядке записей пачки
+                last_id = conn.execute('SELECT last_id FROM interaction_ids').fetchone()[0]
+                conn.execute('UPDATE interaction_ids SET last_id = ?', (last_id + len(records),))
+                partitions = {}
+                for record_id, record in enumerate(records, last_id + 1):
+                    partitions.setdefault(_partition_name(record[5]), []).append((record_id, *record))
+                
+                for name, rows in partitions.items():
+                    _ensure_partition(conn, name)
+                    conn.executemany(f'''
+                    INSERT INTO {name} (id, user_id, user_message, found, category, similarity_score, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', rows)
+                
+                # Пользователи и unique_users обновляются отдельно, из накопителя (_flush_users)
+                _apply_rollups(conn, records)
         
-        logger.info(f"✅ Взаимодействие залогировано для пользователя {user_id}")
+        with _write_stats_lock:
+            _write_stats['written'] += len(records)
+            _write_stats['batches'] += 1
+            _write_stats['last_batch_size'] = len(records)
+            _write_stats['last_flush_ms'] = (time.perf_counter() - started) * 1000
+        logger.debug(f"✅ Записано взаимодействий: {len(records)}")
         
     except Exception as e:
+        _update_write_stats(failed=len(records))
         logger.error(f"❌ Ошибка при логировании: {e}")
 
-def get_user_stats(user_id: int) -> dict:
-    """Получить статистику пользователя"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+def _write_overflow():
+    """Записать накопившиеся сверх очереди записи (в потоке писателя)"""
+    with _overflow_lock:
+        records = list(_overflow)
+        _overflow.clear()
+    for i in range(0, len(records), INTERACTION_BATCH_SIZE):
+        _write_batch(records[i:i + INTERACTION_BATCH_SIZE])
+
+def _accumulate_user(user_id: int, created_at: str):
+    """Учесть запрос пользователя в накопителе (в БД попадет при следующем сбросе)"""
+    with _user_deltas_lock:
+        entry = _user_deltas.get(user_id)
+        if entry is not None:
+            entry[0] += 1
+            entry[2] = created_at
+            return
+        _user_deltas[user_id] = [1, created_at, created_at]
+        size = len(_user_deltas)
+        if size > USER_ACCUMULATOR_HARD_MAX:
+            _drop_oldest_user_deltas(_user_deltas)
+    
+    # Ограничение памяти: попросить писателя сбросить накопитель досрочно
+    if size >= USER_ACCUMULATOR_MAX and not _user_flush_requested.is_set():
+        _user_flush_requested.set()
+        try:
+            _write_queue.put_nowait(_FLUSH_USERS)
+        except queue.Full:
+            pass
+
+def _drop_oldest_user_deltas(deltas: OrderedDict):
+    """
+    Отбросить самые старые дельты сверх USER_ACCUMULATOR_HARD_MAX (под _user_deltas_lock)
+    
+    Сами взаимодействия остаются в партициях; теряются только счетчики в users.
+    """
+    dropped = len(deltas) - USER_ACCUMULATOR_HARD_MAX
+    if dropped <= 0:
+        return
+    for _ in range(dropped):
+        deltas.popitem(last=False)
+    with _write_stats_lock:
+        first = not _write_stats['user_deltas_dropped']
+        _write_stats['user_deltas_dropped'] += dropped
+    if first:
+        logger.warning(f"⚠️  Накопитель пользователей переполнен ({USER_ACCUMULATOR_HARD_MAX}), старые счетчики отбрасываются")
+
+def _flush_users():
+    """Сбросить накопленные счетчики пользователей в users одним пакетным UPSERT"""
+    global _user_deltas, _user_deltas_flushing, _user_flushed_at
+    
+    with _user_flush_lock:
+        with _user_deltas_lock:
+            _user_flush_requested.clear()
+            _user_flushed_at = time.monotonic()
+            if not _user_deltas:
+                return
+            # До коммита дельты остаются видны get_user_stats через _user_deltas_flushing
+            deltas = _user_deltas_flushing = _user_deltas
+            _user_deltas = OrderedDict()
         
-        cursor.execute('''
-        SELECT * FROM users WHERE user_id = ?
-        ''', (user_id,))
+        try:
+            user_ids = list(deltas)
+            with writer_connection() as conn:
+                with conn:
+                    _begin_write(conn)
+                    # Сколько пользователей уже есть — для счетчика unique_users
+                    existing = 0
+                    for i in range(0, len(user_ids), 500):
+                        chunk = user_ids[i:i + 500]
+                        existing += conn.execute(
+                            f'SELECT COUNT(*) FROM users WHERE user_id IN ({",".join("?" * len(chunk))})',
+                            chunk
+                        ).fetchone()[0]
+                    
+                    conn.executemany('''
+                    INSERT INTO users (user_id, first_interaction, last_interaction, total_queries)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        last_interaction = max(last_interaction, excluded.last_interaction),
+                        total_queries = total_queries + excluded.total_queries
+                    ''', [(user_id, first, last, count) for user_id, (count, first, last) in deltas.items()])
+                    
+                    conn.execute('''
+                    INSERT INTO stats_counters (name, value) VALUES ('unique_users', ?)
+                    ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+                    ''', (len(user_ids) - existing,))
+                    
+                    with _user_commit_lock:
+                        conn.commit()
+                        with _user_deltas_lock:
+                            _user_deltas_flushing = {}
+            
+            _update_write_stats(user_flushes=1, users_flushed=len(user_ids))
+            logger.debug(f"✅ Сброшены счетчики пользователей: {len(user_ids)}")
         
-        row = cursor.fetchone()
-        conn.close()
+        except Exception as e:
+            _update_write_stats(user_flush_failed=1)
+            logger.error(f"❌ Ошибка при сбросе счетчиков пользователей: {e}")
+            
+            # Вернуть дельты в накопитель (они старше новых), чтобы попробовать при следующем сбросе
+            with _user_deltas_lock:
+                merged = deltas
+                for user_id, (count, first, last) in _user_deltas.items():
+                    entry = merged.get(user_id)
+                    if entry is None:
+                        merged[user_id] = [count, first, last]
+                    else:
+                        entry[0] += count
+                        entry[2] = last
+                _drop_oldest_user_deltas(merged)
+                _user_deltas = merged
+                _user_deltas_flushing = {}
+        finally:
+            with _user_deltas_lock:
+                _user_deltas_flushing = {}
+
+def _user_flush_due() -> bool:
+    return _user_flush_requested.is_set() or time.monotonic() - _user_flushed_at >= USER_FLUSH_INTERVAL
+
+def _writer_loop():
+    """Фоновый писатель: копит записи до размера пачки или таймаута и сбрасывает их"""
+    stopping = False
+    while not stopping:
+        try:
+            item = _write_queue.get(timeout=max(0.0, _user_flushed_at + USER_FLUSH_INTERVAL - time.monotonic()))
+        except queue.Empty:
+            _flush_users()
+            continue
+        
+        batch = []
+        waiters = []
+        deadline = time.monotonic() + INTERACTION_FLUSH_INTERVAL
+        
+        while True:
+            if item is _STOP:
+                stopping = True
+                break
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+                break
+            if item is _FLUSH_USERS:
+                break
+            
+            batch.append(item)
+            if len(batch) >= INTERACTION_BATCH_SIZE:
+                break
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = _write_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+        
+        if batch:
+            _write_batch(batch)
+        if _overflow:
+            _write_overflow()
+        if waiters or _user_flush_due():
+            _flush_users()
+        for waiter in waiters:
+            waiter.set()
+    
+    # Дописать все, что осталось в очереди
+    batch = []
+    while True:
+        try:
+            item = _write_queue.get_nowait()
+        except queue.Empty:
+            break
+        if isinstance(item, threading.Event):
+            item.set()
+        elif item is not _STOP and item is not _FLUSH_USERS:
+            batch.append(item)
+    if batch:
+        _write_batch(batch)
+    _write_overflow()
+    _flush_users()
+
+def _ensure_writer():
+    """Запустить фоновый писатель, если он еще не запущен"""
+    global _writer_thread
+    
+    if _writer_thread is not None and _writer_thread.is_alive():
+        return
+    with _writer_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = threading.Thread(target=_writer_loop, name="interaction-writer", daemon=True)
+            _writer_thread.start()
+
+def log_interaction(user_id: int, user_message: str, found: bool, category: str = None, similarity_score: float = 0):
+    """
+    Логировать взаимодействие пользователя
+    
+    Запись только ставится в очередь; в БД ее пачками сбрасывает фоновый писатель.
+    Вызывающий (event loop) никогда не ждет БД: если очередь переполнена, запись
+    уходит писателю через ограниченный запас (INTERACTION_OVERFLOW_MAX), а сверх
+    него отбрасывается и учитывается в счетчике dropped.
+    Счетчики пользователя копятся в памяти и сбрасываются в users раз в USER_FLUSH_INTERVAL.
+    """
+    _ensure_writer()
+    
+    created_at = _utc_now()
+    record = (user_id, user_message, found, category, similarity_score, created_at)
+    _accumulate_user(user_id, created_at)
+    
+    try:
+        _write_queue.put_nowait(record)
+    except queue.Full:
+        with _overflow_lock:
+            accepted = len(_overflow) < INTERACTION_OVERFLOW_MAX
+            if accepted:
+                _overflow.append(record)
+        with _write_stats_lock:
+            if accepted:
+                _write_stats['overflow_writes'] += 1
+            else:
+                _write_stats['dropped'] += 1
+            dropped = _write_stats['dropped']
+        if not accepted and dropped % 1000 == 1:
+            logger.warning(f"⚠️  Очередь логирования и запас переполнены, отброшено записей: {dropped}")
+        return
+    
+    depth = _write_queue.qsize()
+    with _write_stats_lock:
+        _write_stats['enqueued'] += 1
+        if depth > _write_stats['max_depth']:
+            _write_stats['max_depth'] = depth
+
+def flush_interactions(timeout: float = 10.0) -> bool:
+    """Дождаться записи всех поставленных в очередь взаимодействий и счетчиков пользователей"""
+    if _writer_thread is None or not _writer_thread.is_alive():
+        _write_overflow()
+        _flush_users()
+        return True
+    
+    done = threading.Event()
+    _write_queue.put(done)
+    return done.wait(timeout)
+
+def get_write_queue_stats() -> dict:
+    """Метрики очереди записи (глубина, пропускная способность, обратное давление)"""
+    with _write_stats_lock:
+        stats = dict(_write_stats)
+    stats['depth'] = _write_queue.qsize()
+    stats['overflow_depth'] = len(_overflow)
+    stats['capacity'] = INTERACTION_QUEUE_MAX
+    stats['writer_alive'] = _writer_thread is not None and _writer_thread.is_alive()
+    stats['users_pending'] = len(_user_deltas) + len(_user_deltas_flushing)
+    return stats
+
+def get_user_stats(user_id: int) -> dict:
+    """Получить статистику пользователя (с учетом еще не сброшенных счетчиков)"""
+    try:
+        # Короткая блокировка коммита сброса: дельты и строка users читаются согласованно
+        with _user_commit_lock:
+            with _user_deltas_lock:
+                pending = [tuple(d) for d in (_user_deltas_flushing.get(user_id), _user_deltas.get(user_id)) if d]
+            
+            with read_connection() as conn:
+                row = conn.execute('''
+                SELECT * FROM users WHERE user_id = ?
+                ''', (user_id,)).fetchone()
         
+        stats = None
         if row:
-            return {
+            stats = {
                 'user_id': row['user_id'],
                 'first_interaction': row['first_interaction'],
                 'last_interaction': row['last_interaction'],
                 'total_queries': row['total_queries']
             }
-        return None
+        
+        for count, first, last in pending:
+            if stats is None:
+                stats = {'user_id': user_id, 'first_interaction': first, 'last_interaction': last, 'total_queries': 0}
+            stats['total_queries'] += count
+            stats['last_interaction'] = max(stats['last_interaction'] or last, last)
+        
+        return stats
         
     except Exception as e:
         logger.error(f"❌ Ошибка при получении статистики: {e}")
         return None
 
 def get_stats() -> dict:
-    """Получить общую статистику"""
+    """Получить общую статистику (из агрегатов, без сканирования interactions)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Общее количество запросов
-        cursor.execute('SELECT COUNT(*) as total FROM interactions')
-        total_queries = cursor.fetchone()['total']
-        
-        # Количество успешных ответов
-        cursor.execute('SELECT COUNT(*) as found FROM interactions WHERE found = 1')
-        found_answers = cursor.fetchone()['found']
-        
-        # Количество уникальных пользователей
-        cursor.execute('SELECT COUNT(DISTINCT user_id) as users FROM users')
-        unique_users = cursor.fetchone()['users']
-        
-        # Процент успешности
-        success_rate = (found_answers / total_queries * 100) if total_queries > 0 else 0
-        
-        # Топ вопросов
-        cursor.execute('''
-        SELECT user_message, COUNT(*) as count 
-        FROM interactions 
-        GROUP BY user_message 
-        ORDER BY count DESC 
-        LIMIT 10
-        ''')
-        top_questions = [{'question': row['user_message'], 'count': row['count']} for row in cursor.fetchall()]
-        
-        # Топ категорий
-        cursor.execute('''
-        SELECT category, COUNT(*) as count 
-        FROM interactions 
-        WHERE category IS NOT NULL
-        GROUP BY category 
-        ORDER BY count DESC 
-        LIMIT 10
-        ''')
-        top_categories = [{'category': row['category'], 'count': row['count']} for row in cursor.fetchall()]
-        
-        conn.close()
-        
-        return {
-            'total_queries': total_queries,
-            'found_answers': found_answers,
-            'unique_users': unique_users,
-            'success_rate': success_rate,
-            'top_questions': top_questions,
-            'top_categories': top_categories
-        }
+        with read_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT name, value FROM stats_counters')
+            counters = {row['name']: row['value'] for row in cursor.fetchall()}
+            
+            # Общее количество запросов
+            total_queries = counters.get('total_queries', 0)
+            
+            # Количество успешных ответов
+            found_answers = counters.get('found_answers', 0)
+            
+            # Количество уникальных пользователей
+            unique_users = counters.get('unique_users', 0)
+            
+            # Процент успешности
+            success_rate = (found_answers / total_queries * 100) if total_queries > 0 else 0
+            
+            # Топ вопросов (по нормализованному тексту)
+            cursor.execute('''
+            SELECT sample_message, count 
+            FROM question_counts 
+            ORDER BY count DESC 
+            LIMIT 10
+            ''')
+            top_questions = [{'question': row['sample_message'], 'count': row['count']} for row in cursor.fetchall()]
+            
+            # Топ категорий
+            cursor.execute('''
+            SELECT category, count 
+            FROM category_counts 
+            ORDER BY count DESC 
+            LIMIT 10
+            ''')
+            top_categories = [{'category': row['category'], 'count': row['count']} for row in cursor.fetchall()]
+            
+            return {
+                'total_queries': total_queries,
+                'found_answers': found_answers,
+                'unique_users': unique_users,
+                'success_rate': success_rate,
+                'top_questions': top_questions,
+                'top_categories': top_categories
+            }
         
     except Exception as e:
         logger.error(f"❌ Ошибка при получении статистики: {e}")
         return {}
 
-def close_database():
-    """Закрыть БД (вызывается при остановке приложения)"""
+def close_database(timeout: float = 10.0):
+    """Закрыть БД (вызывается при остановке приложения): дописать очередь и счетчики пользователей"""
+    global _writer_thread
+    
+    if _writer_thread is not None and _writer_thread.is_alive():
+        _write_queue.put(_STOP)
+        _writer_thread.join(timeout)
+        if _writer_thread.is_alive():
+            logger.warning(f"⚠️  Писатель не успел сбросить очередь: {_write_queue.qsize()} записей")
+    _writer_thread = None
+    
+    # Счетчики пользователей, накопленные после остановки писателя (или если он не успел)
+    _flush_users()
+    
+    _close_connections()
     logger.info("📊 База данных закрыта")
+
+
+if __name__ == '__main__':
+    import argparse
+    
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    
+    parser = argparse.ArgumentParser(description='Обслуживание БД SberMobile Bot')
+    parser.add_argument('--rebuild-stats', action='store_true', help='Пересчитать агрегаты статистики из interactions')
+    parser.add_argument('--archive', action='store_true', help='Архивировать партиции старше срока хранения')
+    parser.add_argument('--retention-months', type=int, help='Срок хранения партиций (по умолчанию INTERACTIONS_RETENTION_MONTHS)')
+    args = parser.parse_args()
+    
+    init_database()
+    if args.archive:
+        archive_partitions(args.retention_months)
+    if args.rebuild_stats:
+        rebuild_rollups()
+    close_database()
@@ -0,0 +1,331 @@
+"""
+app/fake_telegram.py
+Локальная замена Telegram Bot API для нагрузочных тестов (aiohttp)
+
+Отдает апдейты через getUpdates (polling) или сам отправляет их на адрес,
+заданный через setWebhook. Ответы бота (sendMessage, sendChatAction)
+записываются и сопоставляются с отправленными сообщениями по чату.
+С flood_limit сервер, как Telegram, отвечает 429 на sendMessage сверх
+заданного числа сообщений в секунду.
+
+Бот направляется сюда переменной TELEGRAM_API_BASE_URL, например
+http://127.0.0.1:8081/bot
+"""
+
+import json
+import time
+import asyncio
+import logging
+import itertools
+from collections import deque
+
+from aiohttp import web, ClientSession, ClientTimeout, TCPConnector
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {
+    'id': 100000001,
+    'is_bot': True,
+    'first_name': 'SberMobile Support Bot',
+    'username': 'fake_sbermobile_bot',
+    'can_join_groups': False,
+    'can_read_all_group_messages': False,
+    'supports_inline_queries': False
+}
+
+# Параметры, которые PTB передает как JSON внутри form-data
+JSON_PARAMS = {'allowed_updates', 'reply_markup', 'entities', 'commands', 'reply_parameters'}
+
+class FloodWait(Exception):
+    """Ответ 429 с retry_after (флуд-контроль Telegram)"""
+    
+    def __init__(self, retry_after: int):
+        super().__init__(f"retry after {retry_after}")
+        self.retry_after = retry_after
+
+class FakeTelegramServer:
+    """
+    Поддельный Bot API
+    
+    inject() ставит сообщение пользователя в очередь апдейтов и возвращает
+    future, который завершается временем ответа бота в этот чат (ответы
+    внутри чата приходят по порядку, так как бот сохраняет порядок в чате).
+    """
+    
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, webhook_connections: int = 40,
+                 flood_limit: int = None):
+        self.host = host
+        self.port = port
+        self.webhook_connections = webhook_connections
+        self.flood_limit = flood_limit
+        
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.ready = asyncio.Event()
+        
+        self._updates = deque()
+        self._updates_event = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._pending_replies = {}
+        self._webhook_queue = None
+        self._webhook_tasks = []
+        self._session = None
+        self._runner = None
+        self._flood_window = [0, 0]
+        
+        self.stats = {
+            'injected': 0,
+            'get_updates': 0,
+            'webhook_posts': 0,
+            'webhook_errors': 0,
+            'send_message': 0,
+            'send_chat_action': 0,
+            'unmatched_replies': 0,
+            'flood_rejected': 0,
+            'other_calls': 0
+        }
+    
+    @property
+    def base_url(self) -> str:
+        """Значение для TELEGRAM_API_BASE_URL"""
+        return f"http://{self.host}:{self.port}/bot"
+    
+    async def start(self):
+        """Поднять HTTP-сервер (port=0 — свободный порт)"""
+        app = web.Application()
+        app.router.add_route('*', '/bot{token}/{method}', self._handle_api)
+        app.router.add_post('/_inject', self._handle_inject)
+        
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        
+        logger.info(f"🧪 Поддельный Bot API: {self.base_url}")
+    
+    async def stop(self):
+        """Остановить сервер и отправку веб-хуков"""
+        for task in self._webhook_tasks:
+            task.cancel()
+        await asyncio.gather(*self._webhook_tasks, return_exceptions=True)
+        self._webhook_tasks = []
+        if self._session:
+            await self._session.close()
+            self._session = None
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+    
+    def inject(self, chat_id: int, text: str, first_name: str = 'Тест') -> asyncio.Future:
+        """Отправить боту сообщение от пользователя; future → задержка ответа (сек)"""
+        update_id = next(self._update_ids)
+        sent_at = time.perf_counter()
+        update = {
+            'update_id': update_id,
+            'message': {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private', 'first_name': first_name},
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': first_name, 'language_code': 'ru'},
+                'text': text
+            }
+        }
+        
+        future = asyncio.get_running_loop().create_future()
+        self._pending_replies.setdefault(chat_id, deque()).append((sent_at, future))
+        self.stats['injected'] += 1
+        
+        if self._webhook_queue is not None:
+            self._webhook_queue.put_nowait(update)
+        else:
+            self._updates.append(update)
+            self._updates_event.set()
+        return future
+    
+    def pending(self) -> int:
+        """Сколько сообщений еще ждут ответа"""
+        return sum(len(items) for items in self._pending_replies.values())
+    
+    async def _handle_inject(self, request):
+        """Ручная отправка сообщения: POST /_inject {"chat_id": ..., "text": ...}"""
+        data = await request.json()
+        self.inject(int(data['chat_id']), data['text'])
+        return web.json_response({'ok': True})
+    
+    async def _params(self, request) -> dict:
+        """Параметры вызова: JSON или form-data (значения-объекты в JSON, как шлет PTB)"""
+        if request.content_type == 'application/json':
+            return await request.json()
+        
+        params = {}
+        form = await request.post() if request.body_exists else request.query
+        for key, value in form.items():
+            if key in JSON_PARAMS and isinstance(value, str):
+                value = json.loads(value)
+            params[key] = value
+        return params
+    
+    async def _handle_api(self, request):
+        method = request.match_info['method']
+        params = await self._params(request)
+        handler = getattr(self, f"_api_{method.lower()}", None)
+        
+        if handler is None:
+            self.stats['other_calls'] += 1
+            result = True
+        else:
+            try:
+                result = await handler(params)
+            except FloodWait as e:
+                return web.json_response({
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f"Too Many Requests: retry after {e.retry_after}",
+                    'parameters': {'retry_after': e.retry_after}
+                }, status=429)
+        return web.json_response({'ok': True, 'result': result})
+    
+    async def _api_getme(self, params):
+        return BOT_USER
+    
+    async def _api_getupdates(self, params):
+        self.stats['get_updates'] += 1
+        self.ready.set()
+        
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+        
+        if not self._updates and timeout > 0:
+            self._updates_event.clear()
+            try:
+                await asyncio.wait_for(self._updates_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        
+        return list(itertools.islice(self._updates, limit))
+    
+    async def _api_setwebhook(self, params):
+        self.webhook_url = params['url']
+        self.webhook_secret = params.get('secret_token')
+        
+        if self._webhook_queue is None:
+            self._webhook_queue = asyncio.Queue()
+            self._session = ClientSession(
+                connector=TCPConnector(limit=self.webhook_connections),
+                timeout=ClientTimeout(total=30)
+            )
+            self._webhook_tasks = [
+                asyncio.create_task(self._webhook_sender()) for _ in range(self.webhook_connections)
+            ]
+            # Апдейты, накопленные до установки веб-хука
+            while self._updates:
+                self._webhook_queue.put_nowait(self._updates.popleft())
+        
+        logger.info(f"🧪 Веб-хук установлен: {self.webhook_url}")
+        self.ready.set()
+        return True
+    
+    async def _api_deletewebhook(self, params):
+        # Режим polling: веб-хук не используется
+        return True
+    
+    async def _api_getwebhookinfo(self, params):
+        return {'url': self.webhook_url or '', 'has_custom_certificate': False, 'pending_update_count': 0}
+    
+    async def _webhook_sender(self):
+        """Отправка апдейтов на веб-хук (как Telegram: несколько параллельных соединений)"""
+        headers = {}
+        if self.webhook_secret:
+            headers['X-Telegram-Bot-Api-Secret-Token'] = self.webhook_secret
+        
+        while True:
+            update = await self._webhook_queue.get()
+            try:
+                async with self._session.post(self.webhook_url, json=update, headers=headers) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        raise RuntimeError(f"HTTP {response.status}")
+                self.stats['webhook_posts'] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats['webhook_errors'] += 1
+                logger.warning(f"⚠️  Веб-хук не принял апдейт {update['update_id']}: {e}")
+                await asyncio.sleep(0.1)
+                self._webhook_queue.put_nowait(update)
+    
+    def _check_flood(self):
+        """Не больше flood_limit сообщений за текущую секунду"""
+        if not self.flood_limit:
+            return
+        second = int(time.monotonic())
+        if self._flood_window[0] != second:
+            self._flood_window = [second, 0]
+        self._flood_window[1] += 1
+        if self._flood_window[1] > self.flood_limit:
+            self.stats['flood_rejected'] += 1
+            raise FloodWait(1)
+    
+    async def _api_sendmessage(self, params):
+        self._check_flood()
+        self.stats['send_message'] += 1
+        chat_id = int(params['chat_id'])
+        
+        pending = self._pending_replies.get(chat_id)
+        if pending:
+            sent_at, future = pending.popleft()
+            if not pending:
+                del self._pending_replies[chat_id]
+            if not future.done():
+                future.set_result(time.perf_counter() - sent_at)
+        else:
+            self.stats['unmatched_replies'] += 1
+        
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', '')
+        }
+    
+    async def _api_sendchataction(self, params):
+        self.stats['send_chat_action'] += 1
+        return True
+
+async def _serve(host: str, port: int, flood_limit: int = None):
+    server = FakeTelegramServer(host, port, flood_limit=flood_limit)
+    await server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+def main():
+    """Запустить поддельный Bot API отдельно (сообщения — через POST /_inject)"""
+    import argparse
+    
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    
+    parser = argparse.ArgumentParser(description='Поддельный Telegram Bot API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--flood-limit', type=int, help='Отвечать 429 сверх стольких sendMessage в секунду')
+    args = parser.parse_args()
+    
+    try:
+        asyncio.run(_serve(args.host, args.port, args.flood_limit))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -3,11 +3,24 @@ app/faq_engine.py
 Логика поиска по FAQ
 """
 
-import logging
+import os
+import re
+import sys
 import json
+import hashlib
+import heapq
+import itertools
+import time
+import logging
+import threading
 from pathlib import Path
+from collections import OrderedDict
 from difflib import SequenceMatcher
 
+from app.spelling import SpellIndex
+from app.faq_snapshot import open_snapshot, write_snapshot
+from app.profiling import annotate
+
 logger = logging.getLogger(__name__)
 
 # Стандартная база FAQ для демо
@@ -109,9 +122,81 @@ DEFAULT_FAQ = [
     }
 ]
 
-def load_faq():
+FAQ_PATH = Path(os.getenv('FAQ_PATH') or Path(__file__).parent.parent / "data" / "faq.json")
+
+# Именованные базы знаний (бренды, языки): data/bases/<имя>.json в формате DEFAULT_FAQ.
+# База "default" — это FAQ_PATH (или DEFAULT_FAQ); остальные загружаются при первом обращении
+FAQ_BASES_DIR = Path(os.getenv('FAQ_BASES_DIR') or Path(__file__).parent.parent / "data" / "bases")
+DEFAULT_BASE = 'default'
+BASE_NAME_RE = re.compile(r'^[\w-]+$')
+
+def _base_mapping(value: str) -> dict:
+    """Разобрать привязки "ключ=база,..." из переменной окружения"""
+    return dict(item.split('=', 1) for item in value.replace(' ', '').split(',') if '=' in item)
+
+# Выбор базы: по чату ("-100123=brand2,...") и по языку пользователя ("en=sbermobile_en,...").
+# Язык сравнивается без учета регистра, имя базы остается как есть: это имя файла
+FAQ_CHAT_BASES = _base_mapping(os.getenv('FAQ_CHAT_BASES', ''))
+FAQ_LANGUAGE_BASES = {
+    language.lower(): base for language, base in _base_mapping(os.getenv('FAQ_LANGUAGE_BASES', '')).items()
+}
+
+# Общий бюджет памяти загруженных баз (МБ): сверх него вытесняются давно не используемые
+FAQ_MEMORY_BUDGET_MB = float(os.getenv('FAQ_MEMORY_BUDGET_MB', 256))
+
+# Как часто (в секундах) проверять, не изменился ли faq.json на диске
+FAQ_RELOAD_CHECK_INTERVAL = float(os.getenv('FAQ_RELOAD_CHECK_INTERVAL', 5))
+
+# Сколько кандидатов из n-граммного индекса переранжируется через SequenceMatcher
+FAQ_SHORTLIST_SIZE = int(os.getenv('FAQ_SHORTLIST_SIZE', 100))
+
+# Длина символьных n-грамм для инвертированного индекса
+NGRAM_SIZE = 3
+
+# Сколько разных запросов пакетный поиск (find_answers) помнит, чтобы не искать повторы заново
+FAQ_BATCH_MEMO_SIZE = int(os.getenv('FAQ_BATCH_MEMO_SIZE', 10000))
+
+# Сколько ячеек (запросы × вопросы) в блоке матрицы пересечений n-грамм пакетного поиска
+FAQ_BATCH_BLOCK_CELLS = int(os.getenv('FAQ_BATCH_BLOCK_CELLS', 2000000))
+
+# Сходство, при котором поиск в категории из сессии пользователя завершается без полного поиска
+FAQ_CATEGORY_STOP_SCORE = float(os.getenv('FAQ_CATEGORY_STOP_SCORE', 0.75))
+
+# Кэш ответов: максимум записей, примерный объем в байтах и время жизни (0 — без TTL)
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 4096))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv('ANSWER_CACHE_MAX_BYTES', 4 * 1024 * 1024))
+ANSWER_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', 3600))
+
+# Примерные накладные расходы на одну запись кэша (ключ, кортеж записи); dict результата считается отдельно
+_CACHE_ENTRY_OVERHEAD = 256
+
+def base_path(base: str = DEFAULT_BASE) -> Path:
+    """Файл базы знаний"""
+    return FAQ_PATH if base == DEFAULT_BASE else FAQ_BASES_DIR / f"{base}.json"
+
+def list_bases() -> list:
+    """Установленные базы знаний (default всегда есть)"""
+    try:
+        names = sorted(path.stem for path in FAQ_BASES_DIR.glob('*.json') if BASE_NAME_RE.match(path.stem))
+    except OSError:
+        names = []
+    return [DEFAULT_BASE] + [name for name in names if name != DEFAULT_BASE]
+
+def resolve_base(chat_id=None, language_code: str = None) -> str:
+    """Какая база отвечает чату: сначала привязка чата, затем язык пользователя"""
+    base = FAQ_CHAT_BASES.get(str(chat_id)) if chat_id is not None else None
+    if base is None and language_code:
+        base = FAQ_LANGUAGE_BASES.get(language_code.split('-')[0].lower())
+    return base or DEFAULT_BASE
+
+def load_faq(base: str = DEFAULT_BASE):
     """Загрузить FAQ из файла или использовать стандартную базу"""
-    faq_path = Path(__file__).parent.parent / "data" / "faq.json"
+    faq_path = base_path(base)
+    
+    if base != DEFAULT_BASE:
+        # У именованной базы нет запасного варианта: ошибка обрабатывается выше
+        with open(faq_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
     
     if faq_path.exists():
         try:
@@ -134,59 +219,617 @@ def calculate_similarity(text1: str, text2: str) -> float:
     text2 = normalize_text(text2)
     return SequenceMatcher(None, text1, text2).ratio()
 
-def find_answer(user_query: str, threshold: float = 0.5) -> dict:
+def text_ngrams(text: str, n: int = NGRAM_SIZE) -> set:
+    """Множество символьных n-грамм нормализованного текста (с границами слова)"""
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+class FaqIndex:
+    """
+    Скомпилированная база FAQ
+    
+    Хранит уже нормализованные вопросы, ответы и список категорий,
+    чтобы при обработке сообщения не было ни чтения файла, ни повторной нормализации.
+    """
+    
+    def __init__(self, faq: list, signature: tuple = None, version: int = 0):
+        self.signature = signature
+        self.version = version
+        self.categories = []
+        self.entry_categories = []
+        self.questions = []
+        self.answers = []
+        self.normalized = []
+        self.exact = {}
+        self.ngram_counts = []
+        self.postings = {}
+        self._category_members = None
+        self._memory_bytes = None
+        self.name = DEFAULT_BASE
+        self.extras = {}
+        
+        for category_data in faq:
+            category = category_data['category']
+            self.categories.append(category)
+            
+            for q_data in category_data.get('questions', []):
+                self.entry_categories.append(category)
+                self.questions.append(q_data['question'])
+                self.answers.append(q_data['answer'])
+                self.normalized.append(normalize_text(q_data['question']))
+        
+        # Инвертированный индекс: n-грамма → номера вопросов
+        for idx, question in enumerate(self.normalized):
+            self.exact.setdefault(question, idx)
+            grams = text_ngrams(question)
+            self.ngram_counts.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(idx)
+        
+        # Словарь для исправления опечаток в запросах
+        self.speller = SpellIndex(self.normalized)
+    
+    @classmethod
+    def from_snapshot(cls, tables: dict, signature: tuple = None, version: int = 0) -> 'FaqIndex':
+        """Индекс поверх отображенного в память снимка (строки читаются лениво)"""
+        index = cls.__new__(cls)
+        index.signature = signature
+        index.version = version
+        index.categories = tables['categories']
+        index.entry_categories = tables['entry_categories']
+        index.questions = tables['questions']
+        index.answers = tables['answers']
+        index.normalized = tables['normalized']
+        index.exact = tables['exact']
+        index.ngram_counts = tables['ngram_counts']
+        index.postings = tables['postings']
+        index._category_members = None
+        # Снимок отображен в память: оценка сверху — его размер
+        index._memory_bytes = tables['size']
+        index.name = DEFAULT_BASE
+        index.extras = {}
+        index.speller = SpellIndex.from_tables(tables['frequency'], tables['deletes'], tables['max_word_length'])
+        return index
+    
+    def shortlist(self, query: str, limit: int = None) -> list:
+        """
+        Отобрать кандидатов по пересечению n-грамм с запросом
+        
+        Возвращает номера вопросов в исходном порядке FAQ, чтобы при равном
+        сходстве выигрывал тот же вопрос, что и при полном переборе.
+        """
+        limit = limit or FAQ_SHORTLIST_SIZE
+        if len(self) <= limit:
+            return range(len(self))
+        
+        query_grams = text_ngrams(query)
+        overlaps = {}
+        for gram in query_grams:
+            for idx in self.postings.get(gram, ()):
+                overlaps[idx] = overlaps.get(idx, 0) + 1
+        
+        # Коэффициент Дайса по n-граммам
+        query_size = len(query_grams)
+        counts = self.ngram_counts
+        best = heapq.nlargest(
+            limit, overlaps,
+            key=lambda idx: overlaps[idx] / (query_size + counts[idx])
+        )
+        return sorted(best)
+    
+    def category_candidates(self, category: str, query: str) -> list:
+        """
+        Кандидаты из одной категории (в исходном порядке FAQ)
+        
+        Небольшая категория перебирается целиком, большая — через shortlist.
+        Номера вопросов по категориям строятся лениво при первом вызове.
+        """
+        if self._category_members is None:
+            members = {}
+            for idx, entry_category in enumerate(self.entry_categories):
+                members.setdefault(entry_category, []).append(idx)
+            self._category_members = members
+        
+        members = self._category_members.get(category)
+        if not members or len(members) <= FAQ_SHORTLIST_SIZE:
+            return members or []
+        return [idx for idx in self.shortlist(query) if self.entry_categories[idx] == category]
+    
+    def memory_bytes(self) -> int:
+        """
+        Примерный объем памяти индекса (для бюджета FAQ_MEMORY_BUDGET_MB)
+        
+        Для снимка это размер отображения: строки декодируются при обращении
+        и не копятся. Отрендеренные тексты (extras) и номера вопросов
+        по категориям (строятся лениво) учитываются отдельно и для снимка тоже.
+        """
+        extras = sum(sys.getsizeof(value) for value in self.extras.values())
+        if self._category_members is not None:
+            extras += sys.getsizeof(self._category_members)
+            extras += sum(sys.getsizeof(rows) for rows in self._category_members.values())
+        if self._memory_bytes is None:
+            size = sum(sys.getsizeof(text) for column in (self.questions, self.answers, self.normalized) for text in column)
+            size += sum(sys.getsizeof(gram) + sys.getsizeof(rows) for gram, rows in self.postings.items())
+            size += sum(sys.getsizeof(word) + sys.getsizeof(words) for word, words in self.speller.deletes.items())
+            size += sum(sys.getsizeof(table) for table in (self.postings, self.exact, self.speller.deletes, self.speller.frequency))
+            self._memory_bytes = size
+        return self._memory_bytes + extras
+    
+    def __len__(self):
+        return len(self.questions)
+
+# Загруженные базы: имя → индекс, время последней проверки файла и последнего обращения
+_bases = {}
+_bases_checked_at = {}
+_bases_used_at = {}
+_missing_bases = {}
+_faq_index_lock = threading.Lock()
+_index_versions = itertools.count(1)
+_base_stats = {'loads': 0, 'evictions': 0, 'missing': 0}
+
+def _faq_signature(base: str = DEFAULT_BASE):
+    """Отпечаток файла базы (mtime, размер) или None, если файла нет"""
+    try:
+        stat = base_path(base).stat()
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _source_id(signature, base: str = DEFAULT_BASE) -> str:
+    """Идентификатор источника FAQ, под который собран снимок"""
+    if signature is not None:
+        prefix = 'file' if base == DEFAULT_BASE else f"base:{base}"
+        return f"{prefix}:{signature[0]}:{signature[1]}"
+    digest = hashlib.sha1(json.dumps(DEFAULT_FAQ, ensure_ascii=False).encode('utf-8')).hexdigest()
+    return f"default:{digest}"
+
+def snapshot_path(base: str = DEFAULT_BASE):
+    """Путь к снимку базы (None — стандартный путь снимка default)"""
+    return None if base == DEFAULT_BASE else FAQ_BASES_DIR / f"{base}.snapshot"
+
+def _build_faq_index(base: str, signature, version: int) -> FaqIndex:
+    """Загрузить индекс из актуального снимка или собрать из текущего источника FAQ"""
+    tables = open_snapshot(_source_id(signature, base), NGRAM_SIZE, snapshot_path(base))
+    if tables is not None:
+        index = FaqIndex.from_snapshot(tables, signature, version)
+        source = 'загружен из снимка'
+    else:
+        index = FaqIndex(load_faq(base), signature, version)
+        source = 'скомпилирован'
+    
+    index.name = base
+    logger.info(
+        f"📚 FAQ {base} {source}: {len(index)} вопросов, {len(index.categories)} категорий, "
+        f"~{index.memory_bytes() / 1024 / 1024:.1f} МБ (версия {version})"
+    )
+    return index
+
+def build_snapshot(path=None, base: str = DEFAULT_BASE):
+    """Скомпилировать текущий источник FAQ и сохранить бинарный снимок"""
+    signature = _faq_signature(base)
+    index = FaqIndex(load_faq(base), signature)
+    return write_snapshot(index, _source_id(signature, base), NGRAM_SIZE, path or snapshot_path(base))
+
+def _evict_cold_bases(keep: str):
+    """Вытеснить давно не используемые базы, пока загруженные не уложатся в бюджет памяти"""
+    budget = FAQ_MEMORY_BUDGET_MB * 1024 * 1024
+    total = sum(index.memory_bytes() for index in _bases.values())
+    
+    # default — запасная база для всех остальных, она не вытесняется
+    candidates = [name for name in _bases if name not in (keep, DEFAULT_BASE)]
+    while total > budget and candidates:
+        victim = min(candidates, key=lambda name: _bases_used_at.get(name, 0))
+        candidates.remove(victim)
+        index = _bases.pop(victim)
+        _bases_checked_at.pop(victim, None)
+        _bases_used_at.pop(victim, None)
+        total -= index.memory_bytes()
+        _base_stats['evictions'] += 1
+        logger.info(f"♻️  База FAQ {victim} вытеснена из памяти (загружено ~{total / 1024 / 1024:.1f} МБ)")
+
+def _available_base(base: str) -> str:
+    """Имя базы, если она установлена, иначе default (отсутствие перепроверяется периодически)"""
+    if base == DEFAULT_BASE:
+        return base
+    
+    checked_at = _missing_bases.get(base)
+    if checked_at is not None and time.monotonic() - checked_at < FAQ_RELOAD_CHECK_INTERVAL:
+        return DEFAULT_BASE
+    
+    if BASE_NAME_RE.match(base) and base_path(base).exists():
+        _missing_bases.pop(base, None)
+        return base
+    
+    if checked_at is None:
+        _base_stats['missing'] += 1
+        logger.warning(f"⚠️  База FAQ {base} не найдена ({base_path(base)}), используется {DEFAULT_BASE}")
+    _missing_bases[base] = time.monotonic()
+    return DEFAULT_BASE
+
+def reload_faq_index(force: bool = False, base: str = None) -> FaqIndex:
+    """
+    Пересобрать индекс базы FAQ, если ее файл изменился (или принудительно)
+    
+    Незагруженная база загружается; после загрузки холодные базы вытесняются
+    в пределах FAQ_MEMORY_BUDGET_MB. Новый индекс собирается целиком и только
+    потом подменяет старый, поэтому параллельные поиски всегда видят
+    согласованную версию.
+    """
+    with _faq_index_lock:
+        base = _available_base(base or DEFAULT_BASE)
+        signature = _faq_signature(base)
+        index = _bases.get(base)
+        
+        if force or index is None or signature != index.signature:
+            try:
+                new_index = _build_faq_index(base, signature, next(_index_versions))
+            except Exception as e:
+                if base == DEFAULT_BASE:
+                    raise
+                logger.error(f"❌ Не удалось загрузить базу FAQ {base}: {e}")
+                _missing_bases[base] = time.monotonic()
+                base = DEFAULT_BASE
+                index = _bases.get(base) or _build_faq_index(base, _faq_signature(base), next(_index_versions))
+                new_index = None
+            
+            if new_index is not None:
+                if index is not None:
+                    # Старая версия базы: ее ответы в кэше больше не нужны
+                    clear_answer_cache()
+                index = new_index
+                _base_stats['loads'] += 1
+            _bases[base] = index
+            _evict_cold_bases(keep=base)
+        
+        now = time.monotonic()
+        _bases_checked_at[base] = now
+        _bases_used_at[base] = now
+        return index
+
+def get_faq_index(base: str = None) -> FaqIndex:
+    """Получить скомпилированный индекс базы FAQ (файл проверяется не чаще FAQ_RELOAD_CHECK_INTERVAL)"""
+    base = base or DEFAULT_BASE
+    now = time.monotonic()
+    
+    # Недавно не найденная база: сразу default, без блокировки и обращения к диску
+    missing_at = _missing_bases.get(base)
+    if missing_at is not None and now - missing_at < FAQ_RELOAD_CHECK_INTERVAL:
+        base = DEFAULT_BASE
+    
+    index = _bases.get(base)
+    if index is not None and now - _bases_checked_at.get(base, 0) < FAQ_RELOAD_CHECK_INTERVAL:
+        _bases_used_at[base] = now
+        return index
+    return reload_faq_index(base=base)
+
+def get_base_stats() -> dict:
+    """Загруженные базы FAQ и их память для /metrics"""
+    bases = dict(_bases)
+    stats = dict(_base_stats)
+    stats['loaded'] = len(bases)
+    stats['memory_bytes'] = sum(index.memory_bytes() for index in bases.values())
+    stats['budget_bytes'] = FAQ_MEMORY_BUDGET_MB * 1024 * 1024
+    return stats
+
+def _result(index: FaqIndex, idx: int, score: float, found: bool) -> dict:
+    """Результат поиска в том же формате, что возвращает find_answer"""
+    if not found:
+        return {'found': False, 'category': None, 'question': None, 'answer': None, 'similarity_score': score}
+    return {
+        'found': True,
+        'category': index.entry_categories[idx],
+        'question': index.questions[idx],
+        'answer': index.answers[idx],
+        'similarity_score': score
+    }
+
+_answer_cache = OrderedDict()
+_answer_cache_bytes = 0
+_answer_cache_lock = threading.Lock()
+_answer_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+def _cache_get(key, version: int):
+    """Достать результат из кэша (None при промахе, устаревшей версии FAQ или TTL)"""
+    global _answer_cache_bytes
+    
+    with _answer_cache_lock:
+        entry = _answer_cache.get(key)
+        if entry is not None:
+            entry_version, expires_at, size, result = entry
+            if entry_version == version and (not expires_at or expires_at > time.monotonic()):
+                _answer_cache.move_to_end(key)
+                _answer_cache_stats['hits'] += 1
+                return dict(result)
+            
+            del _answer_cache[key]
+            _answer_cache_bytes -= size
+            _answer_cache_stats['expirations'] += 1
+        
+        _answer_cache_stats['misses'] += 1
+        return None
+
+def _cache_entry_size(key, result: dict) -> int:
+    """Примерный объем записи кэша: запрос, dict результата с ответом и вопросом, подсказки"""
+    size = sys.getsizeof(key[1]) + _CACHE_ENTRY_OVERHEAD + sys.getsizeof(result)
+    size += sum(sys.getsizeof(value) for value in result.values() if isinstance(value, str))
+    suggestions = result.get('suggestions') or ()
+    if suggestions:
+        size += sys.getsizeof(suggestions)
+        for item in suggestions:
+            size += sys.getsizeof(item) + sum(sys.getsizeof(value) for value in item.values() if isinstance(value, str))
+    return size
+
+def _cache_put(key, version: int, result: dict):
+    """Положить результат в кэш, вытесняя самые старые записи сверх лимитов"""
+    global _answer_cache_bytes
+    
+    if ANSWER_CACHE_MAX_ENTRIES <= 0:
+        return
+    
+    size = _cache_entry_size(key, result)
+    expires_at = time.monotonic() + ANSWER_CACHE_TTL if ANSWER_CACHE_TTL > 0 else 0
+    
+    with _answer_cache_lock:
+        old = _answer_cache.pop(key, None)
+        if old is not None:
+            _answer_cache_bytes -= old[2]
+        
+        _answer_cache[key] = (version, expires_at, size, dict(result))
+        _answer_cache_bytes += size
+        
+        while _answer_cache and (
+            len(_answer_cache) > ANSWER_CACHE_MAX_ENTRIES or _answer_cache_bytes > ANSWER_CACHE_MAX_BYTES
+        ):
+            _, evicted = _answer_cache.popitem(last=False)
+            _answer_cache_bytes -= evicted[2]
+            _answer_cache_stats['evictions'] += 1
+
+def clear_answer_cache():
+    """Очистить кэш ответов (счетчики сохраняются)"""
+    global _answer_cache_bytes
+    
+    with _answer_cache_lock:
+        _answer_cache.clear()
+        _answer_cache_bytes = 0
+
+def get_answer_cache_stats() -> dict:
+    """Счетчики кэша ответов для подбора его размера по боевым данным"""
+    with _answer_cache_lock:
+        stats = dict(_answer_cache_stats)
+        stats['entries'] = len(_answer_cache)
+        stats['bytes'] = _answer_cache_bytes
+    
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0
+    return stats
+
+def _search(index: FaqIndex, query: str, threshold: float, top_k: int = 0, candidates=None) -> dict:
+    """
+    Найти лучший вопрос (и top_k ближайших) для уже нормализованного запроса
+    
+    Кандидат пропускается без полного ratio(), если верхняя оценка сходства
+    (по длинам, real_quick_ratio, quick_ratio) не выше текущего k-го результата.
+    Точное совпадение после нормализации завершает поиск сразу.
+    Без candidates кандидаты отбираются через n-граммный shortlist.
+    """
+    exact_idx = index.exact.get(query)
+    if exact_idx is not None:
+        result = _result(index, exact_idx, 1.0, 1.0 >= threshold)
+        if top_k:
+            result['suggestions'] = [_suggestion(index, exact_idx, 1.0)]
+        return result
+    
+    size = max(1, top_k)
+    heap = []
+    bound = 0
+    query_len = len(query)
+    
+    # Переранжировать кандидатов из n-граммного индекса
+    for idx in index.shortlist(query) if candidates is None else candidates:
+        question = index.normalized[idx]
+        
+        # Верхняя граница по длинам: 2 * min / (сумма длин)
+        total = query_len + len(question)
+        if not total or 2 * min(query_len, len(question)) / total <= bound:
+            continue
+        
+        matcher = SequenceMatcher(None, query, question)
+        if matcher.real_quick_ratio() <= bound or matcher.quick_ratio() <= bound:
+            continue
+        
+        similarity = matcher.ratio()
+        if similarity <= bound:
+            continue
+        
+        # При равном сходстве остается более ранний вопрос (как при полном переборе)
+        item = (similarity, -idx)
+        if len(heap) < size:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heapreplace(heap, item)
+        if len(heap) == size:
+            bound = heap[0][0]
+    
+    ranked = sorted(heap, reverse=True)
+    best_idx = -ranked[0][1] if ranked else None
+    best_score = ranked[0][0] if ranked else 0
+    
+    # Проверить пороговое значение
+    result = _result(index, best_idx, best_score, best_idx is not None and best_score >= threshold)
+    if top_k:
+        result['suggestions'] = [_suggestion(index, -neg_idx, score) for score, neg_idx in ranked]
+    return result
+
+def _suggestion(index: FaqIndex, idx: int, score: float) -> dict:
+    """Краткое описание вопроса FAQ для списка подсказок"""
+    return {
+        'category': index.entry_categories[idx],
+        'question': index.questions[idx],
+        'similarity_score': score
+    }
+
+def find_answer(user_query: str, threshold: float = 0.5, top_k: int = 0, preferred_category: str = None,
+                base: str = None) -> dict:
     """
     Найти ответ в FAQ по запросу пользователя
     
+    Слова запроса, которых нет в словаре FAQ, предварительно исправляются
+    (опечатки, кириллица вместо латиницы). Повторяющиеся запросы обслуживаются
+    из LRU-кэша, ключ — нормализованный запрос и параметры поиска; при смене
+    версии FAQ записи становятся недействительными.
+    
     Args:
         user_query: Вопрос пользователя
         threshold: Минимальный порог сходства (0-1)
+        top_k: Если > 0, в результат добавляется список 'suggestions' из k ближайших вопросов
+        preferred_category: Категория предыдущего ответа: сначала ищется в ней, и при
+            сходстве от FAQ_CATEGORY_STOP_SCORE полный поиск не выполняется
+        base: База знаний (по умолчанию default, см. resolve_base)
     
     Returns:
         dict с результатом поиска
     """
-    faq = load_faq()
-    best_match = None
-    best_score = 0
+    index = get_faq_index(base)
+    # Размер базы, по которой шел поиск, — в профиль апдейта (если он профилируется)
+    annotate(faq_size=len(index))
+    query = normalize_text(user_query)
+    key = (index.name, query, threshold, top_k, preferred_category)
     
-    # Поиск по всем категориям
-    for category_data in faq:
-        category = category_data['category']
-        
-        for q_data in category_data.get('questions', []):
-            question = q_data['question']
-            
-            # Вычислить сходство
-            similarity = calculate_similarity(user_query, question)
-            
-            if similarity > best_score:
-                best_score = similarity
-                best_match = {
-                    'category': category,
-                    'question': question,
-                    'answer': q_data['answer'],
-                    'similarity_score': similarity
-                }
+    result = _cache_get(key, index.version)
+    if result is None:
+        # Исправить опечатки по словарю FAQ перед сравнением
+        corrected = index.speller.correct(query)
+        if preferred_category is not None:
+            result = _search_category(index, corrected, threshold, top_k, preferred_category)
+        if result is None:
+            result = _search(index, corrected, threshold, top_k)
+            if preferred_category is not None:
+                result['category_search'] = 'fallback'
+        _cache_put(key, index.version, result)
     
-    # Проверить пороговое значение
-    if best_match and best_score >= threshold:
-        return {
-            'found': True,
-            'category': best_match['category'],
-            'question': best_match['question'],
-            'answer': best_match['answer'],
-            'similarity_score': best_score
-        }
+    return result
+
+def _search_category(index: FaqIndex, query: str, threshold: float, top_k: int, category: str):
+    """
+    Поиск только в категории; None, если достаточно хорошего ответа в ней нет
+    
+    Исход отмечается в результате (category_search: stop или fallback у полного
+    поиска), а считается вызывающим в event loop: поиск идет в потоках и процессах пула.
+    """
+    candidates = index.category_candidates(category, query)
+    if candidates:
+        result = _search(index, query, threshold, top_k, candidates=candidates)
+        if result['found'] and result['similarity_score'] >= max(threshold, FAQ_CATEGORY_STOP_SCORE):
+            result['category_search'] = 'stop'
+            return result
+    return None
+
+def _batch_shortlists(index: FaqIndex, queries: list, limit: int) -> list:
+    """
+    Shortlist для блока запросов разом: пересечения n-грамм через numpy
+    
+    Номера строк блока собираются из postings (по разу на n-грамму) в один
+    массив со сдвигом строки запроса, np.bincount дает матрицу пересечений
+    запросы × вопросы, а argpartition — top-limit по коэффициенту Дайса
+    в каждой строке, как у FaqIndex.shortlist.
+    """
+    import numpy as np
+    
+    size = len(index)
+    counts = np.asarray(index.ngram_counts, dtype=np.float64)
+    postings = {}
+    rows = []
+    query_sizes = []
+    for pos, query in enumerate(queries):
+        grams = text_ngrams(query)
+        query_sizes.append(len(grams))
+        for gram in grams:
+            ids = postings.get(gram)
+            if ids is None:
+                ids = postings[gram] = np.asarray(index.postings.get(gram, ()), dtype=np.int64)
+            if len(ids):
+                rows.append(ids + pos * size)
+    
+    flat = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+    overlap = np.bincount(flat, minlength=len(queries) * size).reshape(len(queries), size)
+    dice = overlap / (np.asarray(query_sizes, dtype=np.float64)[:, None] + counts)
+    best = np.argpartition(-dice, limit - 1, axis=1)[:, :limit]
+    
+    shortlists = []
+    for pos, candidates in enumerate(best):
+        candidates = candidates[overlap[pos, candidates] > 0]
+        shortlists.append(np.sort(candidates).tolist())
+    return shortlists
+
+def _search_batch(index: FaqIndex, queries: list, threshold: float, top_k: int) -> list:
+    """Поиск для блока разных нормализованных запросов: общий shortlist, затем _search"""
+    corrected = [index.speller.correct(query) for query in queries]
+    candidates = [None] * len(queries)
+    if len(index) <= FAQ_SHORTLIST_SIZE:
+        candidates = [range(len(index))] * len(queries)
     else:
-        return {
-            'found': False,
-            'category': None,
-            'question': None,
-            'answer': None,
-            'similarity_score': best_score
-        }
-
-def get_categories() -> list:
-    """Получить список всех категорий"""
-    faq = load_faq()
-    return [cat['category'] for cat in faq]
+        # Точные совпадения _search находит сам, shortlist для них не нужен
+        pending = [pos for pos, query in enumerate(corrected) if index.exact.get(query) is None]
+        if pending:
+            shortlists = _batch_shortlists(index, [corrected[pos] for pos in pending], FAQ_SHORTLIST_SIZE)
+            for pos, shortlist in zip(pending, shortlists):
+                candidates[pos] = shortlist
+    
+    results = []
+    for query, query_candidates in zip(corrected, candidates):
+        result = _search(index, query, threshold, top_k, candidates=query_candidates)
+        if top_k:
+            result['top'] = result.pop('suggestions')
+        results.append(result)
+    return results
+
+def find_answers(queries, threshold: float = 0.5, top_k: int = 0, base: str = None) -> list:
+    """
+    Пакетный поиск ответов для офлайн-задач (реплей логов, регрессии FAQ, подбор порога)
+    
+    Разные запросы обрабатываются блоками: пересечения n-грамм блока со всеми
+    вопросами считаются через numpy по postings (без плотной матрицы вопросы ×
+    n-граммы), top FAQ_SHORTLIST_SIZE кандидатов каждой строки переранжируются
+    через SequenceMatcher до сравнения с порогом: сходство и порог те же, что у find_answer.
+    Кэш ответов бота не используется; повторы запросов в пакете ищутся один раз.
+    
+    Args:
+        queries: Итерируемый набор вопросов
+        threshold: Минимальный порог сходства (0-1)
+        top_k: Если > 0, в каждый результат добавляется список 'top' из k лучших вопросов
+        base: База знаний (по умолчанию default)
+    
+    Returns:
+        list словарей в формате find_answer, по одному на запрос
+    """
+    index = get_faq_index(base)
+    block = max(1, FAQ_BATCH_BLOCK_CELLS // max(1, len(index)))
+    seen = {}
+    pending = {}
+    results = []
+    
+    def resolve():
+        for query, result in zip(pending, _search_batch(index, list(pending), threshold, top_k)):
+            for pos in pending[query]:
+                results[pos] = dict(result)
+            if len(seen) >= FAQ_BATCH_MEMO_SIZE:
+                seen.clear()
+            seen[query] = result
+        pending.clear()
+    
+    for user_query in queries:
+        query = normalize_text(user_query)
+        result = seen.get(query)
+        results.append(None if result is None else dict(result))
+        if result is None:
+            pending.setdefault(query, []).append(len(results) - 1)
+            if len(pending) >= block:
+                resolve()
+    if pending:
+        resolve()
+    
+    return results
+
+def get_categories(base: str = None) -> list:
+    """Получить список всех категорий базы знаний"""
+    return list(get_faq_index(base).categories)
@@ -0,0 +1,319 @@
+"""
+app/faq_snapshot.py
+Бинарный снимок скомпилированного FAQ для быстрого холодного старта
+
+Снимок собирается заранее (python -m app.faq_snapshot) и при запуске
+отображается в память через mmap: вопросы, ответы и индексы читаются
+по смещениям по мере надобности, без разбора JSON и пересборки индексов.
+"""
+
+import sys
+import json
+import mmap
+import struct
+import logging
+from array import array
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = Path(__file__).parent.parent / "data" / "faq.snapshot"
+
+MAGIC = b'FAQSNAP\x00'
+FORMAT_VERSION = 2
+
+class _StringArray:
+    """Массив строк в снимке: смещения (uint32) + общий блок UTF-8"""
+    
+    def __init__(self, buf, offsets, blob_start: int):
+        self._buf = buf
+        self._offsets = offsets
+        self._blob_start = blob_start
+    
+    def __len__(self):
+        return len(self._offsets) - 1
+    
+    def raw(self, i: int) -> bytes:
+        start = self._blob_start + self._offsets[i]
+        return bytes(self._buf[start:self._blob_start + self._offsets[i + 1]])
+    
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        return self.raw(i).decode('utf-8')
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+class _SortedMap:
+    """
+    Отображение строка → список uint32 в снимке
+    
+    Ключи отсортированы по байтам UTF-8, поиск — бинарный, прямо по mmap.
+    """
+    
+    def __init__(self, keys: _StringArray, value_offsets, values, single: bool = False):
+        self._keys = keys
+        self._value_offsets = value_offsets
+        self._values = values
+        self._single = single
+    
+    def __len__(self):
+        return len(self._keys)
+    
+    def _find(self, key: str) -> int:
+        target = key.encode('utf-8')
+        lo, hi = 0, len(self._keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self._keys.raw(mid)
+            if current < target:
+                lo = mid + 1
+            elif current > target:
+                hi = mid
+            else:
+                return mid
+        return -1
+    
+    def _value(self, i: int):
+        values = self._values[self._value_offsets[i]:self._value_offsets[i + 1]]
+        return values[0] if self._single else values
+    
+    def key_at(self, i: int) -> str:
+        return self._keys[i]
+    
+    def get(self, key: str, default=None):
+        i = self._find(key)
+        return default if i < 0 else self._value(i)
+    
+    def __contains__(self, key: str) -> bool:
+        return self._find(key) >= 0
+    
+    def __getitem__(self, key: str):
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self._value(i)
+    
+    def __iter__(self):
+        return iter(self._keys)
+    
+    def items(self):
+        for i in range(len(self._keys)):
+            yield self._keys[i], list(self._value(i))
+
+class _WordListMap:
+    """Удаления SymSpell: значения хранятся как номера слов словаря частот"""
+    
+    def __init__(self, ids: _SortedMap, words: _SortedMap):
+        self._ids = ids
+        self._words = words
+    
+    def __len__(self):
+        return len(self._ids)
+    
+    def get(self, key: str, default=None):
+        ids = self._ids.get(key)
+        if ids is None:
+            return default
+        return [self._words.key_at(i) for i in ids]
+
+class _CategoryList:
+    """Категория каждого вопроса: номер в списке категорий из заголовка"""
+    
+    def __init__(self, categories: list, ids):
+        self._categories = categories
+        self._ids = ids
+    
+    def __len__(self):
+        return len(self._ids)
+    
+    def __getitem__(self, i: int) -> str:
+        return self._categories[self._ids[i]]
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+def _pack_strings(strings) -> tuple:
+    offsets = array('I', [0])
+    blob = bytearray()
+    for text in strings:
+        blob += text.encode('utf-8') if isinstance(text, str) else text
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+def _pack_map(mapping, key_order=None) -> tuple:
+    keys = key_order if key_order is not None else sorted(mapping, key=lambda k: k.encode('utf-8'))
+    value_offsets = array('I', [0])
+    values = array('I')
+    for key in keys:
+        value = mapping[key]
+        values.extend([value] if isinstance(value, int) else value)
+        value_offsets.append(len(values))
+    key_offsets, key_blob = _pack_strings(keys)
+    return key_offsets, key_blob, value_offsets, values
+
+def write_snapshot(index, source_id: str, ngram_size: int, path: Path = None) -> Path:
+    """Записать скомпилированный индекс FAQ в бинарный снимок (атомарно)"""
+    path = Path(path or SNAPSHOT_PATH)
+    sections = {}
+    
+    # Вопросы, нормализованные вопросы, ответы
+    for name, strings in (('questions', index.questions), ('normalized', index.normalized), ('answers', index.answers)):
+        offsets, blob = _pack_strings(strings)
+        sections[f'{name}.offsets'] = offsets.tobytes()
+        sections[f'{name}.blob'] = blob
+    
+    category_ids = {name: i for i, name in enumerate(index.categories)}
+    sections['entry_categories'] = array('I', [category_ids[c] for c in index.entry_categories]).tobytes()
+    sections['ngram_counts'] = array('I', index.ngram_counts).tobytes()
+    
+    # Индексы: точные совпадения, n-граммы, словарь опечаток
+    frequency_keys = sorted(index.speller.frequency, key=lambda k: k.encode('utf-8'))
+    word_ids = {word: i for i, word in enumerate(frequency_keys)}
+    deletes = {key: [word_ids[w] for w in words] for key, words in index.speller.deletes.items()}
+    
+    maps = (
+        ('exact', dict(index.exact), None),
+        ('postings', dict(index.postings), None),
+        ('frequency', dict(index.speller.frequency), frequency_keys),
+        ('deletes', deletes, None)
+    )
+    for name, mapping, order in maps:
+        key_offsets, key_blob, value_offsets, values = _pack_map(mapping, order)
+        sections[f'{name}.key_offsets'] = key_offsets.tobytes()
+        sections[f'{name}.key_blob'] = key_blob
+        sections[f'{name}.value_offsets'] = value_offsets.tobytes()
+        sections[f'{name}.values'] = values.tobytes()
+    
+    header = {
+        'format': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'source': source_id,
+        'ngram_size': ngram_size,
+        'max_word_length': index.speller.max_length,
+        'categories': list(index.categories),
+        'sections': {}
+    }
+    
+    # Раскладка секций (выравнивание по 4 байта для uint32)
+    offset = 0
+    layout = []
+    for name, data in sections.items():
+        offset += -offset % 4
+        header['sections'][name] = [offset, len(data)]
+        layout.append((offset, data))
+        offset += len(data)
+    
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    base = len(MAGIC) + 4 + len(header_bytes)
+    base += -base % 8
+    
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b'\0' * (base - f.tell()))
+        for section_offset, data in layout:
+            f.write(b'\0' * (base + section_offset - f.tell()))
+            f.write(data)
+    tmp_path.replace(path)
+    
+    logger.info(f"💾 Снимок FAQ записан: {path} ({base + offset} байт, {len(index)} вопросов)")
+    return path
+
+def open_snapshot(source_id: str, ngram_size: int, path: Path = None):
+    """
+    Отобразить снимок в память
+    
+    Returns:
+        dict с ленивыми представлениями таблиц или None, если снимка нет
+        или он устарел (другой источник, формат, параметры индекса)
+    """
+    path = Path(path or SNAPSHOT_PATH)
+    try:
+        with open(path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    
+    try:
+        if buf[:len(MAGIC)] != MAGIC:
+            raise ValueError("неверная сигнатура")
+        (header_len,) = struct.unpack_from('<I', buf, len(MAGIC))
+        header_start = len(MAGIC) + 4
+        header = json.loads(bytes(buf[header_start:header_start + header_len]).decode('utf-8'))
+    except (ValueError, struct.error) as e:
+        logger.warning(f"⚠️  Снимок FAQ поврежден ({path}): {e}")
+        return None
+    
+    if (header.get('format') != FORMAT_VERSION or header.get('byteorder') != sys.byteorder
+            or header.get('source') != source_id or header.get('ngram_size') != ngram_size):
+        logger.info(f"ℹ️  Снимок FAQ устарел: {path}")
+        return None
+    
+    base = header_start + header_len
+    base += -base % 8
+    view = memoryview(buf)
+    
+    def section(name, fmt=None):
+        offset, length = header['sections'][name]
+        data = view[base + offset:base + offset + length]
+        return data.cast(fmt) if fmt else data
+    
+    def strings(offsets_name, blob_name):
+        return _StringArray(buf, section(offsets_name, 'I'), base + header['sections'][blob_name][0])
+    
+    def sorted_map(prefix, single=False):
+        return _SortedMap(
+            strings(f'{prefix}.key_offsets', f'{prefix}.key_blob'),
+            section(f'{prefix}.value_offsets', 'I'),
+            section(f'{prefix}.values', 'I'),
+            single=single
+        )
+    
+    frequency = sorted_map('frequency', single=True)
+    return {
+        'categories': header['categories'],
+        'questions': strings('questions.offsets', 'questions.blob'),
+        'normalized': strings('normalized.offsets', 'normalized.blob'),
+        'answers': strings('answers.offsets', 'answers.blob'),
+        'entry_categories': _CategoryList(header['categories'], section('entry_categories', 'I')),
+        'ngram_counts': section('ngram_counts', 'I'),
+        'exact': sorted_map('exact', single=True),
+        'postings': sorted_map('postings'),
+        'frequency': frequency,
+        'deletes': _WordListMap(sorted_map('deletes'), frequency),
+        'max_word_length': header['max_word_length'],
+        'size': len(buf)
+    }
+
+def main():
+    """Собрать снимок базы FAQ (default — data/faq.json или DEFAULT_FAQ) или всех баз"""
+    import argparse
+    from app import faq_engine
+    
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    
+    parser = argparse.ArgumentParser(description='Сборка бинарного снимка FAQ')
+    parser.add_argument('--output', type=Path, help='Путь к снимку (по умолчанию рядом с базой)')
+    parser.add_argument('--base', default=faq_engine.DEFAULT_BASE, help='Имя базы знаний')
+    parser.add_argument('--all', action='store_true', help='Собрать снимки всех установленных баз')
+    args = parser.parse_args()
+    
+    if args.all:
+        for base in faq_engine.list_bases():
+            faq_engine.build_snapshot(base=base)
+        return
+    
+    faq_engine.build_snapshot(args.output, base=args.base)
+
+if __name__ == '__main__':
+    main()
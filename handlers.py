@@ -7,160 +7,165 @@ import logging
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from app.faq_engine import find_answer, get_categories
+from app.concurrency import find_answer_async, categories_text_async
+from app.faq_engine import resolve_base
+from app.outbound import answer_with_typing
+from app.metrics import instrumented, stage, observe, inc, SCORE_BUCKETS
 from app.database import log_interaction
+from app.sessions import get_session_category, remember_session_category, forget_session, record_category_search
+from app.profiling import profiled, annotate, configure_profiler, get_profiler_status
+from app import responses
+from app.admin import is_admin, get_stats_snapshot
 
 logger = logging.getLogger(__name__)
 
-# Константы
-SUPPORT_PHONE = "☎️ +7 (499) 651-44-44"
-SUPPORT_WEBSITE = "https://sbermobile.ru/faq/"
-SUPPORT_SHORTCODE = "901"
+# Подсказки в ответе "не найдено": сколько вопросов и с каким минимальным сходством
+SUGGESTIONS_COUNT = 3
+SUGGESTION_MIN_SCORE = 0.3
 
+@instrumented('start')
+@profiled('start')
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
     
     user = update.effective_user
     logger.info(f"👤 Новый пользователь: {user.username or user.id}")
     
-    welcome_message = (
-        f"👋 Привет, {user.first_name}!\n\n"
-        "🤖 Я <b>SberMobile Support Bot</b> — ваш помощник по вопросам SberMobile\n\n"
-        "Я помогу ответить на вопросы о:\n"
-        "• 💳 Тарифах и услугах\n"
-        "• 🔄 Переносе номера\n"
-        "• 📱 eSIM\n"
-        "• ⭐ Подписке СберПрайм\n"
-        "• 📞 Мобильной связи и интернете\n"
-        "• 📋 И многом другом\n\n"
-        "<b>Начните с вопроса → я найду ответ! 🔍</b>\n\n"
-        "Доступные команды:\n"
-        "/help — справка\n"
-        "/categories — категории FAQ\n"
-        "/contact — контакты поддержки"
-    )
+    # Новый диалог начинается без темы
+    forget_session(user.id)
     
-    await update.message.reply_html(welcome_message)
+    await update.message.reply_html(responses.welcome_text(user.first_name))
 
+@instrumented('help')
+@profiled('help')
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /help"""
     
-    help_text = (
-        "<b>❓ Справка по использованию бота</b>\n\n"
-        "<b>Как использовать:</b>\n"
-        "1. Напишите свой вопрос об SberMobile\n"
-        "2. Бот найдет ответ в базе знаний\n"
-        "3. Получите подробный ответ\n\n"
-        "<b>Примеры вопросов:</b>\n"
-        "• Как подключить eSIM?\n"
-        "• Какие тарифы доступны?\n"
-        "• Как перенести номер?\n"
-        "• Что входит в СберПрайм?\n\n"
-        "<b>Если ответ не найден:</b>\n"
-        "✉️ Напишите в поддержку\n"
-        f"{SUPPORT_PHONE}\n"
-        f"Короткий номер: {SUPPORT_SHORTCODE}\n"
-        f"🌐 {SUPPORT_WEBSITE}\n\n"
-        "<b>Доступные команды:</b>\n"
-        "/start — начать заново\n"
-        "/categories — показать категории\n"
-        "/contact — контакты поддержки"
-    )
-    
-    await update.message.reply_html(help_text)
+    await update.message.reply_html(responses.HELP_TEXT)
 
+@instrumented('contact')
+@profiled('contact')
 async def contact_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /contact"""
     
-    contact_text = (
-        "<b>☎️ Контакты поддержки SberMobile</b>\n\n"
-        f"<b>Основной номер:</b>\n{SUPPORT_PHONE}\n\n"
-        f"<b>Короткий номер (для номеров СберМобайла):</b>\n{SUPPORT_SHORTCODE}\n\n"
-        f"<b>Веб-версия FAQ:</b>\n{SUPPORT_WEBSITE}\n\n"
-        "<b>Режим работы:</b>\n24/7\n\n"
-        "<b>Время ответа на тикеты:</b>\n⏱️ До 5 дней"
-    )
-    
-    await update.message.reply_html(contact_text)
+    await update.message.reply_html(responses.CONTACT_TEXT)
 
+@instrumented('categories')
+@profiled('categories')
 async def categories_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик команды /categories"""
+    """Обработчик команды /categories (категории базы знаний этого чата)"""
     
-    categories = get_categories()
+    base = resolve_base(update.effective_chat.id, update.effective_user.language_code)
+    await update.message.reply_html(await categories_text_async(base))
+
+@instrumented('stats')
+@profiled('stats')
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /stats (только для администраторов, из снимка в памяти)"""
     
-    categories_text = "<b>📂 Категории FAQ SberMobile</b>\n\n"
+    user_id = update.effective_user.id
+    if not is_admin(user_id):
+        logger.info(f"⛔ /stats от не-администратора: {user_id}")
+        return
     
-    for i, category in enumerate(categories, 1):
-        categories_text += f"{i}. {category}\n"
+    await update.message.reply_html(responses.stats_text(get_stats_snapshot()))
+
+@instrumented('profile')
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обработчик команды /profile (только для администраторов)
     
-    categories_text += (
-        "\n<i>Спросите что-то из этих категорий, и я найду ответ!</i>\n"
-        "Например: \"Как подключить eSIM?\""
-    )
+    /profile — состояние, /profile sample 0.05 — доля апдейтов,
+    /profile slow 500 — порог медленных (мс), /profile off — выключить.
+    Действует на процесс, получивший команду.
+    """
     
-    await update.message.reply_html(categories_text)
+    user_id = update.effective_user.id
+    if not is_admin(user_id):
+        logger.info(f"⛔ /profile от не-администратора: {user_id}")
+        return
+    
+    args = context.args or []
+    try:
+        if not args:
+            status = get_profiler_status()
+        elif args[0] == 'off':
+            status = configure_profiler(sample_rate=0, slow_ms=0)
+        elif args[0] == 'sample' and len(args) == 2:
+            status = configure_profiler(sample_rate=float(args[1]))
+        elif args[0] == 'slow' and len(args) == 2:
+            status = configure_profiler(slow_ms=float(args[1]))
+        else:
+            raise ValueError(args)
+    except ValueError:
+        await update.message.reply_html(responses.PROFILE_USAGE_TEXT)
+        return
+    
+    logger.info(f"🔬 /profile {' '.join(args)} от {user_id}")
+    await update.message.reply_html(responses.profile_text(status))
 
+@instrumented('message')
+@profiled('message')
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик обычных сообщений пользователя"""
     
     user_message = update.message.text
     user_id = update.effective_user.id
+    base = resolve_base(update.effective_chat.id, update.effective_user.language_code)
     
     logger.info(f"💬 Новое сообщение от {user_id}: {user_message[:50]}...")
     
-    # Показать индикатор печати
-    await update.effective_chat.send_action("typing")
-    
     try:
-        # Найти ответ в FAQ
-        result = find_answer(user_message)
+        # Найти ответ в FAQ (в пуле, чтобы не блокировать другие чаты), начиная с темы
+        # предыдущего ответа; индикатор печати — только если поиск затянулся
+        with stage('find_answer'):
+            result = await answer_with_typing(
+                update.effective_chat,
+                find_answer_async(
+                    user_message,
+                    top_k=SUGGESTIONS_COUNT,
+                    preferred_category=get_session_category(user_id, base),
+                    base=base
+                )
+            )
+        
+        record_category_search(result)
+        observe('faq_match_score', result.get('similarity_score', 0), buckets=SCORE_BUCKETS)
+        annotate(base=base, found=result['found'], similarity_score=result.get('similarity_score', 0))
+        inc('faq_matches_total', result='found' if result['found'] else 'not_found')
         
         # Логировать взаимодействие
-        log_interaction(
-            user_id=user_id,
-            user_message=user_message,
-            found=result['found'],
-            category=result.get('category'),
-            similarity_score=result.get('similarity_score', 0)
-        )
+        with stage('log_interaction'):
+            log_interaction(
+                user_id=user_id,
+                user_message=user_message,
+                found=result['found'],
+                category=result.get('category'),
+                similarity_score=result.get('similarity_score', 0)
+            )
         
         if result['found']:
             # Ответ найден
-            response = (
-                "✅ <b>Нашел ответ:</b>\n\n"
-                f"{result['answer']}\n\n"
-                f"<i>Категория: {result['category']}</i>\n"
-                f"<i>Релевантность: {result['similarity_score']:.0%}</i>\n\n"
-                "Есть еще вопросы? 🤔"
-            )
+            response = responses.answer_text(result)
+            remember_session_category(user_id, result['category'], base)
             
             logger.info(f"✅ Ответ найден: {result['category']}")
             
         else:
-            # Ответ не найден
-            response = (
-                "🤔 <b>К сожалению, я не нашел точный ответ на твой вопрос.</b>\n\n"
-                "Возможно:\n"
-                "1️⃣ Попробуй переформулировать вопрос\n"
-                "2️⃣ Используй /categories для просмотра тем\n"
-                "3️⃣ Обратись в поддержку\n\n"
-                f"☎️ {SUPPORT_PHONE}\n"
-                f"📱 {SUPPORT_SHORTCODE} (для номеров СберМобайла)\n\n"
-                "Попробуем еще? 🔄"
-            )
+            # Ответ не найден: предложить ближайшие вопросы из того же поиска
+            suggestions = [
+                s['question'] for s in result.get('suggestions', [])
+                if s['similarity_score'] >= SUGGESTION_MIN_SCORE
+            ]
+            response = responses.not_found_text(suggestions)
             
             logger.info(f"❌ Ответ не найден для: {user_message[:30]}")
         
         # Отправить ответ
-        await update.message.reply_html(response)
+        with stage('reply'):
+            await update.message.reply_html(response)
         
     except Exception as e:
         logger.error(f"❌ Ошибка при обработке сообщения: {e}")
         
-        error_response = (
-            "🚨 <b>Произошла ошибка при обработке вашего запроса.</b>\n\n"
-            "Пожалуйста, попробуйте позже или напишите в поддержку:\n"
-            f"☎️ {SUPPORT_PHONE}"
-        )
-        
-        await update.message.reply_html(error_response)
+        await update.message.reply_html(responses.ERROR_TEXT)
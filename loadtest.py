@@ -0,0 +1,208 @@
+"""
+Сквозной нагрузочный тест SberMobile Bot на поддельном Bot API (без сети)
+
+Бот запускается отдельным процессом (main.py) в режиме polling или webhook,
+Telegram заменяет app/fake_telegram.py. Меряются задержка от отправки
+сообщения до ответа бота и устойчивая пропускная способность.
+
+Примеры:
+    python loadtest.py --mode both --users 50 --messages 20
+    python loadtest.py --mode webhook --rate 200 --faq-sizes 100,10000 --output e2e.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import signal
+import socket
+import asyncio
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+from app.fake_telegram import FakeTelegramServer
+from benchmark import generate_faq, synthetic_queries, summarize
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).parent
+FAKE_TOKEN = '123456789:LOADTEST-fake-token'
+
+# По умолчанию лимиты Telegram в боте сняты: меряется пропускная способность самого бота
+UNLIMITED_OUTBOUND_ENV = {
+    'OUTBOUND_GLOBAL_RATE': '1000000',
+    'OUTBOUND_GLOBAL_BURST': '1000000',
+    'OUTBOUND_CHAT_RATE': '1000000',
+    'OUTBOUND_CHAT_BURST': '1000000'
+}
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def _start_bot(mode: str, server: FakeTelegramServer, workdir: Path, faq_path: Path, extra_env: dict):
+    """Запустить бота отдельным процессом, направив его на поддельный Bot API"""
+    env = dict(os.environ)
+    env.update({
+        'TELEGRAM_BOT_TOKEN': FAKE_TOKEN,
+        'TELEGRAM_API_BASE_URL': server.base_url,
+        'FAQ_PATH': str(faq_path),
+        'DB_PATH': str(workdir / f"bot_{mode}.db"),
+        'METRICS_PORT': '0',
+        'PYTHONUNBUFFERED': '1'
+    })
+    if mode == 'webhook':
+        port = _free_port()
+        env['PORT'] = str(port)
+        env['WEBHOOK_URL'] = f"http://127.0.0.1:{port}/webhook/{FAKE_TOKEN}"
+    env.update(extra_env)
+    
+    log_path = workdir / f"bot_{mode}.log"
+    log_file = open(log_path, 'wb')
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, str(ROOT / 'main.py'), f'--{mode}',
+        cwd=str(ROOT), env=env, stdout=log_file, stderr=log_file
+    )
+    return process, log_file, log_path
+
+async def _stop_bot(process, timeout: float = 20.0):
+    """Штатно остановить бота (SIGINT), при зависании — убить"""
+    if process.returncode is not None:
+        return
+    process.send_signal(signal.SIGINT)
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("⚠️  Бот не остановился вовремя, SIGKILL")
+        process.kill()
+        await process.wait()
+
+async def _closed_loop(server, users: int, messages: int, queries: list, timeout: float):
+    """Каждый пользователь ждет ответа перед следующим сообщением"""
+    latencies = []
+    timeouts = 0
+    
+    async def user(chat_id: int):
+        nonlocal timeouts
+        rng = random.Random(chat_id)
+        for _ in range(messages):
+            try:
+                latencies.append(await asyncio.wait_for(server.inject(chat_id, rng.choice(queries)), timeout))
+            except asyncio.TimeoutError:
+                timeouts += 1
+    
+    await asyncio.gather(*(user(1000 + i) for i in range(users)))
+    return latencies, timeouts
+
+async def _open_loop(server, users: int, messages: int, queries: list, rate: float, timeout: float):
+    """Сообщения идут с заданной частотой независимо от ответов"""
+    rng = random.Random(1)
+    futures = []
+    started = time.perf_counter()
+    
+    for k in range(users * messages):
+        delay = started + k / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        futures.append(server.inject(1000 + k % users, rng.choice(queries)))
+    
+    done, not_done = await asyncio.wait(futures, timeout=timeout) if futures else (set(), set())
+    return [f.result() for f in done], len(not_done)
+
+async def run_scenario(mode: str, workdir: Path, faq_size: int, users: int, messages: int,
+                       rate: float = 0, timeout: float = 30.0, startup_timeout: float = 60.0,
+                       extra_env: dict = None, flood_limit: int = None) -> dict:
+    """Один прогон: поднять поддельный API и бота, подать нагрузку, собрать метрики"""
+    faq = generate_faq(faq_size)
+    faq_path = workdir / f"faq_{faq_size}.json"
+    with open(faq_path, 'w', encoding='utf-8') as f:
+        json.dump(faq, f, ensure_ascii=False)
+    queries = synthetic_queries(faq, 1000)
+    
+    server = FakeTelegramServer(flood_limit=flood_limit)
+    await server.start()
+    process, log_file, log_path = await _start_bot(mode, server, workdir, faq_path, extra_env or {})
+    
+    try:
+        waiter = asyncio.create_task(server.ready.wait())
+        exited = asyncio.create_task(process.wait())
+        await asyncio.wait({waiter, exited}, timeout=startup_timeout, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        exited.cancel()
+        if not server.ready.is_set():
+            tail = log_path.read_text(encoding='utf-8', errors='replace')[-2000:]
+            raise RuntimeError(f"Бот не подключился к поддельному API ({mode}):\n{tail}")
+        
+        started = time.perf_counter()
+        if rate > 0:
+            latencies, timeouts = await _open_loop(server, users, messages, queries, rate, timeout)
+        else:
+            latencies, timeouts = await _closed_loop(server, users, messages, queries, timeout)
+        elapsed = time.perf_counter() - started
+    finally:
+        await _stop_bot(process)
+        log_file.close()
+        await server.stop()
+    
+    params = {'mode': mode, 'faq_size': faq_size, 'users': users, 'messages': messages, 'rate': rate}
+    if mode == 'webhook':
+        params['workers'] = int((extra_env or {}).get('WEBHOOK_WORKERS', 1))
+    result = summarize('e2e_reply', params, latencies, elapsed)
+    result['timeouts'] = timeouts
+    result['server'] = dict(server.stats)
+    if timeouts:
+        logger.warning(f"⚠️  {mode}: без ответа за {timeout} с осталось {timeouts} сообщений")
+    return result
+
+def main():
+    """Запуск сквозного нагрузочного теста"""
+    parser = argparse.ArgumentParser(description='Сквозной нагрузочный тест SberMobile Bot')
+    parser.add_argument('--mode', choices=('polling', 'webhook', 'both'), default='both', help='Режим бота')
+    parser.add_argument('--users', type=int, default=50, help='Число одновременных пользователей (чатов)')
+    parser.add_argument('--messages', type=int, default=20, help='Сообщений от каждого пользователя')
+    parser.add_argument('--rate', type=float, default=0, help='Сообщений в секунду (0 — каждый ждет ответа)')
+    parser.add_argument('--faq-sizes', default='100', help='Размеры синтетических баз FAQ через запятую')
+    parser.add_argument('--timeout', type=float, default=30, help='Сколько ждать ответа на сообщение (сек)')
+    parser.add_argument('--workers', type=int, default=1, help='Число процессов бота в режиме webhook')
+    parser.add_argument('--telegram-limits', action='store_true', help='Оставить в боте лимиты исходящих сообщений Telegram')
+    parser.add_argument('--flood-limit', type=int, help='Поддельный API отвечает 429 сверх стольких sendMessage в секунду')
+    parser.add_argument('--output', type=Path, help='Куда записать результаты (JSON)')
+    args = parser.parse_args()
+    
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    logging.getLogger('app').setLevel(logging.WARNING)
+    
+    modes = ('polling', 'webhook') if args.mode == 'both' else (args.mode,)
+    faq_sizes = [int(x) for x in args.faq_sizes.split(',') if x]
+    
+    extra_env = {'WEBHOOK_WORKERS': str(args.workers)}
+    if not args.telegram_limits:
+        extra_env.update(UNLIMITED_OUTBOUND_ENV)
+    
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bot-e2e-') as tmp:
+        for mode in modes:
+            for size in faq_sizes:
+                results.append(asyncio.run(run_scenario(
+                    mode, Path(tmp), size, args.users, args.messages, args.rate, args.timeout,
+                    extra_env=extra_env, flood_limit=args.flood_limit
+                )))
+    
+    output = json.dumps({'results': results}, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(output, encoding='utf-8')
+        logger.info(f"💾 Результаты сохранены: {args.output}")
+    else:
+        print(output)
+    
+    sys.exit(1 if any(r['timeouts'] for r in results) else 0)
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
 """
 SberMobile Support Bot for Telegram
 Главный модуль приложения
-Поддерживает режимы: polling (бесплатный) и webhooks (платный)
+Поддерживает режимы: polling (бесплатный), webhooks (платный)
+и пакетный прогон вопросов через FAQ (--batch, без токена)
 """
 
 import os
@@ -17,22 +18,45 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Проверка токена
-token = os.getenv('TELEGRAM_BOT_TOKEN')
-if not token:
-    logger.error("❌ Отсутствует переменная окружения: TELEGRAM_BOT_TOKEN")
-    sys.exit(1)
+def check_token():
+    """Проверка токена (нужен только для режимов бота)"""
+    if not os.getenv('TELEGRAM_BOT_TOKEN'):
+        logger.error("❌ Отсутствует переменная окружения: TELEGRAM_BOT_TOKEN")
+        sys.exit(1)
+
+def run_batch_mode(args):
+    """Пакетный прогон вопросов через FAQ"""
+    from app.batch import run_batch
+    
+    logger.info(f"📦 Режим: BATCH ({args.batch} → {args.output})")
+    run_batch(
+        args.batch,
+        args.output,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        threshold=args.threshold
+    )
 
 def main():
     """Запуск приложения"""
-    from app.bot import create_bot_polling, create_bot_webhook
-    
     # Парсер аргументов
     parser = argparse.ArgumentParser(description='SberMobile Telegram Bot')
     parser.add_argument('--polling', action='store_true', help='Использовать polling режим (бесплатный)')
     parser.add_argument('--webhook', action='store_true', help='Использовать webhook режим (требует платный Render)')
+    parser.add_argument('--batch', metavar='INPUT', help='Прогнать вопросы из JSONL/CSV через FAQ (- для stdin)')
+    parser.add_argument('--output', default='-', help='Куда писать результаты --batch: .jsonl, .csv или - для stdout')
+    parser.add_argument('--workers', type=int, help='Число процессов: для --batch (по умолчанию — число CPU) и для --webhook (WEBHOOK_WORKERS)')
+    parser.add_argument('--chunk-size', type=int, help='Вопросов в одной порции для воркера')
+    parser.add_argument('--threshold', type=float, default=0.5, help='Порог сходства для --batch')
     args = parser.parse_args()
     
+    if args.batch:
+        run_batch_mode(args)
+        return
+    
+    check_token()
+    from app.bot import create_bot_polling, create_bot_webhook
+    
     logger.info("🚀 Запуск SberMobile Support Bot...")
     
     # Определить режим
@@ -50,7 +74,7 @@ def main():
         port = int(os.getenv('PORT', 8000))
         logger.info(f"🔌 Порт: {port}")
         logger.info(f"🔗 Webhook URL: {webhook_url}")
-        create_bot_webhook(port=port, webhook_url=webhook_url)
+        create_bot_webhook(port=port, webhook_url=webhook_url, workers=args.workers)
         
     else:
         # По умолчанию polling (для Render Free Tier)
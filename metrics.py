@@ -0,0 +1,204 @@
+"""
+app/metrics.py
+Инструментирование: счетчики и гистограммы задержек по этапам обработки
+Отдаются в формате Prometheus (webhook) или периодически пишутся в лог (polling)
+"""
+
+import os
+import time
+import logging
+import functools
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Порт HTTP-эндпоинта /metrics (0 — не поднимать) и период дампа в лог (сек)
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9100))
+METRICS_LOG_INTERVAL = float(os.getenv('METRICS_LOG_INTERVAL', 300))
+
+# Границы корзин гистограмм
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+_HELP = {
+    'bot_stage_seconds': 'Задержка этапов обработки сообщения',
+    'bot_handler_seconds': 'Полное время работы обработчика',
+    'bot_handler_errors_total': 'Исключения в обработчиках',
+    'bot_errors_total': 'Ошибки, дошедшие до error_handler',
+    'faq_match_score': 'Распределение сходства лучшего вопроса FAQ',
+    'faq_matches_total': 'Результаты поиска по FAQ',
+    'bot_outbound_wait_seconds': 'Ожидание исходящего запроса в лимитах Telegram',
+    'bot_outbound_retry_after_total': 'Ответы 429 (RetryAfter) от Bot API'
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_collectors = []
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted(labels.items())))
+
+def inc(name: str, value: float = 1, **labels):
+    """Увеличить счетчик"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name: str, value: float, buckets: tuple = LATENCY_BUCKETS, **labels):
+    """Добавить наблюдение в гистограмму"""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            # [границы, счетчики по корзинам (+Inf последней), сумма, количество]
+            histogram = _histograms[key] = [buckets, [0] * (len(buckets) + 1), 0.0, 0]
+        histogram[1][bisect_left(histogram[0], value)] += 1
+        histogram[2] += value
+        histogram[3] += 1
+
+@contextmanager
+def timer(name: str, **labels):
+    """Измерить длительность блока и записать ее в гистограмму"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+def stage(name: str):
+    """Таймер этапа обработки сообщения"""
+    return timer('bot_stage_seconds', stage=name)
+
+def instrumented(handler_name: str):
+    """Декоратор для async-обработчика: время работы и исключения"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                inc('bot_handler_errors_total', handler=handler_name, error=type(e).__name__)
+                raise
+            finally:
+                observe('bot_handler_seconds', time.perf_counter() - started, handler=handler_name)
+        return wrapper
+    return decorator
+
+def register_collector(prefix: str, func):
+    """Зарегистрировать функцию, возвращающую dict числовых метрик (снимается при экспорте)"""
+    if all(existing != prefix for existing, _ in _collectors):
+        _collectors.append((prefix, func))
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+def _collect_gauges() -> dict:
+    gauges = {}
+    for prefix, func in _collectors:
+        try:
+            values = func()
+        except Exception as e:
+            logger.warning(f"⚠️  Не удалось снять метрики {prefix}: {e}")
+            continue
+        for name, value in values.items():
+            if isinstance(value, (int, float)):
+                gauges[f"{prefix}_{name}"] = float(value)
+    return gauges
+
+def render_prometheus() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (h[0], list(h[1]), h[2], h[3]) for key, h in _histograms.items()}
+    
+    lines = []
+    seen = set()
+    
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            seen.add(name)
+            if name in _HELP:
+                lines.append(f"# HELP {name} {_HELP[name]}")
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    
+    for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+        if name not in seen:
+            seen.add(name)
+            if name in _HELP:
+                lines.append(f"# HELP {name} {_HELP[name]}")
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', bound),))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    
+    for name, value in sorted(_collect_gauges().items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    
+    return '\n'.join(lines) + '\n'
+
+def _quantile(buckets: tuple, counts: list, count: int, q: float) -> float:
+    """Оценка квантиля по корзинам (верхняя граница корзины)"""
+    target = q * count
+    cumulative = 0
+    for bound, bucket_count in zip(buckets, counts):
+        cumulative += bucket_count
+        if cumulative >= target:
+            return bound
+    return float('inf')
+
+def log_summary():
+    """Записать сводку метрик в лог"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (h[0], list(h[1]), h[2], h[3]) for key, h in _histograms.items()}
+    
+    for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+        if not count:
+            continue
+        p95 = _quantile(buckets, counts, count, 0.95)
+        logger.info(f"📈 {name}{_format_labels(labels)}: n={count}, avg={total / count:.4f}, p95≤{p95}")
+    
+    for (name, labels), value in sorted(counters.items()):
+        logger.info(f"📈 {name}{_format_labels(labels)}: {value:g}")
+    
+    for name, value in sorted(_collect_gauges().items()):
+        logger.info(f"📈 {name}: {value:g}")
+
+async def start_metrics_server(port: int = None, routes: dict = None):
+    """
+    Поднять HTTP-сервер с /metrics (aiohttp); вернуть runner для остановки
+    
+    Args:
+        port: Порт (по умолчанию METRICS_PORT)
+        routes: Дополнительные GET-эндпоинты {путь: обработчик}, например /healthz
+    """
+    from aiohttp import web
+    
+    port = port or METRICS_PORT
+    
+    async def metrics_view(request):
+        return web.Response(text=render_prometheus(), content_type='text/plain', charset='utf-8')
+    
+    web_app = web.Application()
+    web_app.router.add_get('/metrics', metrics_view)
+    for path, handler in (routes or {}).items():
+        web_app.router.add_get(path, handler)
+    
+    runner = web.AppRunner(web_app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    
+    logger.info(f"📈 Метрики доступны на :{port}/metrics")
+    return runner
@@ -0,0 +1,251 @@
+"""
+app/outbound.py
+Исходящие запросы к Bot API: лимиты Telegram, повтор после 429 и индикатор печати
+
+Лимитер встраивается в Application (ApplicationBuilder.rate_limiter) и
+пропускает через корзины токенов каждый запрос бота: общую на бота и
+отдельную на чат. Время ожидания в корзинах пишется в метрики.
+
+Индикатор "печатает..." отправляется, только если ответ не готов за
+TYPING_ACTION_DELAY, и не повторяется для чата, пока предыдущий еще виден.
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from app.metrics import observe, inc
+
+logger = logging.getLogger(__name__)
+
+# Общий лимит бота (сообщений в секунду и допустимый всплеск)
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', 30))
+OUTBOUND_GLOBAL_BURST = float(os.getenv('OUTBOUND_GLOBAL_BURST', 30))
+
+# Лимит на личный чат и на группу (в группах Telegram разрешает ~20 сообщений в минуту)
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', 1))
+OUTBOUND_CHAT_BURST = float(os.getenv('OUTBOUND_CHAT_BURST', 3))
+OUTBOUND_GROUP_RATE = float(os.getenv('OUTBOUND_GROUP_RATE', 20 / 60))
+OUTBOUND_GROUP_BURST = float(os.getenv('OUTBOUND_GROUP_BURST', 3))
+
+# Сколько раз повторять запрос после 429 (RetryAfter)
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', 3))
+
+# Сколько корзин чатов держать в памяти (простаивающие удаляются)
+OUTBOUND_MAX_CHAT_BUCKETS = int(os.getenv('OUTBOUND_MAX_CHAT_BUCKETS', 10000))
+
+# Показать "печатает...", если ответ не готов за столько секунд
+TYPING_ACTION_DELAY = float(os.getenv('TYPING_ACTION_DELAY', 0.5))
+
+# Сколько Telegram показывает действие в чате (сек): повтор раньше не нужен
+CHAT_ACTION_TTL = float(os.getenv('CHAT_ACTION_TTL', 4.5))
+
+class TokenBucket:
+    """
+    Корзина токенов с резервированием
+    
+    reserve() сразу забирает токен (баланс может уйти в минус) и возвращает,
+    сколько ждать до его появления: ожидающие обслуживаются по очереди.
+    """
+    
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def reserve(self) -> float:
+        """Забрать токен; вернуть задержку (сек) до момента, когда он доступен"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+    
+    def try_acquire(self) -> bool:
+        """Забрать токен, только если он есть прямо сейчас"""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+    
+    def idle(self) -> bool:
+        """Корзина полна — ее можно удалить без потери состояния"""
+        self._refill(time.monotonic())
+        return self.tokens >= self.burst
+
+class OutboundRateLimiter(BaseRateLimiter):
+    """
+    Лимитер исходящих запросов бота
+    
+    - запросы в чат ждут токен корзины чата, затем общей корзины;
+    - действия в чате (sendChatAction) не ждут: повтор действия, которое
+      еще видно в чате, и действие при пустой общей корзине отбрасываются;
+    - после 429 все запросы ждут retry_after, запрос повторяется.
+    """
+    
+    def __init__(self, global_rate: float = None, global_burst: float = None,
+                 chat_rate: float = None, chat_burst: float = None,
+                 group_rate: float = None, group_burst: float = None,
+                 max_retries: int = None):
+        self.global_bucket = TokenBucket(
+            global_rate or OUTBOUND_GLOBAL_RATE,
+            global_burst or OUTBOUND_GLOBAL_BURST
+        )
+        self.chat_limits = (chat_rate or OUTBOUND_CHAT_RATE, chat_burst or OUTBOUND_CHAT_BURST)
+        self.group_limits = (group_rate or OUTBOUND_GROUP_RATE, group_burst or OUTBOUND_GROUP_BURST)
+        self.max_retries = OUTBOUND_MAX_RETRIES if max_retries is None else max_retries
+        
+        self._chat_buckets = {}
+        self._chat_actions = {}
+        self._paused_until = 0.0
+        self._waiting = 0
+        self.stats = {
+            'requests': 0,
+            'delayed': 0,
+            'retry_after': 0,
+            'chat_actions_sent': 0,
+            'chat_actions_deduped': 0,
+            'chat_actions_dropped': 0
+        }
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        self._chat_buckets.clear()
+        self._chat_actions.clear()
+    
+    def get_stats(self) -> dict:
+        """Показатели лимитера для /metrics"""
+        return {
+            **self.stats,
+            'waiting': self._waiting,
+            'chat_buckets': len(self._chat_buckets),
+            'paused_seconds': max(0.0, self._paused_until - time.monotonic())
+        }
+    
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= OUTBOUND_MAX_CHAT_BUCKETS:
+                self._evict_idle()
+            # Отрицательный id (или @username) — группа или канал
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate, burst = self.group_limits if is_group else self.chat_limits
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, burst)
+        return bucket
+    
+    def _evict_idle(self):
+        """Удалить корзины простаивающих чатов и устаревшие отметки действий"""
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.idle()]:
+            del self._chat_buckets[chat_id]
+        
+        now = time.monotonic()
+        for chat_id in [chat_id for chat_id, (_, sent_at) in self._chat_actions.items() if now - sent_at >= CHAT_ACTION_TTL]:
+            del self._chat_actions[chat_id]
+    
+    def _skip_chat_action(self, chat_id, action: str) -> bool:
+        """Действие в чате не отправляется, если оно еще видно или бот упирается в лимит"""
+        now = time.monotonic()
+        last_action, sent_at = self._chat_actions.get(chat_id, (None, 0.0))
+        if last_action == action and now - sent_at < CHAT_ACTION_TTL:
+            self.stats['chat_actions_deduped'] += 1
+            return True
+        
+        # Запоздавший индикатор бесполезен: при исчерпанном лимите его лучше не слать
+        if now < self._paused_until or not self.global_bucket.try_acquire():
+            self.stats['chat_actions_dropped'] += 1
+            return True
+        
+        if len(self._chat_actions) >= OUTBOUND_MAX_CHAT_BUCKETS:
+            self._evict_idle()
+        self._chat_actions[chat_id] = (action, now)
+        self.stats['chat_actions_sent'] += 1
+        return False
+    
+    async def _wait_for_slot(self, chat_id) -> float:
+        """Дождаться токенов чата и общей корзины и конца паузы после 429; вернуть время ожидания"""
+        started = time.monotonic()
+        self._waiting += 1
+        try:
+            if chat_id is not None:
+                delay = self._chat_bucket(chat_id).reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            
+            delay = self.global_bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            while time.monotonic() < self._paused_until:
+                await asyncio.sleep(self._paused_until - time.monotonic())
+        finally:
+            self._waiting -= 1
+        return time.monotonic() - started
+    
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        self.stats['requests'] += 1
+        
+        if endpoint == 'sendChatAction' and chat_id is not None:
+            if self._skip_chat_action(chat_id, data.get('action')):
+                return True
+            return await callback(*args, **kwargs)
+        
+        for attempt in range(self.max_retries + 1):
+            waited = await self._wait_for_slot(chat_id)
+            observe('bot_outbound_wait_seconds', waited, method=endpoint)
+            if waited > 0.001:
+                self.stats['delayed'] += 1
+            
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.stats['retry_after'] += 1
+                inc('bot_outbound_retry_after_total', method=endpoint)
+                if attempt >= self.max_retries:
+                    raise
+                
+                # Флуд-контроль Telegram действует на весь бот: остановить все запросы
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                logger.warning(f"⚠️  Telegram 429 на {endpoint}: пауза {e.retry_after} с (попытка {attempt + 1})")
+                continue
+            
+            # Сообщение в чат убирает индикатор действия: следующий нужно отправить заново
+            if chat_id is not None:
+                self._chat_actions.pop(chat_id, None)
+            return result
+
+async def answer_with_typing(chat, awaitable, delay: float = None):
+    """
+    Дождаться результата, показав "печатает...", только если он не готов за delay
+    
+    Индикатор отправляется параллельно с вычислением; перед возвратом
+    результата его отправка дожидается, чтобы он не пришел после ответа.
+    """
+    delay = TYPING_ACTION_DELAY if delay is None else delay
+    task = asyncio.ensure_future(awaitable)
+    
+    done, _ = await asyncio.wait({task}, timeout=delay)
+    if done:
+        return task.result()
+    
+    typing = asyncio.ensure_future(chat.send_action('typing'))
+    try:
+        return await task
+    finally:
+        try:
+            await typing
+        except Exception as e:
+            logger.warning(f"⚠️  Не удалось отправить индикатор печати: {e}")
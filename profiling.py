@@ -0,0 +1,269 @@
+"""
+app/profiling.py
+Профилирование медленных сообщений в продакшене (включается по желанию)
+
+Обработчики обернуты декоратором profiled. Пока профилирование выключено,
+обертка лишь проверяет флаг и вызывает обработчик. Когда оно включено
+(PROFILE_SAMPLE_RATE / PROFILE_SLOW_MS или командой /profile), каждый
+апдейт регистрируется у сэмплера стеков. Фоновый поток раз в
+PROFILE_INTERVAL_MS снимает стеки всех потоков и приписывает их апдейту,
+в цепочке вызовов которого стоит его обертка (или вызов в пуле поиска
+по FAQ). Профиль сохраняется, если апдейт попал в выборку или обработка
+заняла больше порога.
+
+cProfile здесь не подходит: он профилирует поток целиком, а в одном
+event loop одновременно обрабатываются апдейты разных чатов.
+
+Профили — JSON со свернутыми стеками ("f1;f2;f3": число сэмплов, формат
+flamegraph/speedscope) и параметрами апдейта: длина запроса, размер FAQ
+(отмечает сам поиск, в режиме process не известен), сходство. Файлы пишутся
+в data/profiles/, хранятся последние PROFILE_MAX_FILES.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+import functools
+import contextvars
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Доля апдейтов, профиль которых сохраняется всегда (0 — выборка выключена)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+
+# Сохранять профиль апдейтов, обработка которых дольше порога (мс, 0 — выключено)
+PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', 0))
+
+# Период снятия стеков (мс)
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+
+PROFILE_DIR = Path(os.getenv('PROFILE_DIR') or Path(__file__).parent.parent / "data" / "profiles")
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 200))
+
+_config = {'sample_rate': min(1.0, max(0.0, PROFILE_SAMPLE_RATE)), 'slow_ms': max(0.0, PROFILE_SLOW_MS)}
+_enabled = _config['sample_rate'] > 0 or _config['slow_ms'] > 0
+
+# id кадра обертки (или вызова в пуле) → профилируемый апдейт
+_active = {}
+_current = contextvars.ContextVar('profile_capture', default=None)
+_profile_stats = {'captures': 0, 'saved': 0, 'samples': 0, 'write_errors': 0}
+_sampler = None
+_sampler_lock = threading.Lock()
+# Сэмплер дописывает стеки из своего потока: запись и снимок профиля — под блокировкой
+_samples_lock = threading.Lock()
+_saved_seq = 0
+
+class _Capture:
+    """Сэмплы стеков и параметры одного профилируемого апдейта"""
+    
+    __slots__ = ('handler', 'sampled', 'stacks', 'samples', 'meta')
+    
+    def __init__(self, handler: str, sampled: bool):
+        self.handler = handler
+        self.sampled = sampled
+        self.stacks = Counter()
+        self.samples = 0
+        self.meta = {}
+
+class _StackSampler(threading.Thread):
+    """Фоновый поток: снимает стеки, пока есть профилируемые апдейты"""
+    
+    def __init__(self):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.wake = threading.Event()
+    
+    def run(self):
+        while True:
+            if not _active:
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            time.sleep(PROFILE_INTERVAL_MS / 1000)
+            self.sample()
+    
+    def sample(self):
+        me = threading.get_ident()
+        hits = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            
+            stack = []
+            capture = None
+            while frame is not None:
+                capture = _active.get(id(frame))
+                if capture is not None:
+                    break
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            
+            if capture is not None:
+                hits.append((capture, ';'.join(reversed(stack))))
+        
+        with _samples_lock:
+            for capture, stack in hits:
+                capture.stacks[stack] += 1
+                capture.samples += 1
+            _profile_stats['samples'] += len(hits)
+
+def _ensure_sampler() -> _StackSampler:
+    global _sampler
+    
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = _StackSampler()
+            _sampler.start()
+        return _sampler
+
+def configure_profiler(sample_rate: float = None, slow_ms: float = None) -> dict:
+    """Задать долю выборки и порог медленных апдейтов (0 и 0 — выключить)"""
+    global _enabled
+    
+    if sample_rate is not None:
+        _config['sample_rate'] = min(1.0, max(0.0, sample_rate))
+    if slow_ms is not None:
+        _config['slow_ms'] = max(0.0, slow_ms)
+    _enabled = _config['sample_rate'] > 0 or _config['slow_ms'] > 0
+    
+    if _enabled:
+        logger.info(
+            f"🔬 Профилирование включено: выборка {_config['sample_rate']:.1%}, "
+            f"порог {_config['slow_ms']:.0f} мс → {PROFILE_DIR}"
+        )
+    else:
+        logger.info("🔬 Профилирование выключено")
+    return get_profiler_status()
+
+def get_profiler_status() -> dict:
+    """Настройки и счетчики профилировщика (для /profile и /metrics)"""
+    return {
+        'enabled': _enabled,
+        'sample_rate': _config['sample_rate'],
+        'slow_ms': _config['slow_ms'],
+        'active': len(_active),
+        **_profile_stats
+    }
+
+def annotate(**fields):
+    """Добавить параметры к профилю текущего апдейта (без профилирования — ничего не делает)"""
+    capture = _current.get()
+    if capture is not None:
+        capture.meta.update(fields)
+
+def _call_with_capture(capture: _Capture, func, args, kwargs):
+    """Вызов в потоке пула: сэмплы этого потока и annotate() в нем приписываются апдейту"""
+    frame_id = id(sys._getframe())
+    _active[frame_id] = capture
+    token = _current.set(capture)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _current.reset(token)
+        _active.pop(frame_id, None)
+
+def bind_capture(func):
+    """Привязать функцию, которая выполнится в потоке пула, к профилю текущего апдейта"""
+    capture = _current.get()
+    if capture is None:
+        return func
+    return lambda *args, **kwargs: _call_with_capture(capture, func, args, kwargs)
+
+def _rotate():
+    """Оставить последние PROFILE_MAX_FILES профилей"""
+    files = sorted(PROFILE_DIR.glob('*.json'))
+    for path in files[:max(0, len(files) - PROFILE_MAX_FILES)]:
+        path.unlink(missing_ok=True)
+
+def _write_profile(name: str, record: dict):
+    """Записать профиль (выполняется вне event loop)"""
+    try:
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        path = PROFILE_DIR / name
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        tmp_path.replace(path)
+        _rotate()
+    except OSError as e:
+        _profile_stats['write_errors'] += 1
+        logger.warning(f"⚠️  Не удалось записать профиль {name}: {e}")
+
+def _save(capture: _Capture, elapsed: float, error: str = None):
+    """Собрать запись профиля и отдать ее на запись в пул потоков"""
+    global _saved_seq
+    
+    meta = dict(capture.meta)
+    with _samples_lock:
+        samples = capture.samples
+        stacks = dict(capture.stacks.most_common())
+    
+    elapsed_ms = elapsed * 1000
+    record = {
+        'handler': capture.handler,
+        'reason': 'sample' if capture.sampled else 'slow',
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(time.time() - elapsed)),
+        'duration_ms': round(elapsed_ms, 2),
+        'interval_ms': PROFILE_INTERVAL_MS,
+        'samples': samples,
+        # Время, когда апдейт не выполнялся ни в одном потоке: ожидание Bot API, очереди, пула
+        'waiting_ms': round(max(0.0, elapsed_ms - samples * PROFILE_INTERVAL_MS), 2),
+        'error': error,
+        **meta,
+        'stacks': stacks
+    }
+    
+    _saved_seq += 1
+    _profile_stats['saved'] += 1
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{_saved_seq:06d}-{capture.handler}-{elapsed_ms:.0f}ms.json"
+    asyncio.get_running_loop().run_in_executor(None, _write_profile, name, record)
+
+async def _profile_call(handler_name: str, func, update, context):
+    """Выполнить обработчик под сэмплером и сохранить профиль, если он нужен"""
+    capture = _Capture(handler_name, random.random() < _config['sample_rate'])
+    message = getattr(update, 'effective_message', None)
+    if message is not None and message.text:
+        capture.meta['query_length'] = len(message.text)
+    
+    frame_id = id(sys._getframe())
+    _active[frame_id] = capture
+    token = _current.set(capture)
+    _profile_stats['captures'] += 1
+    _ensure_sampler().wake.set()
+    
+    started = time.perf_counter()
+    error = None
+    try:
+        return await func(update, context)
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        _active.pop(frame_id, None)
+        _current.reset(token)
+        
+        slow_ms = _config['slow_ms']
+        if capture.sampled or (slow_ms and elapsed * 1000 >= slow_ms):
+            try:
+                _save(capture, elapsed, error)
+            except Exception as e:
+                logger.warning(f"⚠️  Не удалось сохранить профиль {handler_name}: {e}")
+
+def profiled(handler_name: str):
+    """Декоратор для async-обработчика: профилирование, если оно включено"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(update, context):
+            if not _enabled:
+                return await func(update, context)
+            return await _profile_call(handler_name, func, update, context)
+        return wrapper
+    return decorator
@@ -0,0 +1,208 @@
+"""
+app/responses.py
+Заранее отрендеренные тексты ответов бота
+
+Статические ответы команд собираются один раз при импорте, список категорий —
+при загрузке каждой версии базы. Ответ на вопрос FAQ рендерится при первой
+отправке и запоминается в ограниченном кэше: записи базы при старте не
+перебираются (снимок FAQ читается лениво). При отправке подставляются
+только имя пользователя и релевантность.
+"""
+
+import os
+import html
+import logging
+import threading
+from functools import lru_cache
+
+from app.faq_engine import get_faq_index
+
+logger = logging.getLogger(__name__)
+
+# Сколько отрендеренных ответов FAQ держать в памяти
+RENDERED_ANSWERS_MAX = int(os.getenv('RENDERED_ANSWERS_MAX', 1024))
+
+# Константы
+SUPPORT_PHONE = "☎️ +7 (499) 651-44-44"
+SUPPORT_WEBSITE = "https://sbermobile.ru/faq/"
+SUPPORT_SHORTCODE = "901"
+
+WELCOME_HEAD = "👋 Привет, "
+WELCOME_TAIL = (
+    "!\n\n"
+    "🤖 Я <b>SberMobile Support Bot</b> — ваш помощник по вопросам SberMobile\n\n"
+    "Я помогу ответить на вопросы о:\n"
+    "• 💳 Тарифах и услугах\n"
+    "• 🔄 Переносе номера\n"
+    "• 📱 eSIM\n"
+    "• ⭐ Подписке СберПрайм\n"
+    "• 📞 Мобильной связи и интернете\n"
+    "• 📋 И многом другом\n\n"
+    "<b>Начните с вопроса → я найду ответ! 🔍</b>\n\n"
+    "Доступные команды:\n"
+    "/help — справка\n"
+    "/categories — категории FAQ\n"
+    "/contact — контакты поддержки"
+)
+
+HELP_TEXT = (
+    "<b>❓ Справка по использованию бота</b>\n\n"
+    "<b>Как использовать:</b>\n"
+    "1. Напишите свой вопрос об SberMobile\n"
+    "2. Бот найдет ответ в базе знаний\n"
+    "3. Получите подробный ответ\n\n"
+    "<b>Примеры вопросов:</b>\n"
+    "• Как подключить eSIM?\n"
+    "• Какие тарифы доступны?\n"
+    "• Как перенести номер?\n"
+    "• Что входит в СберПрайм?\n\n"
+    "<b>Если ответ не найден:</b>\n"
+    "✉️ Напишите в поддержку\n"
+    f"{SUPPORT_PHONE}\n"
+    f"Короткий номер: {SUPPORT_SHORTCODE}\n"
+    f"🌐 {SUPPORT_WEBSITE}\n\n"
+    "<b>Доступные команды:</b>\n"
+    "/start — начать заново\n"
+    "/categories — показать категории\n"
+    "/contact — контакты поддержки"
+)
+
+CONTACT_TEXT = (
+    "<b>☎️ Контакты поддержки SberMobile</b>\n\n"
+    f"<b>Основной номер:</b>\n{SUPPORT_PHONE}\n\n"
+    f"<b>Короткий номер (для номеров СберМобайла):</b>\n{SUPPORT_SHORTCODE}\n\n"
+    f"<b>Веб-версия FAQ:</b>\n{SUPPORT_WEBSITE}\n\n"
+    "<b>Режим работы:</b>\n24/7\n\n"
+    "<b>Время ответа на тикеты:</b>\n⏱️ До 5 дней"
+)
+
+NOT_FOUND_HEAD = "🤔 <b>К сожалению, я не нашел точный ответ на твой вопрос.</b>\n\n"
+NOT_FOUND_TAIL = (
+    "Возможно:\n"
+    "1️⃣ Попробуй переформулировать вопрос\n"
+    "2️⃣ Используй /categories для просмотра тем\n"
+    "3️⃣ Обратись в поддержку\n\n"
+    f"☎️ {SUPPORT_PHONE}\n"
+    f"📱 {SUPPORT_SHORTCODE} (для номеров СберМобайла)\n\n"
+    "Попробуем еще? 🔄"
+)
+NOT_FOUND_TEXT = NOT_FOUND_HEAD + NOT_FOUND_TAIL
+
+ERROR_TEXT = (
+    "🚨 <b>Произошла ошибка при обработке вашего запроса.</b>\n\n"
+    "Пожалуйста, попробуйте позже или напишите в поддержку:\n"
+    f"☎️ {SUPPORT_PHONE}"
+)
+
+STATS_NOT_READY_TEXT = "⏳ Статистика еще собирается, попробуйте через минуту."
+
+PROFILE_USAGE_TEXT = (
+    "<b>🔬 Профилирование</b>\n\n"
+    "/profile — состояние\n"
+    "/profile sample 0.05 — сохранять профиль 5% сообщений\n"
+    "/profile slow 500 — сохранять профиль сообщений дольше 500 мс\n"
+    "/profile off — выключить"
+)
+
+ANSWER_TAIL = "</i>\n\nЕсть еще вопросы? 🤔"
+
+@lru_cache(maxsize=RENDERED_ANSWERS_MAX)
+def _answer_head(answer: str, category: str) -> str:
+    """Текст найденного ответа до значения релевантности"""
+    return (
+        "✅ <b>Нашел ответ:</b>\n\n"
+        f"{answer}\n\n"
+        f"<i>Категория: {category}</i>\n"
+        "<i>Релевантность: "
+    )
+
+def _categories_text(categories) -> str:
+    lines = [f"{i}. {category}\n" for i, category in enumerate(categories, 1)]
+    return (
+        "<b>📂 Категории FAQ SberMobile</b>\n\n"
+        + "".join(lines)
+        + "\n<i>Спросите что-то из этих категорий, и я найду ответ!</i>\n"
+        "Например: \"Как подключить eSIM?\""
+    )
+
+_rendered_lock = threading.Lock()
+
+def prerender(base: str = None) -> str:
+    """
+    Отрендерить список категорий текущей версии базы FAQ (если еще не отрендерен)
+    
+    Текст хранится в самом индексе и вытесняется из памяти вместе с базой.
+    """
+    index = get_faq_index(base)
+    rendered = index.extras.get('categories_text')
+    if rendered is not None:
+        return rendered
+    
+    with _rendered_lock:
+        rendered = index.extras.get('categories_text')
+        if rendered is None:
+            rendered = index.extras['categories_text'] = _categories_text(index.categories)
+            logger.info(f"🖨️  Категории FAQ {index.name} отрендерены: {len(index.categories)} (версия {index.version})")
+        return rendered
+
+def welcome_text(first_name: str) -> str:
+    """Приветствие для /start"""
+    return WELCOME_HEAD + first_name + WELCOME_TAIL
+
+def categories_text(base: str = None) -> str:
+    """Список категорий базы знаний для /categories"""
+    return prerender(base)
+
+def answer_text(result: dict) -> str:
+    """Ответ на найденный вопрос FAQ (результат find_answer)"""
+    head = _answer_head(result['answer'], result['category'])
+    return f"{head}{result['similarity_score']:.0%}{ANSWER_TAIL}"
+
+def not_found_text(suggestions: list) -> str:
+    """Ответ "не найдено" с подсказками похожих вопросов"""
+    if not suggestions:
+        return NOT_FOUND_TEXT
+    return (
+        NOT_FOUND_HEAD
+        + "<b>Похожие вопросы:</b>\n" + "".join(f"• {q}\n" for q in suggestions) + "\n"
+        + NOT_FOUND_TAIL
+    )
+
+def profile_text(status: dict) -> str:
+    """Ответ на /profile: настройки и счетчики профилировщика"""
+    if not status['enabled']:
+        return "🔬 Профилирование выключено.\n\n" + PROFILE_USAGE_TEXT
+    
+    return (
+        "<b>🔬 Профилирование включено</b>\n\n"
+        f"Выборка: {status['sample_rate']:.1%}\n"
+        f"Порог медленных: {status['slow_ms']:.0f} мс\n"
+        f"Апдейтов под наблюдением: {status['captures']}, сохранено профилей: {status['saved']}\n"
+        f"<i>Профили: data/profiles/</i>"
+    )
+
+def stats_text(snapshot: dict) -> str:
+    """Ответ на /stats из снимка статистики"""
+    stats = snapshot['stats']
+    if not stats:
+        return STATS_NOT_READY_TEXT
+    
+    lines = [
+        "<b>📊 Статистика бота</b>\n",
+        f"Запросов: {stats['total_queries']}",
+        f"Найдено ответов: {stats['found_answers']} ({stats['success_rate']:.1f}%)",
+        f"Пользователей: {stats['unique_users']}"
+    ]
+    
+    if stats['top_categories']:
+        lines.append("\n<b>Топ категорий:</b>")
+        lines.extend(f"• {html.escape(item['category'])} — {item['count']}" for item in stats['top_categories'])
+    
+    if stats['top_questions']:
+        lines.append("\n<b>Топ вопросов:</b>")
+        lines.extend(f"• {html.escape(item['question'][:80])} — {item['count']}" for item in stats['top_questions'])
+    
+    lines.append(
+        f"\n<i>Обновлено {snapshot['age_seconds']:.0f} с назад, расчет {snapshot['refresh_ms']:.0f} мс</i>"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,84 @@
+"""
+app/sessions.py
+Контекст диалога: категория последнего найденного ответа для каждого пользователя
+
+Хранится в памяти процесса с ограничением по числу пользователей (LRU)
+и временем жизни (TTL). Запись — кортеж (база, категория, срок годности),
+где категория — ссылка на строку из индекса FAQ, поэтому запись занимает
+десятки байт. Тема действует только в той базе FAQ, где был найден ответ.
+Вызывается из event loop, блокировки не нужны.
+"""
+
+import os
+import time
+
+# Сколько помнить тему пользователя (сек) и сколько пользователей держать в памяти
+SESSION_TTL = float(os.getenv('SESSION_TTL', 900))
+SESSION_MAX_USERS = int(os.getenv('SESSION_MAX_USERS', 100000))
+
+# dict сохраняет порядок вставки: первая запись — самая давно использованная
+_sessions = {}
+_session_stats = {'hits': 0, 'misses': 0, 'expirations': 0, 'evictions': 0, 'base_changes': 0}
+_category_search_stats = {'stops': 0, 'fallbacks': 0}
+
+def get_session_category(user_id: int, base: str):
+    """Категория последнего ответа пользователя в базе base или None (нет сессии, истекла, другая база)"""
+    entry = _sessions.pop(user_id, None)
+    if entry is None:
+        _session_stats['misses'] += 1
+        return None
+    
+    session_base, category, expires_at = entry
+    if expires_at <= time.monotonic():
+        _session_stats['expirations'] += 1
+        _session_stats['misses'] += 1
+        return None
+    if session_base != base:
+        # Тема из другой базы здесь не имеет смысла
+        _session_stats['base_changes'] += 1
+        _session_stats['misses'] += 1
+        return None
+    
+    # Вернуть в конец как недавно использованную
+    _sessions[user_id] = entry
+    _session_stats['hits'] += 1
+    return category
+
+def remember_session_category(user_id: int, category: str, base: str):
+    """Запомнить категорию найденного в базе base ответа (продлевает сессию)"""
+    if SESSION_MAX_USERS <= 0:
+        return
+    
+    _sessions.pop(user_id, None)
+    _sessions[user_id] = (base, category, time.monotonic() + SESSION_TTL)
+    
+    while len(_sessions) > SESSION_MAX_USERS:
+        del _sessions[next(iter(_sessions))]
+        _session_stats['evictions'] += 1
+
+def forget_session(user_id: int):
+    """Забыть контекст пользователя"""
+    _sessions.pop(user_id, None)
+
+def record_category_search(result: dict):
+    """Учесть исход поиска с темой из сессии (по отметке category_search в результате)"""
+    outcome = result.get('category_search')
+    if outcome == 'stop':
+        _category_search_stats['stops'] += 1
+    elif outcome == 'fallback':
+        _category_search_stats['fallbacks'] += 1
+
+def get_category_search_stats() -> dict:
+    """Сколько поисков завершилось в категории из сессии, а сколько ушло в полный поиск"""
+    stats = dict(_category_search_stats)
+    total = stats['stops'] + stats['fallbacks']
+    stats['stop_rate'] = stats['stops'] / total if total else 0
+    return stats
+
+def get_session_stats() -> dict:
+    """Счетчики сессий для /metrics"""
+    stats = dict(_session_stats)
+    stats['users'] = len(_sessions)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0
+    return stats
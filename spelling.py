@@ -0,0 +1,128 @@
+"""
+app/spelling.py
+Исправление опечаток в запросе по словарю FAQ (SymSpell: словарь удалений)
+"""
+
+import re
+
+WORD_RE = re.compile(r'\w+')
+
+# Транслитерация для слов, набранных кириллицей вместо латиницы ("есим" → "esim")
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'c',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya'
+}
+
+def max_distance(word: str) -> int:
+    """Допустимое число правок для слова: короткие слова не исправляются"""
+    if len(word) < 4:
+        return 0
+    if len(word) < 8:
+        return 1
+    return 2
+
+def _deletes(word: str, distance: int) -> set:
+    """Все варианты слова с удалением до distance символов"""
+    result = set()
+    level = {word}
+    for _ in range(distance):
+        level = {variant[:i] + variant[i + 1:] for variant in level for i in range(len(variant))}
+        result |= level
+    return result
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Дамерау-Левенштейна (OSA); limit + 1, если больше limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+class SpellIndex:
+    """
+    Словарь слов FAQ с предвычисленными удалениями
+    
+    Поиск исправления — несколько обращений к словарю и проверка
+    расстояния для найденных кандидатов, без перебора всего словаря.
+    Слова длиннее самого длинного слова словаря (с учетом допустимых
+    правок) не исправляются: у них нет кандидатов, а число удалений
+    растет квадратично от длины.
+    """
+    
+    def __init__(self, texts):
+        self.frequency = {}
+        for text in texts:
+            for word in WORD_RE.findall(text):
+                self.frequency[word] = self.frequency.get(word, 0) + 1
+        self.max_length = max(map(len, self.frequency), default=0)
+        
+        self.deletes = {}
+        for word in self.frequency:
+            for variant in _deletes(word, max_distance(word)):
+                self.deletes.setdefault(variant, []).append(word)
+    
+    @classmethod
+    def from_tables(cls, frequency, deletes, max_length: int) -> 'SpellIndex':
+        """Индекс поверх готовых таблиц (например, из снимка FAQ)"""
+        index = cls.__new__(cls)
+        index.frequency = frequency
+        index.deletes = deletes
+        index.max_length = max_length
+        return index
+    
+    def __len__(self):
+        return len(self.frequency)
+    
+    def lookup(self, word: str) -> str:
+        """Ближайшее слово словаря или None"""
+        if word in self.frequency:
+            return word
+        
+        translit = ''.join(TRANSLIT.get(ch, ch) for ch in word)
+        if translit in self.frequency:
+            return translit
+        
+        distance = max_distance(word)
+        if not distance or len(word) > self.max_length + distance:
+            return None
+        
+        candidates = set(self.deletes.get(word, ()))
+        for variant in _deletes(word, distance):
+            if variant in self.frequency:
+                candidates.add(variant)
+            candidates.update(self.deletes.get(variant, ()))
+        
+        best = None
+        best_key = None
+        for candidate in candidates:
+            found = edit_distance(word, candidate, distance)
+            if found > distance:
+                continue
+            key = (found, -self.frequency[candidate], candidate)
+            if best_key is None or key < best_key:
+                best, best_key = candidate, key
+        return best
+    
+    def correct(self, text: str) -> str:
+        """Исправить слова нормализованного текста, которых нет в словаре FAQ"""
+        def replace(match):
+            word = match.group(0)
+            if word in self.frequency or word.isdigit():
+                return word
+            return self.lookup(word) or word
+        
+        return WORD_RE.sub(replace, text)
@@ -0,0 +1,30 @@
+"""
+Общие настройки тестов
+
+Модули лежат в корне репозитория, а в коде импортируются как пакет app
+(в Docker корень копируется в /app). Для тестов пакет app указывает на корень.
+"""
+
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+if 'app' not in sys.modules:
+    package = types.ModuleType('app')
+    package.__path__ = [str(ROOT)]
+    sys.modules['app'] = package
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Пустая БД во временной папке (app.database)"""
+    from app import database
+    
+    database._close_connections()
+    monkeypatch.setattr(database, 'DB_PATH', tmp_path / 'bot.db')
+    monkeypatch.setattr(database, 'INTERACTIONS_ARCHIVE_DIR', str(tmp_path / 'archive'))
+    yield tmp_path / 'bot.db'
+    database._close_connections()
@@ -0,0 +1,67 @@
+"""Кластеризация вопросов без ответа (MinHash + LSH)"""
+
+import random
+
+import pytest
+
+from app import clustering
+from app.batch import iter_chunk_results
+
+CHUNKS = [
+    ['Как вернуть деньги за роуминг?', 'Как вернуть деньги за роуминг?', 'Не работает eSIM после обновления'],
+    ['Как вернуть деньги за роуминг?', 'не работает esim после обновления телефона', 'Где купить сим-карту в Казани']
+]
+
+def test_iter_signed_matches_sign_chunk_in_order():
+    signed = list(clustering.iter_signed(iter(CHUNKS), workers=1))
+    expected = [item for chunk in CHUNKS for item in clustering.sign_chunk(chunk)]
+    assert [item[:3] for item in signed] == [item[:3] for item in expected]
+
+def test_shared_pool_helper_keeps_chunk_order():
+    results = iter_chunk_results(lambda chunk: [sum(chunk)], iter([[1, 2], [3], [4, 5]]), workers=1, load_faq=False)
+    assert list(results) == [3, 3, 9]
+
+def test_similar_questions_form_one_cluster():
+    clusterer = clustering.MissClusterer()
+    for item in clustering.iter_signed(iter(CHUNKS), workers=1):
+        clusterer.add(*item)
+    clusterer.merge()
+    
+    top = clusterer.top(1)[0]
+    assert top.count == 3
+    assert clusterer.rows == 6
+    # Повтор из второй пачки считается снова: это число разных текстов в пределах пачек
+    assert clusterer.chunk_distinct == 5
+
+def test_permutations_must_split_into_bands(monkeypatch):
+    monkeypatch.setattr(clustering, 'MISS_MINHASH_PERMUTATIONS', 60)
+    monkeypatch.setattr(clustering, 'MISS_LSH_BANDS', 16)
+    with pytest.raises(ValueError, match='MISS_LSH_BANDS'):
+        clustering.run_clustering(output_path='-')
+
+def _singletons(count: int) -> list:
+    """Непохожие друг на друга вопросы (случайные слова)"""
+    rng = random.Random(7)
+    letters = 'абвгдежзиклмнопрстуфхцчшщэюя'
+    return [' '.join(''.join(rng.choices(letters, k=7)) for _ in range(3)) for _ in range(count)]
+
+def test_prune_drops_a_fifth_of_singleton_clusters():
+    clusterer = clustering.MissClusterer(max_clusters=100)
+    for item in clustering.sign_chunk(['Как вернуть деньги за роуминг?'] * 5):
+        clusterer.add(*item)
+    for item in clustering.sign_chunk(_singletons(100)):
+        clusterer.add(*item)
+    
+    # Одно переполнение: отброшена ровно пятая часть, крупный кластер на месте
+    assert clusterer.prunes == 1
+    assert len(clusterer.clusters) == 81
+    assert clusterer.pruned_rows == 20
+    assert clusterer.top(1)[0].count == 5
+
+def test_many_singletons_keep_most_clusters():
+    clusterer = clustering.MissClusterer(max_clusters=100)
+    for item in clustering.sign_chunk(_singletons(500)):
+        clusterer.add(*item)
+    
+    assert len(clusterer.clusters) >= 80
+    assert clusterer.pruned_rows + sum(cluster.count for cluster in clusterer.clusters.values()) == 500
@@ -0,0 +1,91 @@
+"""Порядок апдейтов внутри чата и параллельность между чатами (PerChatUpdateProcessor)"""
+
+import asyncio
+from datetime import datetime
+
+from telegram import Chat, Message, Update
+
+from app.concurrency import PerChatUpdateProcessor
+
+def _update(update_id: int, chat_id: int) -> Update:
+    chat = Chat(id=chat_id, type=Chat.PRIVATE)
+    return Update(update_id=update_id, message=Message(message_id=update_id, date=datetime.now(), chat=chat))
+
+async def _handle(log: list, name: str, release: asyncio.Event = None):
+    log.append(('start', name))
+    if release is not None:
+        await release.wait()
+    await asyncio.sleep(0)
+    log.append(('end', name))
+
+def test_updates_of_one_chat_are_processed_in_order():
+    async def scenario():
+        processor = PerChatUpdateProcessor(4)
+        log = []
+        tasks = [
+            asyncio.create_task(processor.process_update(_update(i, 1), _handle(log, i)))
+            for i in range(5)
+        ]
+        await asyncio.gather(*tasks)
+        return log
+    
+    log = asyncio.run(scenario())
+    assert log == [(event, i) for i in range(5) for event in ('start', 'end')]
+
+def test_waiting_updates_of_busy_chat_do_not_hold_slots():
+    async def scenario():
+        # Два слота: голова чата 1 занята, еще три апдейта чата 1 ждут в его очереди
+        processor = PerChatUpdateProcessor(2)
+        log = []
+        release = asyncio.Event()
+        busy = [
+            asyncio.create_task(processor.process_update(_update(i, 1), _handle(log, f'a{i}', release if i == 0 else None)))
+            for i in range(4)
+        ]
+        await asyncio.sleep(0.01)
+        
+        # Апдейт другого чата получает второй слот, не дожидаясь очереди чата 1
+        await asyncio.wait_for(processor.process_update(_update(10, 2), _handle(log, 'b')), timeout=1)
+        assert ('end', 'b') in log
+        assert ('start', 'a1') not in log
+        
+        release.set()
+        await asyncio.gather(*busy)
+        return log
+    
+    log = asyncio.run(scenario())
+    assert [name for event, name in log if event == 'start' and name.startswith('a')] == ['a0', 'a1', 'a2', 'a3']
+
+def test_different_chats_run_concurrently_up_to_limit():
+    async def scenario():
+        processor = PerChatUpdateProcessor(3)
+        running = 0
+        peak = 0
+        
+        async def handle():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+        
+        await asyncio.gather(*(processor.process_update(_update(i, i), handle()) for i in range(8)))
+        return peak
+    
+    assert asyncio.run(scenario()) == 3
+
+def test_error_in_one_update_does_not_stop_chat_queue():
+    async def scenario():
+        processor = PerChatUpdateProcessor(2)
+        log = []
+        
+        async def fail():
+            raise RuntimeError('boom')
+        
+        await asyncio.gather(
+            processor.process_update(_update(1, 1), fail()),
+            processor.process_update(_update(2, 1), _handle(log, 'next'))
+        )
+        return log
+    
+    assert asyncio.run(scenario()) == [('start', 'next'), ('end', 'next')]
@@ -0,0 +1,145 @@
+"""Месячные партиции взаимодействий: перенос старой таблицы, сквозные id, архив и пересчет агрегатов"""
+
+import sqlite3
+from datetime import datetime, timezone
+
+from app import database
+
+def _create_legacy_table(path):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+    CREATE TABLE interactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        user_message TEXT NOT NULL,
+        found BOOLEAN NOT NULL,
+        category TEXT,
+        similarity_score REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.executemany('''
+    INSERT INTO interactions (id, user_id, user_message, found, category, similarity_score, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (10, 1, 'как подключить esim', 1, 'eSIM', 0.9, '2024-01-05 10:00:00'),
+        (11, 2, 'как перенести номер', 1, 'Номер', 0.8, '2024-02-01 09:00:00'),
+        (12, 3, 'что-то без даты', 0, None, 0.1, None),
+        (13, 3, 'как подключить esim', 1, 'eSIM', 0.9, '2024-01-20 12:00:00')
+    ])
+    conn.commit()
+    conn.close()
+
+def _interaction_ids(conn) -> list:
+    return sorted(row[0] for row in conn.execute('SELECT id FROM interactions'))
+
+def _total_queries(conn) -> int:
+    return conn.execute("SELECT value FROM stats_counters WHERE name = 'total_queries'").fetchone()[0]
+
+def _record(message: str, created_at: str, found: bool = True) -> tuple:
+    return (1, message, found, 'eSIM' if found else None, 0.9 if found else 0.1, created_at)
+
+def test_migration_keeps_ids_and_undated_rows(db):
+    _create_legacy_table(db)
+    database.init_database()
+    
+    with database.writer_connection() as conn:
+        partitions = database._list_partitions(conn)
+        assert 'interactions_2024_01' in partitions
+        assert 'interactions_2024_02' in partitions
+        assert database.UNDATED_PARTITION in partitions
+        assert _interaction_ids(conn) == [10, 11, 12, 13]
+        assert conn.execute(f'SELECT user_message FROM {database.UNDATED_PARTITION}').fetchone()[0] == 'что-то без даты'
+        assert _total_queries(conn) == 4
+
+def test_new_ids_are_unique_across_partitions(db):
+    _create_legacy_table(db)
+    database.init_database()
+    
+    database._write_batch([
+        _record('как подключить esim', '2024-01-31 23:59:59'),
+        _record('как перенести номер', '2024-03-01 00:00:00'),
+        _record('как перенести номер', '2024-02-15 00:00:00')
+    ])
+    
+    with database.writer_connection() as conn:
+        ids = _interaction_ids(conn)
+        assert len(ids) == len(set(ids)) == 7
+        assert ids[-3:] == [14, 15, 16]
+
+def test_archive_then_rebuild_counts_each_row_once(db):
+    database.init_database()
+    database._write_batch([
+        _record('как подключить esim', '2024-01-05 10:00:00'),
+        _record('неизвестный вопрос', '2024-01-06 10:00:00', found=False),
+        _record('как перенести номер', '2024-06-01 10:00:00')
+    ])
+    
+    archived = database.archive_partitions(retention_months=3, now=datetime(2024, 7, 10, tzinfo=timezone.utc))
+    assert archived == ['interactions_2024_01']
+    assert [path.name for path in database._list_archives()] == ['interactions_2024_01.jsonl.gz']
+    
+    with database.writer_connection() as conn:
+        assert 'interactions_2024_01' not in database._list_partitions(conn)
+        database._rebuild_rollups(conn, force=True)
+        assert _total_queries(conn) == 3
+    
+    assert list(database.iter_unanswered()) == [['неизвестный вопрос']]
+
+def test_failed_drop_removes_archive(db, monkeypatch):
+    database.init_database()
+    database._write_batch([
+        _record('как подключить esim', '2024-01-05 10:00:00'),
+        _record('как перенести номер', '2024-06-01 10:00:00')
+    ])
+    
+    # Строк в архиве меньше, чем в партиции: будто она изменилась во время выгрузки
+    export = database._export_partition
+    monkeypatch.setattr(database, '_export_partition', lambda name, path: export(name, path) - 1)
+    
+    archived = database.archive_partitions(retention_months=3, now=datetime(2024, 7, 10, tzinfo=timezone.utc))
+    assert archived == []
+    assert database._list_archives() == []
+    
+    with database.writer_connection() as conn:
+        assert 'interactions_2024_01' in database._list_partitions(conn)
+        database._rebuild_rollups(conn, force=True)
+        assert _total_queries(conn) == 2
+
+def test_rebuild_skips_archive_of_live_partition(db):
+    database.init_database()
+    database._write_batch([_record('как подключить esim', '2024-01-05 10:00:00')])
+    
+    # Выгрузка завершилась, а удаление партиции — нет (например, процесс упал)
+    database._export_partition('interactions_2024_01', database._archive_dir() / 'interactions_2024_01.jsonl.gz')
+    
+    with database.writer_connection() as conn:
+        database._rebuild_rollups(conn, force=True)
+        assert _total_queries(conn) == 1
+
+def test_undated_partition_is_not_archived(db):
+    _create_legacy_table(db)
+    database.init_database()
+    
+    archived = database.archive_partitions(retention_months=1, now=datetime(2030, 1, 1, tzinfo=timezone.utc))
+    assert archived[:2] == ['interactions_2024_01', 'interactions_2024_02']
+    assert database.UNDATED_PARTITION not in archived
+    with database.writer_connection() as conn:
+        assert database.UNDATED_PARTITION in database._list_partitions(conn)
+
+def test_rebuild_without_force_checks_flag_inside_transaction(db, monkeypatch):
+    database.init_database()
+    database._write_batch([_record('как подключить esim', '2024-01-05 10:00:00')])
+    applied = []
+    monkeypatch.setattr(database, '_apply_rollups', lambda conn, rows: applied.append(len(rows)))
+    
+    # Другой воркер уже пересчитал агрегаты: повторный вызов ничего не делает
+    with database.writer_connection() as conn:
+        database._rebuild_rollups(conn)
+        database._create_schema(conn)
+        assert not conn.in_transaction
+    assert applied == []
+    
+    with database.writer_connection() as conn:
+        database._rebuild_rollups(conn, force=True)
+    assert applied == [1]
@@ -0,0 +1,85 @@
+"""Именованные базы FAQ: ленивая загрузка, вытеснение по бюджету, запасная база"""
+
+import json
+
+import pytest
+
+from app import faq_engine
+
+def _faq(category: str, question: str, answer: str) -> list:
+    return [{'category': category, 'questions': [{'question': question, 'answer': answer}]}]
+
+@pytest.fixture
+def bases(tmp_path, monkeypatch):
+    """Каталог баз во временной папке и чистое состояние загруженных баз"""
+    bases_dir = tmp_path / 'bases'
+    bases_dir.mkdir()
+    faq_path = tmp_path / 'faq.json'
+    faq_path.write_text(json.dumps(_faq('Общее', 'Как связаться с поддержкой?', 'Позвоните 901')), encoding='utf-8')
+    for name in ('brand1', 'brand2'):
+        faq = _faq(name, f'Как подключить тариф {name}?', f'Тариф {name} подключается в приложении')
+        (bases_dir / f'{name}.json').write_text(json.dumps(faq), encoding='utf-8')
+    
+    monkeypatch.setattr(faq_engine, 'FAQ_PATH', faq_path)
+    monkeypatch.setattr(faq_engine, 'FAQ_BASES_DIR', bases_dir)
+    monkeypatch.setattr(faq_engine, 'FAQ_RELOAD_CHECK_INTERVAL', 60)
+    monkeypatch.setattr(faq_engine, 'FAQ_MEMORY_BUDGET_MB', 256)
+    for name in ('_bases', '_bases_checked_at', '_bases_used_at', '_missing_bases'):
+        monkeypatch.setattr(faq_engine, name, {})
+    monkeypatch.setattr(faq_engine, '_base_stats', {'loads': 0, 'evictions': 0, 'missing': 0})
+    return bases_dir
+
+def test_bases_are_loaded_lazily(bases):
+    assert faq_engine._bases == {}
+    index = faq_engine.get_faq_index('brand1')
+    assert index.name == 'brand1'
+    assert set(faq_engine._bases) == {'brand1'}
+    assert faq_engine.get_faq_index('brand1') is index
+
+def test_cold_base_is_evicted_over_budget_and_reloaded(bases, monkeypatch):
+    default = faq_engine.get_faq_index()
+    brand1 = faq_engine.get_faq_index('brand1')
+    
+    # Бюджет меньше любой базы: при загрузке brand2 вытесняется brand1, но не default
+    monkeypatch.setattr(faq_engine, 'FAQ_MEMORY_BUDGET_MB', 1 / 1024 / 1024)
+    faq_engine.get_faq_index('brand2')
+    assert set(faq_engine._bases) == {faq_engine.DEFAULT_BASE, 'brand2'}
+    assert faq_engine._bases[faq_engine.DEFAULT_BASE] is default
+    assert faq_engine.get_base_stats()['evictions'] == 1
+    
+    reloaded = faq_engine.get_faq_index('brand1')
+    assert reloaded is not brand1
+    assert reloaded.name == 'brand1'
+    assert 'brand2' not in faq_engine._bases
+
+def test_memory_estimate_includes_rendered_extras(bases):
+    index = faq_engine.get_faq_index('brand1')
+    before = index.memory_bytes()
+    index.extras['categories_text'] = 'x' * 100_000
+    assert index.memory_bytes() >= before + 100_000
+
+def test_missing_base_falls_back_to_default_without_reload(bases, monkeypatch):
+    default = faq_engine.get_faq_index()
+    assert faq_engine.get_faq_index('unknown') is default
+    assert faq_engine.get_base_stats()['missing'] == 1
+    
+    def reload_faq_index(*args, **kwargs):
+        raise AssertionError('повторная проверка отсутствующей базы')
+    
+    monkeypatch.setattr(faq_engine, 'reload_faq_index', reload_faq_index)
+    assert faq_engine.get_faq_index('unknown') is default
+
+def test_language_key_is_case_insensitive_and_base_name_is_kept(monkeypatch):
+    mapping = faq_engine._base_mapping('EN = SberMobile_EN, uk=brand_UA')
+    assert mapping == {'EN': 'SberMobile_EN', 'uk': 'brand_UA'}
+    
+    monkeypatch.setattr(faq_engine, 'FAQ_LANGUAGE_BASES', {key.lower(): base for key, base in mapping.items()})
+    assert faq_engine.resolve_base(language_code='en-US') == 'SberMobile_EN'
+    assert faq_engine.resolve_base(language_code='UK') == 'brand_UA'
+    assert faq_engine.resolve_base(language_code='de') == faq_engine.DEFAULT_BASE
+
+def test_memory_estimate_includes_lazy_structures(bases):
+    index = faq_engine.get_faq_index('brand1')
+    before = index.memory_bytes()
+    index.category_candidates('brand1', 'тариф')
+    assert index.memory_bytes() > before
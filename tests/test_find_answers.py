@@ -0,0 +1,82 @@
+"""Пакетный поиск (find_answers) совпадает с поиском бота (find_answer)"""
+
+import pytest
+
+from app import faq_engine
+
+QUERIES = [
+    'как улучшить качество сигнала',
+    'почему медленный интернет',
+    'как связатся с поддержкой',
+    'адрес офиса',
+    'совсем посторонний вопрос про погоду',
+    'как улучшить качество сигнала'
+]
+
+@pytest.fixture(autouse=True)
+def default_faq(tmp_path, monkeypatch):
+    """Встроенная база DEFAULT_FAQ и чистое состояние загруженных баз"""
+    monkeypatch.setattr(faq_engine, 'FAQ_PATH', tmp_path / 'missing.json')
+    monkeypatch.setattr(faq_engine, 'FAQ_BASES_DIR', tmp_path / 'bases')
+    for name in ('_bases', '_bases_checked_at', '_bases_used_at', '_missing_bases'):
+        monkeypatch.setattr(faq_engine, name, {})
+    faq_engine.clear_answer_cache()
+
+def test_scores_and_threshold_match_find_answer():
+    for threshold in (0.3, 0.6):
+        batch = faq_engine.find_answers(QUERIES, threshold=threshold)
+        for query, result in zip(QUERIES, batch):
+            single = faq_engine.find_answer(query, threshold=threshold)
+            assert result['similarity_score'] == single['similarity_score']
+            assert result['found'] == single['found']
+            assert result.get('question') == single.get('question')
+
+def test_top_k_is_ranked_by_sequence_matcher():
+    result = faq_engine.find_answers(['почему долгий интернет и плохой сигнал'], top_k=3)[0]
+    scores = [item['similarity_score'] for item in result['top']]
+    assert len(scores) == 3
+    assert scores == sorted(scores, reverse=True)
+    assert scores[0] == result['similarity_score']
+
+def test_repeated_queries_return_independent_results():
+    first, _, _, _, _, last = faq_engine.find_answers(QUERIES)
+    assert first == last
+    assert first is not last
+
+def test_category_search_outcome_is_marked_in_result():
+    stop = faq_engine.find_answer('как улучшить качество сигнала', preferred_category='Мобильная связь и интернет')
+    assert stop['category_search'] == 'stop'
+    
+    fallback = faq_engine.find_answer('как связаться с поддержкой', preferred_category='Мобильная связь и интернет')
+    assert fallback['category_search'] == 'fallback'
+    assert fallback['found']
+    
+    assert 'category_search' not in faq_engine.find_answer('как связаться с поддержкой')
+
+def test_cache_size_counts_answer_and_suggestions(monkeypatch):
+    monkeypatch.setattr(faq_engine, 'ANSWER_CACHE_MAX_BYTES', 100000)
+    answer = 'ответ ' * 2000
+    suggestions = [{'category': 'Связь', 'question': 'вопрос ' * 200, 'similarity_score': 0.5}] * 3
+    result = {'found': True, 'category': 'Связь', 'question': 'вопрос', 'answer': answer,
+              'similarity_score': 1.0, 'suggestions': suggestions}
+    
+    faq_engine._cache_put(('default', 'вопрос', 0.5, 3, None), 1, result)
+    
+    assert faq_engine.get_answer_cache_stats()['bytes'] > len(answer.encode('utf-8')) + 3 * 200 * len('вопрос ')
+    
+    for i in range(5):
+        faq_engine._cache_put(('default', f'вопрос {i}', 0.5, 3, None), 1, result)
+    stats = faq_engine.get_answer_cache_stats()
+    assert stats['bytes'] <= 100000
+    assert stats['entries'] < 6
+
+def test_block_shortlists_match_find_answer(monkeypatch):
+    monkeypatch.setattr(faq_engine, 'FAQ_SHORTLIST_SIZE', 4)
+    monkeypatch.setattr(faq_engine, 'FAQ_BATCH_BLOCK_CELLS', 2 * len(faq_engine.get_faq_index()))
+    
+    batch = faq_engine.find_answers(QUERIES, threshold=0.3, top_k=2)
+    for query, result in zip(QUERIES, batch):
+        single = faq_engine.find_answer(query, threshold=0.3, top_k=2)
+        assert result['similarity_score'] == single['similarity_score']
+        assert result.get('question') == single.get('question')
+        assert result['top'] == single['suggestions']
@@ -0,0 +1,54 @@
+"""Профилирование медленных апдейтов: параметры из потока пула и снимок стеков"""
+
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import faq_engine, profiling
+
+@pytest.fixture
+def default_faq(tmp_path, monkeypatch):
+    """Встроенная база DEFAULT_FAQ и чистое состояние загруженных баз"""
+    monkeypatch.setattr(faq_engine, 'FAQ_PATH', tmp_path / 'missing.json')
+    monkeypatch.setattr(faq_engine, 'FAQ_BASES_DIR', tmp_path / 'bases')
+    for name in ('_bases', '_bases_checked_at', '_bases_used_at', '_missing_bases'):
+        monkeypatch.setattr(faq_engine, name, {})
+    faq_engine.clear_answer_cache()
+
+def test_pool_call_annotates_faq_size(default_faq):
+    capture = profiling._Capture('message', sampled=True)
+    token = profiling._current.set(capture)
+    try:
+        call = profiling.bind_capture(lambda: faq_engine.find_answer('как связаться с поддержкой'))
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(call).result()
+    finally:
+        profiling._current.reset(token)
+    
+    assert capture.meta['faq_size'] == len(faq_engine.get_faq_index())
+    assert profiling._active == {}
+
+def test_annotate_without_capture_does_nothing():
+    profiling.annotate(faq_size=10)
+    assert profiling._current.get() is None
+
+def test_saved_profile_takes_meta_from_capture(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', tmp_path)
+    capture = profiling._Capture('message', sampled=True)
+    capture.meta.update(base='brand1', faq_size=42)
+    with profiling._samples_lock:
+        capture.stacks['handle_message (handlers.py:1);find_answer (faq_engine.py:1)'] += 3
+        capture.samples += 3
+    
+    async def save():
+        # Запись идет в стандартном пуле; asyncio.run дожидается его при завершении
+        profiling._save(capture, 0.05)
+    
+    asyncio.run(save())
+    [path] = tmp_path.glob('*.json')
+    record = json.loads(path.read_text(encoding='utf-8'))
+    assert record['faq_size'] == 42
+    assert record['samples'] == 3
+    assert record['stacks'] == {'handle_message (handlers.py:1);find_answer (faq_engine.py:1)': 3}
@@ -0,0 +1,55 @@
+"""Тема диалога: TTL, вытеснение LRU, привязка к базе FAQ и счетчики поиска в категории"""
+
+import pytest
+
+from app import sessions
+
+@pytest.fixture(autouse=True)
+def clean_sessions(monkeypatch):
+    """Пустые сессии и управляемые часы"""
+    clock = [1000.0]
+    monkeypatch.setattr(sessions, '_sessions', {})
+    monkeypatch.setattr(sessions, '_session_stats', dict.fromkeys(sessions._session_stats, 0))
+    monkeypatch.setattr(sessions, '_category_search_stats', {'stops': 0, 'fallbacks': 0})
+    monkeypatch.setattr(sessions.time, 'monotonic', lambda: clock[0])
+    return clock
+
+def test_session_expires_after_ttl(clean_sessions, monkeypatch):
+    monkeypatch.setattr(sessions, 'SESSION_TTL', 60)
+    sessions.remember_session_category(1, 'eSIM', 'default')
+    
+    clean_sessions[0] += 59
+    assert sessions.get_session_category(1, 'default') == 'eSIM'
+    
+    clean_sessions[0] += 1
+    assert sessions.get_session_category(1, 'default') is None
+    assert sessions.get_session_stats()['expirations'] == 1
+
+def test_least_recently_used_session_is_evicted(monkeypatch):
+    monkeypatch.setattr(sessions, 'SESSION_MAX_USERS', 2)
+    sessions.remember_session_category(1, 'eSIM', 'default')
+    sessions.remember_session_category(2, 'Тарифы', 'default')
+    
+    # Обращение к пользователю 1 делает вытесняемым пользователя 2
+    assert sessions.get_session_category(1, 'default') == 'eSIM'
+    sessions.remember_session_category(3, 'Роуминг', 'default')
+    
+    assert sessions.get_session_category(2, 'default') is None
+    assert sessions.get_session_category(1, 'default') == 'eSIM'
+    assert sessions.get_session_stats()['evictions'] == 1
+
+def test_session_is_scoped_to_base():
+    sessions.remember_session_category(1, 'eSIM', 'brand1')
+    assert sessions.get_session_category(1, 'brand2') is None
+    assert sessions.get_session_stats()['base_changes'] == 1
+    
+    sessions.remember_session_category(1, 'eSIM', 'brand1')
+    assert sessions.get_session_category(1, 'brand1') == 'eSIM'
+
+def test_category_search_outcomes_are_counted_from_results():
+    for result in ({'category_search': 'stop'}, {'category_search': 'fallback'}, {'category_search': 'stop'}, {}):
+        sessions.record_category_search(result)
+    
+    stats = sessions.get_category_search_stats()
+    assert (stats['stops'], stats['fallbacks']) == (2, 1)
+    assert stats['stop_rate'] == pytest.approx(2 / 3)
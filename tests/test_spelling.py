@@ -0,0 +1,43 @@
+"""Исправление опечаток (SymSpell)"""
+
+import time
+
+from app.spelling import SpellIndex, _deletes, edit_distance
+
+TEXTS = [
+    'как подключить esim',
+    'как перенести номер',
+    'как отменить подписку сберпрайм',
+    'тарифы и пакеты интернета'
+]
+
+def test_deletes_match_all_position_combinations():
+    assert _deletes('abc', 1) == {'bc', 'ac', 'ab'}
+    assert _deletes('abcd', 2) == {'bcd', 'acd', 'abd', 'abc', 'cd', 'bd', 'bc', 'ad', 'ac', 'ab'}
+
+def test_edit_distance_counts_transposition_as_one():
+    assert edit_distance('подписку', 'подпсику', 2) == 1
+    assert edit_distance('номер', 'номерок', 1) == 2
+
+def test_corrects_typos_and_translit():
+    speller = SpellIndex(TEXTS)
+    assert speller.correct('как подклюить есим') == 'как подключить esim'
+    assert speller.correct('отменить подпсику') == 'отменить подписку'
+
+def test_unknown_short_words_are_kept():
+    speller = SpellIndex(TEXTS)
+    assert speller.correct('как дела') == 'как дела'
+
+def test_long_token_is_skipped_quickly():
+    speller = SpellIndex(TEXTS)
+    token = 'ы' * 4000
+    
+    started = time.perf_counter()
+    assert speller.correct(f'как {token} подключить') == f'как {token} подключить'
+    assert time.perf_counter() - started < 0.1
+
+def test_words_near_vocabulary_length_are_corrected():
+    speller = SpellIndex(TEXTS)
+    assert speller.max_length == len('подключить')
+    assert speller.lookup('подключитьььь') is None
+    assert speller.lookup('подключитьь') == 'подключить'
@@ -0,0 +1,74 @@
+"""Накопитель счетчиков пользователей: жесткий предел и чтение без ожидания сброса"""
+
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pytest
+
+from app import database
+
+@pytest.fixture
+def accumulator(db, monkeypatch):
+    """Пустой накопитель с маленькими пределами; досрочный сброс никто не выполняет"""
+    database.init_database()
+    monkeypatch.setattr(database, 'USER_ACCUMULATOR_MAX', 2)
+    monkeypatch.setattr(database, 'USER_ACCUMULATOR_HARD_MAX', 3)
+    monkeypatch.setattr(database, '_user_deltas', OrderedDict())
+    monkeypatch.setattr(database, '_user_deltas_flushing', {})
+    monkeypatch.setattr(database, '_write_queue', queue.Queue())
+    monkeypatch.setattr(database, '_user_flush_requested', threading.Event())
+    monkeypatch.setitem(database._write_stats, 'user_deltas_dropped', 0)
+    return database
+
+def test_hard_cap_drops_oldest_users(accumulator):
+    for user_id in range(1, 6):
+        accumulator._accumulate_user(user_id, f'2024-01-0{user_id} 10:00:00')
+    accumulator._accumulate_user(5, '2024-01-06 10:00:00')
+    
+    assert list(accumulator._user_deltas) == [3, 4, 5]
+    assert accumulator._user_deltas[5] == [2, '2024-01-05 10:00:00', '2024-01-06 10:00:00']
+    assert accumulator.get_write_queue_stats()['user_deltas_dropped'] == 2
+
+def test_failed_flush_merges_back_within_cap(accumulator, monkeypatch):
+    for user_id in (1, 2, 3):
+        accumulator._accumulate_user(user_id, '2024-01-01 10:00:00')
+    
+    @contextmanager
+    def broken_connection():
+        # Пока идет (неудачный) сброс, приходят новые пользователи
+        accumulator._accumulate_user(3, '2024-01-02 10:00:00')
+        accumulator._accumulate_user(4, '2024-01-02 10:00:00')
+        raise OSError('disk I/O error')
+        yield
+    
+    monkeypatch.setattr(accumulator, 'writer_connection', broken_connection)
+    accumulator._flush_users()
+    
+    # Вернувшиеся дельты старше новых: при переполнении отбрасываются первыми
+    assert list(accumulator._user_deltas) == [2, 3, 4]
+    assert accumulator._user_deltas[3] == [2, '2024-01-01 10:00:00', '2024-01-02 10:00:00']
+    assert accumulator._user_deltas_flushing == {}
+
+def test_flushed_counters_are_counted_once(accumulator):
+    accumulator._accumulate_user(7, '2024-01-01 10:00:00')
+    accumulator._accumulate_user(7, '2024-01-01 11:00:00')
+    accumulator._flush_users()
+    accumulator._accumulate_user(7, '2024-01-01 12:00:00')
+    
+    stats = accumulator.get_user_stats(7)
+    assert stats['total_queries'] == 3
+    assert stats['first_interaction'] == '2024-01-01 10:00:00'
+    assert stats['last_interaction'] == '2024-01-01 12:00:00'
+
+def test_user_stats_do_not_wait_for_flush_transaction(accumulator):
+    accumulator._accumulate_user(7, '2024-01-01 10:00:00')
+    
+    # Сброс идет (держит _user_flush_lock), чтение не должно его ждать
+    with accumulator._user_flush_lock:
+        started = time.perf_counter()
+        stats = accumulator.get_user_stats(7)
+        assert time.perf_counter() - started < 1
+    assert stats['total_queries'] == 1
@@ -0,0 +1,43 @@
+"""Очередь логирования: переполнение не пишет в БД на вызывающем потоке"""
+
+import queue
+from collections import deque
+
+import pytest
+
+from app import database
+
+@pytest.fixture
+def full_queue(db, monkeypatch):
+    """Очередь на одну запись, запас на две; писатель не запускается, пачки перехватываются"""
+    database.init_database()
+    written = []
+    monkeypatch.setattr(database, '_ensure_writer', lambda: None)
+    monkeypatch.setattr(database, '_write_batch', lambda records: written.append(list(records)))
+    monkeypatch.setattr(database, '_write_queue', queue.Queue(maxsize=1))
+    monkeypatch.setattr(database, '_overflow', deque())
+    monkeypatch.setattr(database, 'INTERACTION_OVERFLOW_MAX', 2)
+    for name in ('enqueued', 'overflow_writes', 'dropped', 'max_depth'):
+        monkeypatch.setitem(database._write_stats, name, 0)
+    return written
+
+def test_overflow_goes_to_writer_not_caller(full_queue):
+    for i in range(4):
+        database.log_interaction(1, f'вопрос {i}', True)
+    
+    assert full_queue == []
+    stats = database.get_write_queue_stats()
+    assert stats['enqueued'] == 1
+    assert stats['max_depth'] == 1
+    assert stats['overflow_writes'] == 2
+    assert stats['dropped'] == 1
+    assert stats['overflow_depth'] == 2
+
+def test_writer_drains_overflow(full_queue):
+    for i in range(3):
+        database.log_interaction(1, f'вопрос {i}', True)
+    
+    database._write_overflow()
+    
+    assert [[record[1] for record in batch] for batch in full_queue] == [['вопрос 1', 'вопрос 2']]
+    assert database.get_write_queue_stats()['overflow_depth'] == 0
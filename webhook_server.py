@@ -0,0 +1,333 @@
+"""
+app/webhook_server.py
+Webhook-режим: aiohttp-сервер апдейтов, один или несколько процессов на одном порту
+
+С --workers N супервизор запускает N процессов, которые слушают общий порт
+через SO_REUSEPORT (соединения распределяет ядро). Каждый процесс держит свою
+копию скомпилированного FAQ и свой писатель БД; процессы пишут в общую SQLite
+(WAL) пачками в транзакциях BEGIN IMMEDIATE. Общий лимит исходящих
+сообщений бота делится между процессами поровну.
+
+Сигналы супервизору:
+    SIGTERM/SIGINT — штатно остановить все процессы (с дожиданием апдейтов)
+    SIGHUP         — перезапустить процессы по одному (подхватить новый FAQ)
+"""
+
+import os
+import hmac
+import time
+import signal
+import asyncio
+import logging
+import secrets
+import multiprocessing
+
+from aiohttp import web
+from telegram import Bot, Update
+
+from app import metrics
+from app.bot import TELEGRAM_API_BASE_URL, build_application
+from app.database import init_database, close_database
+from app.faq_engine import reload_faq_index
+from app.responses import prerender
+
+logger = logging.getLogger(__name__)
+
+# Число процессов веб-хука по умолчанию (флаг --workers)
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 1))
+
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token (если не задан — случайный на запуск)
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+
+# Сколько ждать готовности нового процесса и его штатной остановки (сек)
+WORKER_START_TIMEOUT = float(os.getenv('WORKER_START_TIMEOUT', 60))
+WORKER_DRAIN_TIMEOUT = float(os.getenv('WORKER_DRAIN_TIMEOUT', 30))
+
+# Пауза перед перезапуском упавшего процесса (сек)
+WORKER_RESTART_DELAY = float(os.getenv('WORKER_RESTART_DELAY', 1.0))
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+class WebhookWorker:
+    """
+    Один процесс веб-хука: принимает апдейты и передает их в Application
+    
+    Готовность (/readyz) снимается в начале остановки: сокет закрывается,
+    принятые запросы дорабатываются, затем Application обрабатывает все
+    апдейты из очереди и только после этого останавливается.
+    """
+    
+    def __init__(self, token: str, port: int, url_path: str, secret: str = None,
+                 worker_id: int = 0, supervised: bool = False, webhook_url: str = None, processes: int = 1):
+        self.token = token
+        self.port = port
+        self.url_path = url_path
+        self.secret = secret
+        self.worker_id = worker_id
+        self.supervised = supervised
+        self.webhook_url = webhook_url
+        self.processes = processes
+        
+        self.application = None
+        self.ready = False
+        self.draining = False
+        self.started_at = time.time()
+        self.stats = {
+            'updates': 0,
+            'rejected': 0,
+            'bad_requests': 0
+        }
+        
+        self._stop_event = None
+        self._runner = None
+    
+    def status(self) -> dict:
+        """Состояние процесса для /healthz"""
+        return {
+            'worker': self.worker_id,
+            'pid': os.getpid(),
+            'ready': self.ready,
+            'draining': self.draining,
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'update_queue': self.application.update_queue.qsize() if self.application else 0,
+            **self.stats
+        }
+    
+    def metrics(self) -> dict:
+        """Числовые показатели процесса для /metrics"""
+        status = self.status()
+        return {
+            'ready': int(status['ready']),
+            'draining': int(status['draining']),
+            'uptime_seconds': status['uptime_seconds'],
+            'update_queue': status['update_queue'],
+            **self.stats
+        }
+    
+    async def _healthz(self, request):
+        return web.json_response(self.status())
+    
+    async def _readyz(self, request):
+        return web.json_response(self.status(), status=200 if self.ready else 503)
+    
+    async def _handle_update(self, request):
+        """POST от Telegram: проверить секрет и поставить апдейт в очередь Application"""
+        if self.secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret):
+            self.stats['rejected'] += 1
+            return web.Response(status=403)
+        
+        # При остановке апдейт не принимается: Telegram повторит его, и он уйдет другому процессу
+        if self.draining:
+            return web.Response(status=503)
+        
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except Exception as e:
+            self.stats['bad_requests'] += 1
+            logger.warning(f"⚠️  Некорректный апдейт: {e}")
+            return web.Response(status=400)
+        
+        await self.application.update_queue.put(update)
+        self.stats['updates'] += 1
+        return web.Response()
+    
+    async def run(self, ready_event=None):
+        """Поднять Application и HTTP-сервер, работать до сигнала, затем штатно остановиться"""
+        loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self._stop_event.set)
+        
+        health_routes = {'/healthz': self._healthz, '/readyz': self._readyz}
+        metrics.register_collector('bot_webhook_worker', self.metrics)
+        
+        self.application = build_application(self.token, mode='webhook', processes=self.processes)
+        self.application.bot_data['worker_id'] = self.worker_id
+        self.application.bot_data['health_routes'] = health_routes
+        
+        await self.application.initialize()
+        if self.application.post_init:
+            await self.application.post_init(self.application)
+        await self.application.start()
+        
+        web_app = web.Application()
+        web_app.router.add_post(self.url_path, self._handle_update)
+        for path, handler in health_routes.items():
+            web_app.router.add_get(path, handler)
+        
+        self._runner = web.AppRunner(web_app, access_log=None)
+        await self._runner.setup()
+        # SO_REUSEPORT: несколько процессов слушают один порт
+        await web.TCPSite(self._runner, '0.0.0.0', self.port, reuse_port=True).start()
+        
+        self.ready = True
+        if ready_event is not None:
+            ready_event.set()
+        logger.info(f"✅ Веб-хук: процесс {self.worker_id} (pid {os.getpid()}) слушает :{self.port}")
+        
+        # Без супервизора веб-хук регистрируется сам, когда сервер уже слушает
+        if self.webhook_url:
+            await set_webhook(self.token, self.webhook_url, self.secret)
+        
+        parent_pid = os.getppid()
+        while not self._stop_event.is_set():
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), 1.0)
+            except asyncio.TimeoutError:
+                # Супервизор исчез — не оставаться сиротой
+                if self.supervised and os.getppid() != parent_pid:
+                    logger.warning("⚠️  Супервизор завершился, остановка процесса")
+                    break
+        
+        await self.drain()
+    
+    async def drain(self):
+        """Штатная остановка: перестать принимать апдейты и дообработать принятые"""
+        started = time.perf_counter()
+        self.ready = False
+        self.draining = True
+        logger.info(f"🛑 Процесс {self.worker_id}: остановка, в очереди {self.application.update_queue.qsize()} апдейтов")
+        
+        # Закрыть сокет и дождаться уже принятых HTTP-запросов
+        await self._runner.cleanup()
+        
+        # stop() дообрабатывает очередь апдейтов и ждет запущенные обработчики
+        await self.application.stop()
+        if self.application.post_shutdown:
+            await self.application.post_shutdown(self.application)
+        await self.application.shutdown()
+        
+        logger.info(f"👋 Процесс {self.worker_id} остановлен за {time.perf_counter() - started:.1f} с")
+
+async def set_webhook(token: str, webhook_url: str, secret: str = None):
+    """Зарегистрировать веб-хук в Telegram (один раз на все процессы)"""
+    bot = Bot(token, base_url=TELEGRAM_API_BASE_URL) if TELEGRAM_API_BASE_URL else Bot(token)
+    async with bot:
+        await bot.set_webhook(url=webhook_url, secret_token=secret)
+    logger.info(f"🔗 Веб-хук установлен: {webhook_url}")
+
+def _worker_main(worker_id: int, token: str, port: int, url_path: str, secret: str, processes: int, ready_event):
+    """Точка входа процесса веб-хука (spawn)"""
+    logging.basicConfig(
+        format=f'%(asctime)s - worker-{worker_id} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO,
+        force=True
+    )
+    
+    # Своя копия скомпилированного FAQ и списка категорий в каждом процессе
+    reload_faq_index(force=True)
+    prerender()
+    
+    worker = WebhookWorker(token, port, url_path, secret, worker_id=worker_id, supervised=True, processes=processes)
+    asyncio.run(worker.run(ready_event))
+
+def _spawn_worker(ctx, worker_id: int, token: str, port: int, url_path: str, secret: str, processes: int):
+    ready_event = ctx.Event()
+    process = ctx.Process(
+        target=_worker_main,
+        args=(worker_id, token, port, url_path, secret, processes, ready_event),
+        name=f'webhook-worker-{worker_id}'
+    )
+    process.start()
+    return process, ready_event
+
+def _stop_worker(process, timeout: float = None):
+    """SIGTERM и ожидание штатной остановки; при зависании — SIGKILL"""
+    if process.is_alive():
+        process.terminate()
+    process.join(WORKER_DRAIN_TIMEOUT if timeout is None else timeout)
+    if process.is_alive():
+        logger.warning(f"⚠️  {process.name} не остановился за {WORKER_DRAIN_TIMEOUT:.0f} с, SIGKILL")
+        process.kill()
+        process.join()
+
+def run_webhook_workers(token: str, port: int, url_path: str, secret: str, workers: int, webhook_url: str):
+    """
+    Супервизор: держать workers процессов веб-хука на одном порту
+    
+    Веб-хук регистрируется, когда процессы готовы. Упавший процесс
+    перезапускается. По SIGHUP процессы перезапускаются по одному: старый
+    дообрабатывает апдейты, пока остальные принимают новые, затем
+    поднимается замена с тем же номером.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    state = {'stop': False, 'restart': False}
+    
+    def on_stop(signum, frame):
+        state['stop'] = True
+    
+    def on_restart(signum, frame):
+        state['restart'] = True
+    
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    signal.signal(signal.SIGHUP, on_restart)
+    
+    slots = {}
+    try:
+        for worker_id in range(workers):
+            slots[worker_id] = _spawn_worker(ctx, worker_id, token, port, url_path, secret, workers)
+        
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        for worker_id, (_, ready_event) in slots.items():
+            if not ready_event.wait(max(0.0, deadline - time.monotonic())):
+                logger.error(f"❌ Процесс {worker_id} не стал готов за {WORKER_START_TIMEOUT:.0f} с")
+        logger.info(f"👷 Запущено процессов веб-хука: {workers} (порт {port})")
+        asyncio.run(set_webhook(token, webhook_url, secret))
+        
+        while not state['stop']:
+            time.sleep(0.5)
+            
+            if state['restart']:
+                state['restart'] = False
+                logger.info("🔄 Перезапуск процессов веб-хука по одному...")
+                for worker_id in list(slots):
+                    if state['stop']:
+                        break
+                    _stop_worker(slots[worker_id][0])
+                    slots[worker_id] = _spawn_worker(ctx, worker_id, token, port, url_path, secret, workers)
+                    if not slots[worker_id][1].wait(WORKER_START_TIMEOUT):
+                        logger.error(f"❌ Процесс {worker_id} не стал готов за {WORKER_START_TIMEOUT:.0f} с")
+                logger.info("✅ Перезапуск процессов веб-хука завершен")
+            
+            for worker_id, (process, _) in list(slots.items()):
+                if not process.is_alive() and not state['stop']:
+                    logger.warning(f"⚠️  Процесс {worker_id} завершился (код {process.exitcode}), перезапуск")
+                    time.sleep(WORKER_RESTART_DELAY)
+                    slots[worker_id] = _spawn_worker(ctx, worker_id, token, port, url_path, secret, workers)
+    finally:
+        # Все процессы дообрабатывают апдейты параллельно, в том числе при ошибке супервизора
+        logger.info("🛑 Остановка процессов веб-хука...")
+        for process, _ in slots.values():
+            if process.is_alive():
+                process.terminate()
+        for process, _ in slots.values():
+            _stop_worker(process)
+        logger.info("👋 Все процессы веб-хука остановлены")
+
+def serve_webhook(token: str, port: int, webhook_url: str, workers: int = None):
+    """
+    Запустить webhook-режим: один процесс или супервизор с workers процессами
+    
+    Args:
+        token: Токен бота
+        port: Порт для веб-сервера (общий для всех процессов)
+        webhook_url: URL веб-хука, который регистрируется в Telegram
+        workers: Число процессов (по умолчанию WEBHOOK_WORKERS)
+    """
+    workers = max(1, workers or WEBHOOK_WORKERS)
+    url_path = f"/webhook/{token}"
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    
+    # Схема БД и перенос старых данных — один раз, до запуска процессов
+    init_database()
+    
+    if workers == 1:
+        reload_faq_index(force=True)
+        prerender()
+        asyncio.run(WebhookWorker(token, port, url_path, secret, webhook_url=webhook_url).run())
+        return
+    
+    # Процессы открывают свои соединения с БД
+    close_database()
+    run_webhook_workers(token, port, url_path, secret, workers, webhook_url)